@@ -0,0 +1,361 @@
+"""
+Approximate nearest-neighbour backends for VectorIndex.
+
+- IVFIndex: pure-NumPy inverted file index. A spherical k-means coarse
+  quantizer splits the corpus into lists; a query scans only the `nprobe`
+  closest lists.
+- HNSWIndex: HNSW graph backed by the optional `hnswlib` package.
+
+Both operate on the L2-normalized matrix held by VectorIndex and are saved
+next to the vector store, so the builder can produce them once and the API
+only has to load them. A saved index records the checksum of the store it was
+built from and is ignored when it does not match the store it sits next to.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from vector_store import read_header
+
+IVF_FILE = "ivf.npz"
+HNSW_FILE = "hnsw.bin"
+HNSW_META_FILE = "hnsw.json"
+
+DEFAULT_NPROBE = 8
+DEFAULT_EF = 64
+
+
+class IVFIndex:
+    name = "ivf"
+
+    def __init__(self, matrix, centroids, list_offsets, list_ids, nprobe=DEFAULT_NPROBE):
+        self.matrix = matrix
+        self.centroids = centroids
+        # Inverted lists in CSR layout: ids of list i are list_ids[list_offsets[i]:list_offsets[i + 1]]
+        self.list_offsets = list_offsets
+        self.list_ids = list_ids
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, matrix, n_lists=None, n_iter=20, sample_size=None, seed=42, nprobe=DEFAULT_NPROBE):
+        n = matrix.shape[0]
+        if n_lists is None:
+            n_lists = max(1, int(4 * np.sqrt(n)))
+        n_lists = max(1, min(n_lists, n))
+
+        rng = np.random.default_rng(seed)
+        sample_size = sample_size or min(n, 256 * n_lists)
+        sample = np.asarray(matrix[rng.choice(n, size=sample_size, replace=False)])
+        centroids = _spherical_kmeans(sample, n_lists, n_iter, rng)
+
+        assignments = _assign(matrix, centroids)
+        order = np.argsort(assignments, kind="stable")
+        counts = np.bincount(assignments, minlength=n_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        return cls(matrix, centroids, list_offsets, order.astype(np.int64), nprobe=nprobe)
+
+    def extend(self, matrix):
+        """
+        Index the rows of `matrix` past the ones already indexed, assigning them to the
+        existing centroids. The centroids drift from the data as it grows; a full
+        rebuild re-clusters.
+        """
+        start = len(self.list_ids)
+        lists = np.repeat(np.arange(len(self.centroids)), np.diff(self.list_offsets))
+        lists = np.concatenate([lists, _assign(matrix[start:], self.centroids)])
+        ids = np.concatenate([self.list_ids, np.arange(start, matrix.shape[0], dtype=np.int64)])
+        order = np.argsort(lists, kind="stable")
+        counts = np.bincount(lists, minlength=len(self.centroids))
+        self.list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        self.list_ids = ids[order]
+        self.matrix = matrix
+        return self
+
+    def search(self, query, k):
+        """
+        Return (ids, scores) for the top-k candidates from the nprobe closest lists.
+        """
+        nprobe = min(self.nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        candidates = np.concatenate([
+            self.list_ids[self.list_offsets[i]:self.list_offsets[i + 1]] for i in probe
+        ])
+        if candidates.size == 0:
+            return candidates, np.empty(0, dtype=np.float32)
+
+        scores = self.matrix[candidates] @ query
+        k = min(k, candidates.size)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return candidates[top], scores[top]
+
+    def save(self, directory):
+        np.savez(
+            os.path.join(directory, IVF_FILE),
+            centroids=self.centroids,
+            list_offsets=self.list_offsets,
+            list_ids=self.list_ids,
+            nprobe=np.int64(self.nprobe),
+            store_checksum=np.str_(_store_checksum(directory)),
+        )
+
+    @classmethod
+    def load(cls, directory, matrix, nprobe=None):
+        """
+        Returns (index, checksum of the store it was built for).
+        """
+        with np.load(os.path.join(directory, IVF_FILE)) as data:
+            ann = cls(
+                matrix,
+                data["centroids"],
+                data["list_offsets"],
+                data["list_ids"],
+                nprobe=nprobe or int(data["nprobe"]),
+            )
+            return ann, str(data["store_checksum"]) if "store_checksum" in data else None
+
+
+class HNSWIndex:
+    name = "hnsw"
+
+    def __init__(self, graph, ef=DEFAULT_EF):
+        self.graph = graph
+        self.ef = ef
+        self.graph.set_ef(ef)
+
+    @classmethod
+    def build(cls, matrix, m=16, ef_construction=200, seed=42, ef=DEFAULT_EF):
+        hnswlib = _import_hnswlib()
+        graph = hnswlib.Index(space="ip", dim=matrix.shape[1])
+        graph.init_index(max_elements=max(1, matrix.shape[0]), M=m, ef_construction=ef_construction, random_seed=seed)
+        if matrix.shape[0]:
+            graph.add_items(np.asarray(matrix), np.arange(matrix.shape[0]))
+        return cls(graph, ef=ef)
+
+    def extend(self, matrix):
+        """
+        Insert the rows of `matrix` past the ones already in the graph.
+        """
+        start = self.graph.get_current_count()
+        if matrix.shape[0] > start:
+            self.graph.resize_index(matrix.shape[0])
+            self.graph.add_items(np.asarray(matrix[start:]), np.arange(start, matrix.shape[0]))
+        return self
+
+    def set_ef(self, ef):
+        self.ef = ef
+        self.graph.set_ef(ef)
+
+    def search(self, query, k):
+        k = min(k, self.graph.get_current_count())
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        labels, distances = self.graph.knn_query(query, k=k)
+        # hnswlib's "ip" space reports 1 - dot product
+        return labels[0].astype(np.int64), 1.0 - distances[0]
+
+    def save(self, directory):
+        self.graph.save_index(os.path.join(directory, HNSW_FILE))
+        with open(os.path.join(directory, HNSW_META_FILE), "w") as f:
+            json.dump({
+                "dim": self.graph.dim,
+                "count": self.graph.get_current_count(),
+                "ef": self.ef,
+                "store_checksum": _store_checksum(directory),
+            }, f)
+
+    @classmethod
+    def load(cls, directory, matrix, ef=None):
+        """
+        Returns (index, checksum of the store it was built for).
+        """
+        hnswlib = _import_hnswlib()
+        with open(os.path.join(directory, HNSW_META_FILE)) as f:
+            meta = json.load(f)
+        graph = hnswlib.Index(space="ip", dim=meta["dim"])
+        graph.load_index(os.path.join(directory, HNSW_FILE), max_elements=max(1, meta["count"]))
+        return cls(graph, ef=ef or meta["ef"]), meta.get("store_checksum")
+
+
+BACKENDS = {"ivf": IVFIndex, "hnsw": HNSWIndex}
+
+
+def build_ann_index(matrix, backend="ivf", **params):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown ANN backend: {backend}")
+    return BACKENDS[backend].build(matrix, **params)
+
+
+def load_ann_index(directory, matrix, backend="ivf", nprobe=None, ef=None):
+    """
+    Load a saved ANN index for the store in `directory`, or return None if none was built
+    or it was built for a different version of the store.
+    """
+    if backend == "ivf":
+        if not os.path.exists(os.path.join(directory, IVF_FILE)):
+            return None
+        ann, built_for = IVFIndex.load(directory, matrix, nprobe=nprobe)
+    elif backend == "hnsw":
+        if not os.path.exists(os.path.join(directory, HNSW_FILE)):
+            return None
+        ann, built_for = HNSWIndex.load(directory, matrix, ef=ef)
+    else:
+        raise ValueError(f"Unknown ANN backend: {backend}")
+
+    checksum = _store_checksum(directory)
+    if built_for != checksum:
+        print(f"⚠️ Ignoring stale {backend} index in {directory} (built for {built_for}, store is {checksum})")
+        return None
+    return ann
+
+
+def evaluate_recall(index, ann, queries, k=5, settings=()):
+    """
+    Compare an ANN backend against exact search.
+
+    For each setting (nprobe for IVF, ef for HNSW) returns recall@k against the
+    exact top-k plus p50/p99 per-query latency in milliseconds.
+    """
+    exact = [set(_exact_ids(index, q, k)) for q in queries]
+    exact_latencies = _time_queries(lambda q: _exact_ids(index, q, k), queries)
+
+    report = {"k": k, "queries": len(queries), "exact": _latency_summary(exact_latencies), "settings": []}
+    for setting in settings:
+        _apply_setting(ann, setting)
+        found = []
+        latencies = _time_queries(lambda q: found.append(set(ann.search(q, k)[0].tolist())), queries)
+        hits = sum(len(f & e) for f, e in zip(found, exact))
+        total = sum(len(e) for e in exact)
+        report["settings"].append({
+            "setting": setting,
+            "recall": hits / total if total else 1.0,
+            **_latency_summary(latencies),
+        })
+    return report
+
+
+def perturbed_queries(matrix, count, noise=0.02, seed=0):
+    """
+    Queries near, but not identical to, corpus rows. A stored row used as its own
+    query is always found by its list or graph neighbourhood and inflates recall.
+    """
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(matrix.shape[0], size=min(count, matrix.shape[0]), replace=False)
+    queries = np.asarray(matrix[sample]) + rng.normal(0, noise, (len(sample), matrix.shape[1]))
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+
+
+def pick_setting(report, min_recall):
+    """
+    The fastest (lowest p99) setting whose recall meets min_recall, or None.
+    """
+    passing = [s for s in report["settings"] if s["recall"] >= min_recall]
+    return min(passing, key=lambda s: s["p99_ms"]) if passing else None
+
+
+def _store_checksum(directory):
+    return read_header(directory).get("checksum")
+
+
+def _exact_ids(index, query, k):
+    scores = index.matrix @ query
+    k = min(k, scores.size)
+    return np.argpartition(-scores, k - 1)[:k].tolist()
+
+
+def _apply_setting(ann, setting):
+    if isinstance(ann, IVFIndex):
+        ann.nprobe = setting
+    else:
+        ann.set_ef(setting)
+
+
+def _time_queries(fn, queries):
+    latencies = []
+    for q in queries:
+        start = time.perf_counter()
+        fn(q)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def _latency_summary(latencies):
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 4),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 4),
+    }
+
+
+def _spherical_kmeans(sample, n_lists, n_iter, rng):
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        empty = np.bincount(assignments, minlength=n_lists) == 0
+        # Re-seed empty lists from random points so every list stays usable
+        sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+def _assign(matrix, centroids, chunk_size=8192):
+    assignments = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk_size):
+        block = np.asarray(matrix[start:start + chunk_size])
+        assignments[start:start + chunk_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def _import_hnswlib():
+    try:
+        import hnswlib
+    except ImportError as e:
+        raise ImportError("The HNSW backend requires hnswlib: pip install hnswlib") from e
+    return hnswlib
+
+
+if __name__ == "__main__":
+    from semantic_search import VectorIndex
+
+    parser = argparse.ArgumentParser(description="Build or evaluate an ANN index for a vector store")
+    parser.add_argument("store", help="Vector store directory")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="ivf")
+    parser.add_argument("--build", action="store_true", help="(Re)build and save the index before evaluating")
+    parser.add_argument("--settings", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32],
+                        help="nprobe values for IVF, ef values for HNSW")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=500, help="Number of perturbed corpus rows to query with")
+    parser.add_argument("--queries-file", help="Held-out query embeddings (.npy, one row per query) to use instead")
+    parser.add_argument("--noise", type=float, default=0.02, help="Std-dev of the noise added to corpus rows")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    args = parser.parse_args()
+
+    index = VectorIndex.from_store(args.store)
+    if args.build:
+        ann = build_ann_index(index.matrix, backend=args.backend)
+        ann.save(args.store)
+        print(f"💾 Saved {args.backend} index to {args.store}")
+    else:
+        ann = load_ann_index(args.store, index.matrix, backend=args.backend)
+        if ann is None:
+            raise SystemExit(f"❌ No {args.backend} index in {args.store}; rerun with --build")
+
+    if args.queries_file:
+        queries = np.load(args.queries_file).astype(np.float32)
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    else:
+        queries = perturbed_queries(index.matrix, args.queries, noise=args.noise)
+    report = evaluate_recall(index, ann, queries, k=args.k, settings=args.settings)
+    best = pick_setting(report, args.min_recall)
+    report["recommended"] = best
+    print(json.dumps(report, indent=2))
+    if best is None:
+        print(f"⚠️ No setting reached recall@{args.k} >= {args.min_recall}")
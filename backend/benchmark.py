@@ -0,0 +1,369 @@
+"""
+Benchmark and load-test suite for the /analyze pipeline.
+
+  search  - find_similar_statements latency across corpus sizes and dimensions
+  builder - vector_store_builder.py throughput against the fake embedding server
+  load    - end-to-end /analyze latency and throughput under concurrency, with the
+            Gemini and S3 endpoints replaced by fake_services.py
+  all     - all of the above
+
+Every result records p50/p95/p99 latency (ms) and requests (or items) per
+second. Results are written as JSON; with --baseline they are compared
+against a stored run and regressions beyond --tolerance exit non-zero:
+    python benchmark.py all --output benchmark_results.json --baseline benchmark_baseline.json
+    python benchmark.py all --output benchmark_baseline.json   # record a new baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+import numpy as np
+
+from fake_services import FAKE_CATEGORIES, FakeServer, create_fake_app, fake_embedding
+from semantic_search import VectorIndex, find_similar_statements, set_index
+from vector_store import write_store
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TIPS_FILE = os.path.join(BACKEND_DIR, "..", "mental_health_tips.json")
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUT_KEYS = ("rps", "items_per_s")
+
+
+def summarize(latencies, elapsed, errors=0):
+    """
+    Latency percentiles (ms) and throughput for a list of per-request durations in seconds.
+    """
+    ms = np.asarray(latencies, dtype=np.float64) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99]) if len(ms) else (0.0, 0.0, 0.0)
+    return {
+        "count": len(ms),
+        "errors": errors,
+        "mean_ms": round(float(ms.mean()) if len(ms) else 0.0, 3),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "rps": round(len(ms) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def bench_search(sizes, dimensions, queries=200, k=5):
+    """
+    Time find_similar_statements one query at a time, as /analyze calls it.
+    """
+    rng = np.random.default_rng(0)
+    results = {}
+    for dimension in dimensions:
+        for size in sizes:
+            matrix = rng.standard_normal((size, dimension), dtype=np.float32)
+            set_index(VectorIndex(
+                matrix,
+                [f"statement {i}" for i in range(size)],
+                [FAKE_CATEGORIES[i % len(FAKE_CATEGORIES)] for i in range(size)],
+            ))
+            query_vectors = rng.standard_normal((queries, dimension), dtype=np.float32).tolist()
+            find_similar_statements(query_vectors[0], k)
+
+            latencies = []
+            start = time.perf_counter()
+            for query in query_vectors:
+                t = time.perf_counter()
+                find_similar_statements(query, k)
+                latencies.append(time.perf_counter() - t)
+            name = f"search/n={size}/d={dimension}"
+            results[name] = summarize(latencies, time.perf_counter() - start)
+            print(f"🔎 {name}: p50 {results[name]['p50_ms']} ms, {results[name]['rps']} queries/s")
+    set_index(None)
+    return results
+
+
+def bench_builder(count=5000, dimension=768, embed_latency_ms=40.0, concurrency=4):
+    """
+    Run vector_store_builder.py end to end against the fake embedding server.
+    """
+    workdir = tempfile.mkdtemp(prefix="bench-builder-")
+    try:
+        knowledge = {
+            category: [f"{category} statement {i}" for i in range(c, count, len(FAKE_CATEGORIES))]
+            for c, category in enumerate(FAKE_CATEGORIES)
+        }
+        knowledge_file = os.path.join(workdir, "knowledge.json")
+        with open(knowledge_file, "w") as f:
+            json.dump(knowledge, f)
+
+        app = create_fake_app(embed_latency_ms=embed_latency_ms, dimension=dimension)
+        with FakeServer(app) as url:
+            env = {
+                **os.environ,
+                "GEMINI_API_KEY": "fake",
+                "KNOWLEDGE_FILE": knowledge_file,
+                "EMBEDDING_BASE_URL": f"{url}/v1beta",
+                "EMBED_CONCURRENCY": str(concurrency),
+                "EMBED_REQUESTS_PER_SECOND": "1000",
+                "ANN_BACKEND": "none",
+            }
+            start = time.perf_counter()
+            result = subprocess.run(
+                [sys.executable, os.path.join(BACKEND_DIR, "vector_store_builder.py")],
+                cwd=workdir, env=env, capture_output=True, text=True,
+            )
+            elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            raise RuntimeError(f"Builder failed:\n{result.stderr[-2000:]}")
+
+        # The builder prints its own embedding-stage rate; the wall time also covers startup and compaction
+        match = re.search(r"\(([\d.]+) items/s", result.stdout)
+        report = {
+            "items": count,
+            "seconds": round(elapsed, 3),
+            "items_per_s": round(count / elapsed, 1),
+            "embed_items_per_s": float(match.group(1)) if match else None,
+            "batch_requests": app.state.calls["batch_embed"],
+        }
+        print(f"🏗️ builder: {count} items in {report['seconds']} s ({report['items_per_s']} items/s)")
+        return {"builder": report}
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+class FakeGeminiModel:
+    """
+    generate_content_async over the fake REST endpoints, standing in for genai.GenerativeModel
+    (the SDK's async client only speaks gRPC, so it cannot be pointed at a local HTTP server).
+    """
+
+    class Response:
+        def __init__(self, body):
+            self.text = "".join(part.get("text", "") for part in body["candidates"][0]["content"]["parts"])
+
+    def __init__(self, base_url, model_name="models/gemini-1.5-flash"):
+        self.url = f"{base_url}/v1beta/{model_name}"
+        self.client = None
+
+    async def generate_content_async(self, prompt, stream=False, request_options=None):
+        # Created on first use so the client belongs to the server's event loop
+        if self.client is None:
+            self.client = httpx.AsyncClient(timeout=(request_options or {}).get("timeout", 30))
+        payload = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if not stream:
+            response = await self.client.post(f"{self.url}:generateContent", json=payload)
+            response.raise_for_status()
+            return self.Response(response.json())
+
+        async def chunks():
+            async with self.client.stream("POST", f"{self.url}:streamGenerateContent?alt=sse", json=payload) as r:
+                async for line in r.aiter_lines():
+                    if line.startswith("data: "):
+                        yield self.Response(json.loads(line[6:]))
+
+        return chunks()
+
+
+def build_load_store(path, size, dimension, names):
+    """
+    Synthetic store embedded with the fake embedder, so queries that repeat a statement
+    take the kNN fast path and novel ones go to the (fake) LLM.
+    """
+    categories = [names[i % len(names)] for i in range(size)]
+    statements = [f"synthetic statement {i} about {category}" for i, category in enumerate(categories)]
+    matrix = np.asarray([fake_embedding(s, dimension) for s in statements], dtype=np.float32)
+    write_store(path, matrix, statements, categories, model="models/embedding-001")
+    return statements
+
+
+async def generate_load(url, bodies, concurrency, path="/analyze", timeout=60.0):
+    """
+    Closed-loop load: `concurrency` workers post `bodies` back to back. Returns (latencies, errors, elapsed).
+    """
+    queue = asyncio.Queue()
+    for body in bodies:
+        queue.put_nowait(body)
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        # One client (and connection) per worker: a shared httpx pool stalls when many responses
+        # complete at once, as they do behind a micro-batching server, and inflates client-side latency
+        async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=httpx.Limits(max_connections=1)) as client:
+            while not queue.empty():
+                body = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=body)
+                    if response.status_code != 200:
+                        errors += 1
+                        continue
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+def bench_load(
+    requests=2000,
+    concurrency=32,
+    corpus_size=5000,
+    dimension=768,
+    known_fraction=0.5,
+    embed_latency_ms=40.0,
+    llm_latency_ms=400.0,
+    s3_latency_ms=20.0,
+    warmup=50,
+    url=None,
+):
+    """
+    End-to-end /analyze under concurrency. Without `url` the app runs in-process on a local
+    port with Gemini and S3 replaced by fake_services; with `url` an existing deployment is hit.
+    """
+    rng = np.random.default_rng(0)
+    workdir = tempfile.mkdtemp(prefix="bench-load-")
+    fake = None
+    server = None
+    try:
+        # Only categories the knowledge base has content for are eligible for the kNN fast path
+        with open(TIPS_FILE) as f:
+            names = sorted(json.load(f))
+        statements = build_load_store(os.path.join(workdir, "vector_store"), corpus_size, dimension, names)
+        bodies = [
+            {"text": statements[rng.integers(corpus_size)] if rng.random() < known_fraction else f"novel message {i}"}
+            for i in range(requests + warmup)
+        ]
+
+        if url is None:
+            shutil.copy(TIPS_FILE, os.path.join(workdir, "mental_health_tips.json"))
+            fake_app = create_fake_app(embed_latency_ms, llm_latency_ms, s3_latency_ms, dimension=dimension,
+                                       s3_root=workdir)
+            fake = FakeServer(fake_app)
+            fake_url = fake.start()
+
+            # main reads its configuration at import time
+            os.environ.update({
+                "GEMINI_API_KEY": "fake",
+                "EMBEDDING_BASE_URL": f"{fake_url}/v1beta",
+                "KB_SOURCE": "s3",
+                "S3_BUCKET_NAME": "bench",
+                "S3_VECTOR_STORE_PREFIX": "",
+                "AWS_ENDPOINT_URL_S3": fake_url,
+                "AWS_ACCESS_KEY_ID": "fake",
+                "AWS_SECRET_ACCESS_KEY": "fake",
+                "AWS_DEFAULT_REGION": "us-east-1",
+            })
+            import main
+
+            main.model = FakeGeminiModel(fake_url)
+            set_index(VectorIndex.from_store(os.path.join(workdir, "vector_store")))
+            server = FakeServer(main.app)
+            url = server.start()
+            if not httpx.post(f"{url}/warmup", timeout=60).json()["ready"]:
+                raise RuntimeError("App did not become ready")
+
+        asyncio.run(generate_load(url, bodies[:warmup], concurrency))
+        latencies, errors, elapsed = asyncio.run(generate_load(url, bodies[warmup:], concurrency))
+        report = summarize(latencies, elapsed, errors)
+        report.update({"concurrency": concurrency, "known_fraction": known_fraction})
+        if fake is not None:
+            report["upstream_calls"] = dict(fake_app.state.calls)
+            report["decision_paths"] = dict(main.DECISION_COUNTS)
+        print(f"🚦 load/analyze: p50 {report['p50_ms']} ms, p99 {report['p99_ms']} ms, "
+              f"{report['rps']} req/s, {errors} errors")
+        return {"load/analyze": report}
+    finally:
+        if server is not None:
+            server.stop()
+        if fake is not None:
+            fake.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline, tolerance=0.2):
+    """
+    Return a list of regressions: latencies above baseline * (1 + tolerance) or
+    throughput below baseline * (1 - tolerance), for results present in both runs.
+    """
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for key in LATENCY_KEYS:
+            if previous.get(key) and current.get(key, 0) > previous[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {current[key]} vs baseline {previous[key]}")
+        for key in THROUGHPUT_KEYS:
+            if previous.get(key) and current.get(key, 0) < previous[key] * (1 - tolerance):
+                regressions.append(f"{name} {key}: {current[key]} vs baseline {previous[key]}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the /analyze pipeline")
+    parser.add_argument("suite", choices=["search", "builder", "load", "all"])
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Previous results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative slowdown before failing")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[128, 768])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--builder-items", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--corpus-size", type=int, default=5000)
+    parser.add_argument("--known-fraction", type=float, default=0.5,
+                        help="Share of load requests that repeat a stored statement (kNN fast path)")
+    parser.add_argument("--embed-latency-ms", type=float, default=40.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=20.0)
+    parser.add_argument("--url", help="Load-test a running server instead of an in-process app with fakes")
+    args = parser.parse_args()
+
+    results = {}
+    if args.suite in ("search", "all"):
+        results.update(bench_search(args.sizes, args.dimensions, args.queries))
+    if args.suite in ("builder", "all"):
+        results.update(bench_builder(args.builder_items, embed_latency_ms=args.embed_latency_ms))
+    if args.suite in ("load", "all"):
+        results.update(bench_load(
+            args.requests, args.concurrency, args.corpus_size,
+            known_fraction=args.known_fraction,
+            embed_latency_ms=args.embed_latency_ms,
+            llm_latency_ms=args.llm_latency_ms,
+            s3_latency_ms=args.s3_latency_ms,
+            url=args.url,
+        ))
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"💾 Results saved to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
@@ -0,0 +1,175 @@
+"""
+Check that an extra worker in serve.py's shared-index mode costs little memory.
+
+Builds a synthetic vector store, then starts the backend with 2 and N
+workers, both through serve.py (one shared index) and through plain
+`uvicorn --workers` (every worker loads its own), and sums PSS over each
+process tree. PSS splits shared pages between the processes mapping them,
+so the marginal cost of a worker is (total(N) - total(2)) / (N - 2).
+Exits non-zero when that cost in shared mode is above --max-worker-mb:
+    python check_worker_memory.py --workers 4 --corpus-size 100000 --max-worker-mb 150
+Reads /proc, so Linux only.
+"""
+import argparse
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmark import BACKEND_DIR, TIPS_FILE, build_load_store
+
+SMAPS_FIELDS = ("Rss", "Pss", "Private_Clean", "Private_Dirty")
+
+
+def process_tree(pid):
+    """
+    pid and all of its descendants.
+    """
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        for task in os.listdir(f"/proc/{current}/task"):
+            try:
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pending.extend(int(child) for child in f.read().split())
+            except FileNotFoundError:
+                continue
+    return pids
+
+
+def memory_kb(pid):
+    """
+    {Rss, Pss, Private} in KB from /proc/<pid>/smaps_rollup.
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in SMAPS_FIELDS:
+                values[name] = int(rest.split()[0])
+    return {
+        "Rss": values.get("Rss", 0),
+        "Pss": values.get("Pss", 0),
+        "Private": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_ready(url, workers, timeout):
+    """
+    Wait until /health answers 200 repeatedly (requests land on random workers), then
+    call /warmup a few times so every worker has faulted its index pages in.
+    """
+    deadline = time.monotonic() + timeout
+    streak = 0
+    while streak < 3 * workers:
+        if time.monotonic() > deadline:
+            raise RuntimeError(f"{url} did not become ready in {timeout}s")
+        try:
+            ok = httpx.get(f"{url}/health", timeout=5).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        streak = streak + 1 if ok else 0
+        time.sleep(0.05 if ok else 0.5)
+    for _ in range(3 * workers):
+        httpx.post(f"{url}/warmup", timeout=60)
+
+
+def measure(mode, workers, workdir, env, timeout=180.0, settle=2.0):
+    """
+    Start the backend in `mode` ("shared" or "per-worker") and return its memory totals in MB.
+    """
+    port = free_port()
+    if mode == "shared":
+        command = [sys.executable, "serve.py", "--workers", str(workers), "--port", str(port), "--log-level", "warning"]
+    else:
+        command = [sys.executable, "-m", "uvicorn", "main:app", "--workers", str(workers), "--port", str(port),
+                   "--log-level", "warning"]
+
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL)
+    try:
+        wait_ready(f"http://127.0.0.1:{port}", workers, timeout)
+        time.sleep(settle)
+        totals = {"Rss": 0, "Pss": 0, "Private": 0}
+        pids = process_tree(process.pid)
+        for pid in pids:
+            for key, value in memory_kb(pid).items():
+                totals[key] += value
+        return {"workers": workers, "processes": len(pids), **{f"{k.lower()}_mb": round(v / 1024, 1)
+                                                               for k, v in totals.items()}}
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def check(workers=4, corpus_size=100000, dimension=768, max_worker_mb=150.0):
+    if workers < 3:
+        raise ValueError("Need at least 3 workers to measure the cost of an extra one")
+    workdir = tempfile.mkdtemp(prefix="worker-memory-")
+    try:
+        with open(TIPS_FILE) as f:
+            names = sorted(json.load(f))
+        store_path = os.path.join(workdir, "vector_store")
+        build_load_store(store_path, corpus_size, dimension, names)
+        shutil.copy(TIPS_FILE, os.path.join(workdir, "mental_health_tips.json"))
+        index_mb = sum(
+            os.path.getsize(os.path.join(store_path, name)) for name in os.listdir(store_path)
+        ) / 1e6
+
+        env = {
+            **os.environ,
+            "GEMINI_API_KEY": "fake",
+            "VECTOR_STORE_PATH": store_path,
+            "KB_SOURCE": "file",
+            "KB_SOURCE_ROOT": workdir,
+            "S3_VECTOR_STORE_PREFIX": "",
+            "SHARED_INDEX_DIR": os.path.join(workdir, "shared"),
+            "EMBED_CACHE_DB": "",
+        }
+        report = {"index_mb": round(index_mb, 1), "modes": {}}
+        for mode in ("shared", "per-worker"):
+            low, high = measure(mode, 2, workdir, env), measure(mode, workers, workdir, env)
+            per_worker = (high["pss_mb"] - low["pss_mb"]) / (workers - 2)
+            # RSS counts the shared index pages in full for every worker, so it is an upper bound
+            rss_per_worker = (high["rss_mb"] - low["rss_mb"]) / (workers - 2)
+            report["modes"][mode] = {"runs": [low, high], "pss_per_extra_worker_mb": round(per_worker, 1),
+                                     "rss_per_extra_worker_mb": round(rss_per_worker, 1)}
+            print(f"🧠 {mode}: {low['pss_mb']} MB PSS with 2 workers, {high['pss_mb']} MB with {workers} "
+                  f"-> {per_worker:.1f} MB per extra worker (index {index_mb:.0f} MB on disk)")
+
+        report["passed"] = report["modes"]["shared"]["pss_per_extra_worker_mb"] <= max_worker_mb
+        return report
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure memory per extra worker with and without the shared index")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--corpus-size", type=int, default=100000)
+    parser.add_argument("--dimension", type=int, default=768)
+    parser.add_argument("--max-worker-mb", type=float, default=150.0,
+                        help="Largest acceptable PSS growth per extra worker in shared mode")
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+
+    report = check(args.workers, args.corpus_size, args.dimension, args.max_worker_mb)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if not report["passed"]:
+        print(f"❌ Shared mode costs more than {args.max_worker_mb} MB per extra worker")
+        sys.exit(1)
+    print(f"✅ Shared mode stays within {args.max_worker_mb} MB per extra worker")
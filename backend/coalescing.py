@@ -0,0 +1,98 @@
+"""
+Request coalescing and micro-batching for the upstream calls /analyze makes.
+
+A MicroBatcher sits in front of a function that handles a list of items in
+one call (batchEmbedContents, a matrix-matrix search, a grouped Gemini
+prompt). Concurrent callers submit single items; the first one opens a
+window of `window` seconds, and the batch is flushed when the window ends
+or `max_items` are waiting, whichever comes first. Each caller gets its own
+future, resolved with its own result (or the batch's exception).
+
+Items with the same key are single-flight: a caller whose key is already
+waiting or in flight joins that future instead of adding a duplicate to the
+batch. Callers await the shared future through asyncio.shield, so one
+caller timing out does not cancel the work the others are waiting on.
+"""
+import asyncio
+import os
+
+from telemetry import REGISTRY
+
+COALESCING_ENABLED = os.getenv("COALESCING_ENABLED", "true").lower() == "true"
+
+BATCH_SIZE = REGISTRY.histogram(
+    "coalescing_batch_size", "Distinct items per upstream call made by each micro-batcher", ("batcher",),
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+COALESCED = REGISTRY.counter(
+    "coalescing_joined_total", "Calls that joined an identical in-flight item instead of adding one", ("batcher",)
+)
+
+
+class MicroBatcher:
+    def __init__(self, name, handler, window=0.005, max_items=32, key=None):
+        self.name = name
+        self.handler = handler  # async handler(items) -> list of results, one per item
+        self.window = window
+        self.max_items = max_items
+        self.key = key or (lambda item: item)
+        self._pending = []  # (key, item, future) waiting for the next flush
+        self._futures = {}  # key -> future, for items pending or in flight
+        self._timer = None
+        self._tasks = set()  # running flushes; the loop only keeps weak references
+
+    async def submit(self, item):
+        """
+        Queue `item` and wait for its result.
+        """
+        key = self.key(item)
+        future = self._futures.get(key)
+        if future is not None:
+            COALESCED.inc(batcher=self.name)
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._futures[key] = future
+        self._pending.append((key, item, future))
+        if len(self._pending) >= self.max_items or self.window <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        BATCH_SIZE.observe(len(batch), batcher=self.name)
+        try:
+            results = await self.handler([item for _, item, _ in batch])
+            if len(results) != len(batch):
+                raise RuntimeError(f"{self.name}: expected {len(batch)} results, got {len(results)}")
+        except asyncio.CancelledError:
+            for _, _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, _, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            for key, _, future in batch:
+                if self._futures.get(key) is future:
+                    del self._futures[key]
+                # Nobody may be left awaiting a failed future; don't warn about it
+                if future.done() and not future.cancelled():
+                    future.exception()
@@ -0,0 +1,207 @@
+"""
+Query-embedding cache for the /analyze path.
+
+Keys are the normalized input text plus the embedding model name. Lookups go
+through an in-process LRU first and then an optional on-disk SQLite layer,
+which survives restarts and can be shared by workers on the same host. Both
+layers are size-capped, expire entries after a TTL and count hits/misses.
+Embeddings are kept as read-only float32 arrays (3 KB for 768 dimensions
+rather than ~25 KB as a list of Python floats).
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", "86400"))
+EMBED_CACHE_DB = os.getenv("EMBED_CACHE_DB", "")  # empty disables the disk layer
+EMBED_CACHE_DB_SIZE = int(os.getenv("EMBED_CACHE_DB_SIZE", "100000"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFKC", text)
+    return _WHITESPACE.sub(" ", text).strip().casefold()
+
+
+def cache_key(text, model):
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class LRUCache:
+    def __init__(self, max_entries=EMBED_CACHE_SIZE, ttl=EMBED_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.entries.get(key)
+            if item is None or item[0] < time.monotonic():
+                if item is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class SQLiteCache:
+    """
+    Disk layer: embeddings stored as float32 blobs, evicted least-recently-used past max_entries.
+
+    The row count lives in the database, kept by triggers, so every process sharing
+    the file sees the same size and the cap holds across all of them.
+    """
+
+    def __init__(self, path, max_entries=EMBED_CACHE_DB_SIZE, ttl=EMBED_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed_at)")
+        # A counter row kept by triggers, so puts do not need a COUNT(*) scan
+        with self._transaction():
+            self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings_size (id INTEGER PRIMARY KEY, size INTEGER NOT NULL)")
+            self.conn.execute("INSERT OR IGNORE INTO embeddings_size SELECT 1, COUNT(*) FROM embeddings")
+            self.conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_inserted AFTER INSERT ON embeddings"
+                " BEGIN UPDATE embeddings_size SET size = size + 1 WHERE id = 1; END"
+            )
+            self.conn.execute(
+                "CREATE TRIGGER IF NOT EXISTS embeddings_deleted AFTER DELETE ON embeddings"
+                " BEGIN UPDATE embeddings_size SET size = size - 1 WHERE id = 1; END"
+            )
+
+    @property
+    def size(self):
+        with self.lock:
+            return self._size()
+
+    def _size(self):
+        return self.conn.execute("SELECT size FROM embeddings_size WHERE id = 1").fetchone()[0]
+
+    @contextmanager
+    def _transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so the count check and
+        # eviction cannot interleave with another process's put
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT vector, expires_at FROM embeddings WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < now:
+                if row is not None:
+                    self.conn.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE embeddings SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        # frombuffer over the immutable blob gives a read-only array without a copy
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(self, key, value):
+        now = time.time()
+        blob = np.asarray(value, dtype=np.float32).tobytes()
+        with self.lock, self._transaction():
+            # An upsert, unlike INSERT OR REPLACE, does not fire the delete trigger for the old row
+            self.conn.execute(
+                "INSERT INTO embeddings (key, vector, expires_at, accessed_at) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (key) DO UPDATE SET"
+                " vector = excluded.vector, expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                (key, blob, now + self.ttl, now),
+            )
+            excess = self._size() - self.max_entries
+            if excess > 0:
+                self.conn.execute(
+                    "DELETE FROM embeddings WHERE key IN"
+                    " (SELECT key FROM embeddings ORDER BY accessed_at LIMIT ?)",
+                    (excess,),
+                )
+                self.evictions += excess
+
+    def stats(self):
+        return {"size": self.size, "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+class EmbeddingCache:
+    def __init__(self, memory=None, disk=None):
+        self.memory = memory or LRUCache()
+        self.disk = disk
+
+    def get(self, text, model):
+        key = cache_key(text, model)
+        value = self.memory.get(key)
+        if value is None and self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.memory.put(key, value)
+        return value
+
+    def put(self, text, model, embedding):
+        """
+        Cache `embedding` and return it as the read-only float32 array that was stored.
+        """
+        key = cache_key(text, model)
+        vector = np.array(embedding, dtype=np.float32)
+        vector.setflags(write=False)
+        self.memory.put(key, vector)
+        if self.disk is not None:
+            self.disk.put(key, vector)
+        return vector
+
+    def stats(self):
+        stats = {"memory": self.memory.stats()}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+def build_embedding_cache():
+    """
+    Cache configured from the EMBED_CACHE_* environment variables.
+    """
+    disk = SQLiteCache(EMBED_CACHE_DB) if EMBED_CACHE_DB else None
+    return EmbeddingCache(LRUCache(), disk)
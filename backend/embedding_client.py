@@ -0,0 +1,211 @@
+"""
+Batched, concurrent client for the Gemini embedding API.
+
+Texts are sent through `batchEmbedContents` in fixed-size batches with up to
+`concurrency` requests in flight over one pooled httpx.AsyncClient. A token
+bucket caps the request rate, and 429/5xx responses are retried with
+exponential backoff (honouring Retry-After when the server sends it).
+
+The httpx client is injectable, so tests and benchmarks can point the
+pipeline at a local fake embedding server.
+"""
+import asyncio
+import itertools
+import os
+import random
+import time
+
+import httpx
+
+DEFAULT_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+
+def base_url_from_endpoint(endpoint):
+    """
+    API base of a full method URL (.../v1beta/models/<model>:embedContent), or None.
+    """
+    if endpoint and "/models/" in endpoint:
+        return endpoint.split("/models/", 1)[0]
+    return None
+
+
+# The one setting both embedContent and batchEmbedContents URLs are built from. Deployments
+# that still set the full EMBEDDING_ENDPOINT URL get its base, so both calls go to one host.
+EMBEDDING_BASE_URL = (
+    os.getenv("EMBEDDING_BASE_URL") or base_url_from_endpoint(os.getenv("EMBEDDING_ENDPOINT")) or DEFAULT_BASE_URL
+)
+EMBEDDING_MODEL = "models/embedding-001"
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class EmbeddingError(RuntimeError):
+    pass
+
+
+class TokenBucket:
+    """
+    Async token bucket: `rate` tokens per second, bursts of up to `capacity`.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class EmbeddingClient:
+    def __init__(
+        self,
+        api_key,
+        model=EMBEDDING_MODEL,
+        base_url=EMBEDDING_BASE_URL,
+        embed_url=None,
+        client=None,
+        batch_size=100,
+        concurrency=4,
+        requests_per_second=10.0,
+        max_retries=6,
+        backoff_base=1.0,
+        backoff_max=60.0,
+        timeout=30.0,
+    ):
+        self.api_key = api_key
+        self.model = model
+        self.url = f"{base_url.rstrip('/')}/{model}:batchEmbedContents"
+        self.embed_url = embed_url or f"{base_url.rstrip('/')}/{model}:embedContent"
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(requests_per_second)
+        self._owns_client = client is None
+        self.client = client or httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+        )
+        self.retries = 0
+        self.requests = 0  # HTTP requests sent, retries included
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def aclose(self):
+        if self._owns_client:
+            await self.client.aclose()
+
+    async def embed(self, text):
+        """
+        Embed a single text with one embedContent call.
+        """
+        payload = {"model": self.model, "content": {"parts": [{"text": text}]}}
+        response = await self._post(self.embed_url, payload)
+        return response.json()["embedding"]["values"]
+
+    async def embed_batch(self, texts):
+        """
+        Embed one batch of texts with a single batchEmbedContents call.
+        """
+        payload = {
+            "requests": [
+                {"model": self.model, "content": {"parts": [{"text": text}]}}
+                for text in texts
+            ]
+        }
+        response = await self._post(self.url, payload)
+
+        embeddings = [entry["values"] for entry in response.json()["embeddings"]]
+        if len(embeddings) != len(texts):
+            raise EmbeddingError(f"Expected {len(texts)} embeddings, got {len(embeddings)}")
+        return embeddings
+
+    async def _post(self, url, payload):
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            self.requests += 1
+            try:
+                response = await self.client.post(url, params={"key": self.api_key}, json=payload)
+            except httpx.TransportError as e:
+                if attempt == self.max_retries:
+                    raise EmbeddingError(f"Embedding request failed: {e}") from e
+                await self._backoff(attempt)
+                continue
+
+            if response.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                await self._backoff(attempt, response.headers.get("Retry-After"))
+                continue
+            if response.is_error:
+                raise EmbeddingError(f"Embedding request failed ({response.status_code}): {response.text}")
+            return response
+
+    async def embed_batches(self, items, text_of=lambda item: item, progress=None):
+        """
+        Embed `items` in batches, yielding (batch_items, embeddings) as each batch completes.
+
+        `items` may be any iterable, e.g. a generator over a JSONL file: it is
+        consumed lazily, one batch at a time, with at most `concurrency` batches
+        in flight. Batches that still fail after retries are reported and
+        skipped so one bad batch does not abort a long build; their items are
+        yielded with embeddings=None. `progress` (e.g. a tqdm bar) is advanced
+        by batch size.
+        """
+        iterator = iter(items)
+
+        async def run(batch):
+            try:
+                return batch, await self.embed_batch([text_of(item) for item in batch])
+            except EmbeddingError as e:
+                print(f"❌ Failed to embed batch of {len(batch)}: {e}")
+                return batch, None
+
+        in_flight = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(in_flight) < self.concurrency:
+                    batch = list(itertools.islice(iterator, self.batch_size))
+                    if not batch:
+                        exhausted = True
+                        break
+                    in_flight.add(asyncio.ensure_future(run(batch)))
+                if not in_flight:
+                    return
+
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    batch, embeddings = task.result()
+                    if progress is not None:
+                        progress.update(len(batch))
+                    yield batch, embeddings
+        finally:
+            for task in in_flight:
+                task.cancel()
+
+    async def _backoff(self, attempt, retry_after=None):
+        self.retries += 1
+        if retry_after is not None:
+            try:
+                await asyncio.sleep(min(float(retry_after), self.backoff_max))
+                return
+            except ValueError:
+                pass
+        delay = min(self.backoff_base * (2 ** attempt), self.backoff_max)
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        await asyncio.sleep(random.uniform(0, delay))
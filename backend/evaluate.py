@@ -0,0 +1,436 @@
+"""
+Offline evaluation of the /analyze pipeline on the Comprehend test split.
+
+Replays data/cleaned/comprehend_test.csv (written by
+scripts/prepare_comprehend_dataset.py) through the app in-process, once for
+every configuration in the grid given on the command line:
+  --top-k       neighbours retrieved per query (SEARCH_TOP_K)
+  --classifier  auto | knn | llm (CLASSIFIER_MODE)
+  --prompt      "default" or a prompt file with {text} and {similar} (CLASSIFY_PROMPT_FILE)
+  --index       vector store directories, optionally PATH@ivf or PATH@hnsw (VECTOR_STORE_PATH, SEARCH_BACKEND)
+For each one it reports macro-F1, the confusion matrix, per-stage latency
+(from the Server-Timing header) and the upstream calls made: embedding
+requests actually sent (cache hits are free) and Gemini calls. Every index
+first gets one untimed, kNN-only pass, so cold-start costs do not land on
+whichever configuration happens to run first.
+
+Gemini answers are recorded to --recordings, keyed by model and prompt, and
+query embeddings go to the disk embedding cache. Reruns therefore make no
+upstream calls and give the same predictions. Recorded answers are returned
+after their recorded latency, so the latency figures stay comparable:
+    python evaluate.py --top-k 3 5 10 --classifier auto knn llm --min-macro-f1 0.6
+    python evaluate.py --replay-only   # fail instead of calling Gemini for unseen prompts
+With --min-macro-f1 the fastest configuration (by p95) that reaches it is
+reported, and the run exits non-zero when none does. --fake answers from
+fake_services instead of Gemini, which only tests the harness itself.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+from collections import Counter
+
+import httpx
+import numpy as np
+
+from benchmark import BACKEND_DIR, FakeGeminiModel, summarize
+from embedding_cache import EmbeddingCache, LRUCache, SQLiteCache
+from evaluation_data import EMBEDDINGS_DB, EMBEDDINGS_TTL, REPO_DIR, TEST_FILE, load_test_set
+
+RECORDINGS_FILE = os.path.join(BACKEND_DIR, "evaluation_recordings.jsonl")
+ERROR_LABEL = "<error>"  # prediction recorded for requests that failed
+
+
+class RecordedModel:
+    """
+    generate_content_async in front of a Gemini model, answering prompts it has seen from a JSONL file.
+
+    Unseen prompts go upstream and are appended with their latency; with replay_only
+    they raise LookupError instead.
+    """
+
+    class Response:
+        def __init__(self, text):
+            self.text = text
+
+    def __init__(self, model, path=RECORDINGS_FILE, replay_only=False, replay_latency=True):
+        self.model = model
+        self.model_name = getattr(model, "model_name", type(model).__name__)
+        self.path = path
+        self.replay_only = replay_only
+        self.replay_latency = replay_latency
+        self.recordings = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.recordings[record["key"]] = record
+        self.calls = 0
+        self.upstream = 0
+
+    def key(self, prompt):
+        return hashlib.sha256(f"{self.model_name}\x00{prompt}".encode("utf-8")).hexdigest()
+
+    async def generate_content_async(self, prompt, stream=False, request_options=None):
+        if stream:
+            # Only the streamed chat reply uses this, and it is not evaluated
+            return await self.model.generate_content_async(prompt, stream=True, request_options=request_options)
+
+        self.calls += 1
+        key = self.key(prompt)
+        record = self.recordings.get(key)
+        if record is None:
+            if self.replay_only:
+                raise LookupError(f"No recorded response for prompt {key[:12]}")
+            start = time.perf_counter()
+            response = await self.model.generate_content_async(prompt, request_options=request_options)
+            record = {"key": key, "latency_ms": round((time.perf_counter() - start) * 1000, 3), "text": response.text}
+            self.upstream += 1
+            self.recordings[key] = record
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        elif self.replay_latency:
+            await asyncio.sleep(record["latency_ms"] / 1000)
+        return self.Response(record["text"])
+
+
+def confusion_matrix(labels, predictions):
+    """
+    (class names, counts) with gold labels as rows and predictions as columns.
+    """
+    names = sorted(set(labels) | set(predictions))
+    position = {name: i for i, name in enumerate(names)}
+    matrix = np.zeros((len(names), len(names)), dtype=np.int64)
+    for label, prediction in zip(labels, predictions):
+        matrix[position[label], position[prediction]] += 1
+    return names, matrix
+
+
+def classification_report(labels, predictions):
+    """
+    Accuracy, macro-F1 over the classes in the test set, per-class scores and the confusion matrix.
+    """
+    names, matrix = confusion_matrix(labels, predictions)
+    true_positives = np.diag(matrix)
+    predicted = matrix.sum(axis=0)
+    support = matrix.sum(axis=1)
+    per_class = {}
+    for i, name in enumerate(names):
+        if not support[i]:
+            continue
+        precision = true_positives[i] / predicted[i] if predicted[i] else 0.0
+        recall = true_positives[i] / support[i]
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        per_class[name] = {
+            "precision": round(float(precision), 4),
+            "recall": round(float(recall), 4),
+            "f1": round(float(f1), 4),
+            "support": int(support[i]),
+        }
+    return {
+        "accuracy": round(float(true_positives.sum() / max(len(labels), 1)), 4),
+        "macro_f1": round(float(np.mean([scores["f1"] for scores in per_class.values()])) if per_class else 0.0, 4),
+        "per_class": per_class,
+        "confusion": {"labels": names, "matrix": matrix.tolist()},
+    }
+
+
+def parse_server_timing(header):
+    """
+    {stage: milliseconds} from a Server-Timing header.
+    """
+    stages = {}
+    for entry in filter(None, (part.strip() for part in header.split(","))):
+        name, _, params = entry.partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                stages[name] = float(value)
+    return stages
+
+
+async def replay(client, texts, concurrency):
+    """
+    POST every text to /analyze, at most `concurrency` at a time. Returns one outcome per text.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def analyze(text):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/analyze", json={"text": text})
+            except httpx.HTTPError as e:
+                return {"prediction": ERROR_LABEL, "seconds": time.perf_counter() - start, "stages": {}, "error": str(e)}
+            outcome = {
+                "seconds": time.perf_counter() - start,
+                "stages": parse_server_timing(response.headers.get("server-timing", "")),
+            }
+            if response.status_code != 200:
+                return {**outcome, "prediction": ERROR_LABEL, "error": response.text[:200]}
+            body = response.json()
+            return {**outcome, "prediction": body["prediction"], "decision_path": body["metadata"]["decision_path"]}
+
+    return await asyncio.gather(*(analyze(text) for text in texts))
+
+
+def stage_latencies(outcomes):
+    """
+    Percentiles per pipeline stage, over the requests that ran it.
+    """
+    samples = {}
+    for outcome in outcomes:
+        for stage, ms in outcome["stages"].items():
+            samples.setdefault(stage, []).append(ms / 1000)
+    report = {}
+    for stage, seconds in sorted(samples.items()):
+        summary = summarize(seconds, 0)
+        report[stage] = {key: summary[key] for key in ("count", "mean_ms", "p50_ms", "p95_ms", "p99_ms")}
+    return report
+
+
+def config_name(config):
+    return " ".join(f"{key}={value}" for key, value in config.items())
+
+
+def build_grid(top_ks, classifiers, prompts, indexes):
+    keys = ("top_k", "classifier", "prompt", "index")
+    return [
+        dict(zip(keys, values)) for values in itertools.product(top_ks, classifiers, prompts, indexes)
+        # The prompt makes no difference when Gemini is never asked
+        if values[1] != "knn" or values[2] == prompts[0]
+    ]
+
+
+def load_prompts(main, specs):
+    """
+    {name: template} for "default" (the prompt main.py serves) and prompt files.
+    """
+    prompts = {}
+    for spec in specs:
+        if spec == "default":
+            prompts[spec] = main.CLASSIFY_PROMPT
+            continue
+        with open(spec) as f:
+            template = f.read()
+        try:
+            template.format(text="", similar="")
+        except (KeyError, IndexError) as e:
+            raise ValueError(f"{spec}: only {{text}} and {{similar}} may appear in braces (got {e})") from e
+        prompts[spec] = template
+    return prompts
+
+
+def load_indexes(specs):
+    """
+    {spec: VectorIndex} for "PATH" or "PATH@BACKEND" specs.
+    """
+    from semantic_search import SEARCH_BACKEND, load_index
+
+    indexes = {}
+    for spec in specs:
+        path, _, backend = spec.partition("@")
+        indexes[spec] = load_index(path, backend or SEARCH_BACKEND)
+    return indexes
+
+
+async def evaluate(main, recorder, texts, labels, configs, prompts, indexes, concurrency, log_path):
+    """
+    Run every configuration over the test set in one app instance.
+    Returns (one report per configuration, embedding requests sent).
+    """
+    reports = []
+    async with main.lifespan(main.app):
+        if not await asyncio.to_thread(main.warm_up):
+            raise RuntimeError(f"App did not become ready: {main.STARTUP.status()}")
+
+        # Embed every text once up front, so no configuration pays for the cache misses of another
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def prefetch(text):
+            async with semaphore:
+                await main.get_query_embedding(text)
+
+        with open(log_path, "a") as log, contextlib.redirect_stdout(log):
+            await asyncio.gather(*(prefetch(text) for text in set(texts)))
+        embedding_requests = main.embedder.requests
+        print(f"🧬 {len(set(texts))} query embeddings ready ({embedding_requests} embedding requests)")
+
+        transport = httpx.ASGITransport(app=main.app)
+        timeout = main.ANALYZE_BUDGET + main.SEARCH_TIMEOUT + 10
+        async with httpx.AsyncClient(transport=transport, base_url="http://evaluate", timeout=timeout) as client:
+            # One untimed pass per index first, so the first configuration does not absorb cold-start
+            # costs (page faults, lazy loads); kNN-only, so it never calls Gemini
+            main.CLASSIFIER_MODE = "knn"
+            for spec in dict.fromkeys(config["index"] for config in configs):
+                main.set_index(indexes[spec])
+                with open(log_path, "a") as log, contextlib.redirect_stdout(log):
+                    await replay(client, texts, concurrency)
+            print(f"🔥 Warmed up {len(indexes)} index(es)")
+
+            for config in configs:
+                main.SEARCH_TOP_K = config["top_k"]
+                main.CLASSIFIER_MODE = config["classifier"]
+                main.CLASSIFY_PROMPT = prompts[config["prompt"]]
+                main.set_index(indexes[config["index"]])
+
+                calls, upstream, embeds = recorder.calls, recorder.upstream, main.embedder.requests
+                start = time.perf_counter()
+                # The app logs one JSON line per request; keep them out of the report
+                with open(log_path, "a") as log, contextlib.redirect_stdout(log):
+                    outcomes = await replay(client, texts, concurrency)
+                elapsed = time.perf_counter() - start
+
+                predictions = [outcome["prediction"] for outcome in outcomes]
+                errors = sum(prediction == ERROR_LABEL for prediction in predictions)
+                report = {"config": config, **classification_report(labels, predictions)}
+                report["latency"] = summarize([outcome["seconds"] for outcome in outcomes], elapsed, errors)
+                report["stages"] = stage_latencies(outcomes)
+                report["decision_paths"] = dict(Counter(outcome.get("decision_path", "error") for outcome in outcomes))
+                # What the configuration costs when serving live, and what this run actually sent to Gemini
+                report["upstream_calls"] = {
+                    "embedding": main.embedder.requests - embeds,
+                    "llm": recorder.calls - calls,
+                    "llm_not_recorded": recorder.upstream - upstream,
+                }
+                if errors:
+                    report["first_error"] = next(o["error"] for o in outcomes if o["prediction"] == ERROR_LABEL)
+                reports.append(report)
+
+                print(f"🧪 {config_name(config)}: macro-F1 {report['macro_f1']}, accuracy {report['accuracy']}, "
+                      f"p50 {report['latency']['p50_ms']:.0f} ms, p95 {report['latency']['p95_ms']:.0f} ms, "
+                      f"{report['upstream_calls']['llm']} LLM calls, {errors} errors")
+    return reports, embedding_requests
+
+
+def choose(reports, min_macro_f1):
+    """
+    The fastest configuration (by p95 latency) whose macro-F1 reaches min_macro_f1, or None.
+    """
+    eligible = [report for report in reports if report["macro_f1"] >= min_macro_f1]
+    return min(eligible, key=lambda report: report["latency"]["p95_ms"]) if eligible else None
+
+
+def format_confusion(confusion):
+    names = confusion["labels"]
+    width = max(len(name) for name in names) + 2
+    lines = ["gold \\ predicted".ljust(width) + "".join(name[:width - 1].rjust(width) for name in names)]
+    for name, row in zip(names, confusion["matrix"]):
+        lines.append(name.ljust(width) + "".join(str(count).rjust(width) for count in row))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure accuracy, latency and upstream calls per pipeline configuration")
+    parser.add_argument("--test-file", default=TEST_FILE)
+    parser.add_argument("--limit", type=int, help="Evaluate only the first N rows")
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5])
+    parser.add_argument("--classifier", nargs="+", choices=["auto", "knn", "llm"], default=["auto"])
+    parser.add_argument("--prompt", nargs="+", default=["default"], help='"default" or prompt template files')
+    parser.add_argument("--index", nargs="+", default=[os.getenv("VECTOR_STORE_PATH", "vector_store")],
+                        help="Vector store directories, PATH or PATH@exact|ivf|hnsw")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--recordings", default=RECORDINGS_FILE, help="JSONL file of recorded Gemini answers")
+    parser.add_argument("--replay-only", action="store_true", help="Fail on prompts that have no recorded answer")
+    parser.add_argument("--no-replay-latency", action="store_true", help="Return recorded answers immediately")
+    parser.add_argument("--embedding-cache", default=EMBEDDINGS_DB, help='SQLite embedding cache ("" to disable)')
+    parser.add_argument("--min-macro-f1", type=float, help="Accuracy bar for picking the fastest configuration")
+    parser.add_argument("--fake", action="store_true", help="Answer from fake_services instead of Gemini")
+    parser.add_argument("--embed-latency-ms", type=float, default=40.0, help="With --fake")
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0, help="With --fake")
+    parser.add_argument("--output", default="evaluation_results.json")
+    parser.add_argument("--log", default="evaluation.log", help="Where the app's own log lines go")
+    args = parser.parse_args()
+
+    texts, labels = load_test_set(args.test_file, args.limit)
+    if not texts:
+        print(f"❌ No rows in {args.test_file}")
+        sys.exit(1)
+    print(f"📊 {len(texts)} test rows, {len(set(labels))} labels from {args.test_file}")
+
+    fake = None
+    if args.fake:
+        from fake_services import FakeServer, create_fake_app
+        from semantic_search import VectorIndex
+
+        dimension = VectorIndex.from_store(args.index[0].partition("@")[0]).matrix.shape[1]
+        fake = FakeServer(create_fake_app(args.embed_latency_ms, args.llm_latency_ms, dimension=dimension))
+        fake_url = fake.start()
+        os.environ.update({
+            "GEMINI_API_KEY": "fake",
+            "EMBEDDING_BASE_URL": f"{fake_url}/v1beta",
+        })
+
+    # main reads its configuration at import time
+    os.environ.update({
+        # Micro-batches depend on which requests happen to arrive together; one upstream call per input is reproducible
+        "COALESCING_ENABLED": "false",
+        # A failed classification should count as an error, not as a rank-vote answer
+        "DEGRADE_ON_FAILURE": "false",
+        "S3_VECTOR_STORE_PREFIX": "",
+    })
+    os.environ.setdefault("KB_SOURCE", "file")
+    os.environ.setdefault("KB_SOURCE_ROOT", REPO_DIR)
+    import main
+
+    # Fake embeddings must not end up in the cache real runs read
+    if args.embedding_cache and not args.fake:
+        main.EMBEDDING_CACHE = EmbeddingCache(LRUCache(), SQLiteCache(args.embedding_cache, ttl=EMBEDDINGS_TTL))
+    main.model = RecordedModel(
+        FakeGeminiModel(fake_url) if args.fake else main.get_model(),
+        args.recordings, args.replay_only, not args.no_replay_latency,
+    )
+    try:
+        prompts = load_prompts(main, args.prompt)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    indexes = load_indexes(args.index)
+    # Startup finds an index already set and does not load VECTOR_STORE_PATH
+    main.set_index(indexes[args.index[0]])
+    configs = build_grid(args.top_k, args.classifier, args.prompt, args.index)
+    print(f"🔬 Evaluating {len(configs)} configurations with concurrency {args.concurrency}")
+
+    try:
+        reports, embedding_requests = asyncio.run(
+            evaluate(main, main.model, texts, labels, configs, prompts, indexes, args.concurrency, args.log)
+        )
+    finally:
+        if fake is not None:
+            fake.stop()
+
+    chosen = choose(reports, args.min_macro_f1) if args.min_macro_f1 is not None else None
+    with open(args.output, "w") as f:
+        json.dump({
+            "meta": {
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "python": platform.python_version(),
+                "test_file": args.test_file,
+                "rows": len(texts),
+                "recorded_answers": len(main.model.recordings),
+                "embedding_requests": embedding_requests,
+                "args": vars(args),
+            },
+            "chosen": config_name(chosen["config"]) if chosen else None,
+            "results": {config_name(report["config"]): report for report in reports},
+        }, f, indent=2)
+    print(f"💾 Results saved to {args.output}")
+
+    if args.min_macro_f1 is None:
+        best = max(reports, key=lambda report: report["macro_f1"])
+        print(f"🏆 Highest macro-F1: {config_name(best['config'])} ({best['macro_f1']})")
+        print(format_confusion(best["confusion"]))
+    elif chosen is None:
+        print(f"❌ No configuration reaches macro-F1 {args.min_macro_f1}")
+        sys.exit(1)
+    else:
+        print(f"✅ Fastest configuration with macro-F1 >= {args.min_macro_f1}: {config_name(chosen['config'])} "
+              f"(macro-F1 {chosen['macro_f1']}, p95 {chosen['latency']['p95_ms']:.0f} ms)")
+        print(format_confusion(chosen["confusion"]))
@@ -0,0 +1,30 @@
+"""
+The held-out queries (the Comprehend test split) and where their embeddings are cached.
+
+Shared by evaluate.py and knn_classifier.py's calibration, which embed the
+same texts and so reuse one SQLite embedding cache.
+"""
+import csv
+import os
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+TEST_FILE = os.path.join(REPO_DIR, "data", "cleaned", "comprehend_test.csv")
+EMBEDDINGS_DB = os.path.join(BACKEND_DIR, "evaluation_embeddings.db")
+EMBEDDINGS_TTL = 10 * 365 * 86400  # seconds; the test set's embeddings only change with the model
+
+
+def load_test_set(path=TEST_FILE, limit=None):
+    """
+    (texts, labels) from a headerless text,label CSV.
+    """
+    texts, labels = [], []
+    with open(path, newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[0].strip():
+                continue
+            texts.append(row[0])
+            labels.append(row[1].strip().lower())
+            if limit and len(texts) >= limit:
+                break
+    return texts, labels
@@ -0,0 +1,218 @@
+"""
+Deterministic local stand-ins for the services the backend calls.
+
+One FastAPI app plays three roles, each with configurable latency:
+  Gemini embeddings - POST /v1beta/models/<model>:embedContent and :batchEmbedContents
+  Gemini generation - POST /v1beta/models/<model>:generateContent and :streamGenerateContent
+  S3                - GET /<bucket>/<key> with ETag / If-None-Match, served from a directory
+
+Embeddings are a pure function of the normalized text and generated
+categories a pure function of the prompt, so runs are repeatable. Used by
+benchmark.py; can also be run on its own to point a dev server at it:
+    python fake_services.py --port 8765 --embed-latency-ms 40 --llm-latency-ms 400
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import numpy as np
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from embedding_cache import normalize_text
+
+FAKE_DIMENSION = 768
+FAKE_CATEGORIES = ["depression", "anxiety", "stress", "normal", "relationship", "addiction", "abuse", "bipolar"]
+
+
+def fake_embedding(text, dimension=FAKE_DIMENSION):
+    """
+    Deterministic unit vector for `text`; texts that normalize the same embed the same.
+    """
+    seed = int.from_bytes(hashlib.sha256(normalize_text(text).encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def fake_category(text):
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return FAKE_CATEGORIES[digest[0] % len(FAKE_CATEGORIES)]
+
+
+def fake_generation(prompt):
+    """
+    Answer the prompts main.py sends: "N: category" lines for grouped prompts (each task
+    answered as if sent alone), a category for single classification prompts, a short
+    reply otherwise.
+    """
+    tasks = re.findall(r"^<task (\d+)>\n(.*?)\n</task \1>$", prompt, re.M | re.S)
+    if tasks:
+        return "\n".join(f"{number}: {fake_generation(task)}" for number, task in tasks)
+    if "Only return the category name" in prompt:
+        return fake_category(prompt.strip())
+    return "It sounds like a lot is going on. Try taking one small step today, and reach out if you need support."
+
+
+class Latency:
+    def __init__(self, mean_ms=0.0, jitter=0.2, seed=0):
+        self.mean_ms = mean_ms
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    async def wait(self):
+        if self.mean_ms > 0:
+            spread = self.mean_ms * self.jitter
+            await asyncio.sleep(max(0.0, self.random.uniform(self.mean_ms - spread, self.mean_ms + spread)) / 1000)
+
+
+def create_fake_app(
+    embed_latency_ms=0.0,
+    llm_latency_ms=0.0,
+    s3_latency_ms=0.0,
+    jitter=0.2,
+    dimension=FAKE_DIMENSION,
+    s3_root=".",
+    stream_chunks=8,
+):
+    app = FastAPI()
+    embed_latency = Latency(embed_latency_ms, jitter, seed=1)
+    llm_latency = Latency(llm_latency_ms, jitter, seed=2)
+    s3_latency = Latency(s3_latency_ms, jitter, seed=3)
+    app.state.calls = {"embed": 0, "batch_embed": 0, "generate": 0, "stream": 0, "s3": 0}
+
+    def text_of(content):
+        return "".join(part.get("text", "") for part in content.get("parts", []))
+
+    def candidate(text):
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]}
+
+    @app.post("/v1beta/models/{target:path}")
+    async def gemini(target: str, request: Request):
+        method = target.rsplit(":", 1)[-1]
+        body = await request.json()
+
+        if method == "embedContent":
+            app.state.calls["embed"] += 1
+            await embed_latency.wait()
+            return {"embedding": {"values": fake_embedding(text_of(body["content"]), dimension)}}
+
+        if method == "batchEmbedContents":
+            app.state.calls["batch_embed"] += 1
+            await embed_latency.wait()
+            return {
+                "embeddings": [
+                    {"values": fake_embedding(text_of(item["content"]), dimension)} for item in body["requests"]
+                ]
+            }
+
+        prompt = "".join(text_of(content) for content in body.get("contents", []))
+        if method == "generateContent":
+            app.state.calls["generate"] += 1
+            await llm_latency.wait()
+            return candidate(fake_generation(prompt))
+
+        if method == "streamGenerateContent":
+            app.state.calls["stream"] += 1
+            words = fake_generation(prompt).split(" ")
+            size = max(1, len(words) // stream_chunks)
+
+            async def chunks():
+                for i in range(0, len(words), size):
+                    await asyncio.sleep(llm_latency.mean_ms / 1000 / stream_chunks)
+                    text = " ".join(words[i:i + size]) + " "
+                    yield f"data: {json.dumps(candidate(text))}\r\n\r\n"
+
+            return StreamingResponse(chunks(), media_type="text/event-stream")
+
+        return JSONResponse({"error": {"message": f"Unknown method {method}"}}, status_code=404)
+
+    @app.get("/{bucket}/{key:path}")
+    async def s3_get(bucket: str, key: str, request: Request):
+        app.state.calls["s3"] += 1
+        await s3_latency.wait()
+        path = os.path.join(s3_root, key)
+        if not os.path.isfile(path):
+            body = f"<Error><Code>NoSuchKey</Code><Key>{key}</Key></Error>"
+            return Response(body, status_code=404, media_type="application/xml")
+
+        with open(path, "rb") as f:
+            data = f.read()
+        etag = f'"{hashlib.md5(data).hexdigest()}"'
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers={"ETag": etag})
+        return Response(data, headers={"ETag": etag}, media_type="application/octet-stream")
+
+    return app
+
+
+class FakeServer:
+    """
+    Run an app with uvicorn on a background thread: `with FakeServer(app) as url: ...`
+    """
+
+    def __init__(self, app, host="127.0.0.1", port=0):
+        import uvicorn
+
+        self.config = uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(self.config)
+        self._thread = None
+
+    @property
+    def url(self):
+        sock = self.server.servers[0].sockets[0]
+        host, port = sock.getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, timeout=10.0):
+        self._thread = threading.Thread(target=self.server.run, name="fake-server", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Server did not start")
+            time.sleep(0.01)
+        return self.url
+
+    def stop(self):
+        self.server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the fake Gemini / S3 services")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embed-latency-ms", type=float, default=40.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=400.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--dimension", type=int, default=FAKE_DIMENSION)
+    parser.add_argument("--s3-root", default=".", help="Directory served as the bucket contents")
+    args = parser.parse_args()
+
+    print(f"🧪 Fake services on http://{args.host}:{args.port}")
+    print(f"   EMBEDDING_BASE_URL=http://{args.host}:{args.port}/v1beta  AWS_ENDPOINT_URL_S3=http://{args.host}:{args.port}")
+    uvicorn.run(
+        create_fake_app(
+            args.embed_latency_ms, args.llm_latency_ms, args.s3_latency_ms,
+            args.jitter, args.dimension, args.s3_root,
+        ),
+        host=args.host,
+        port=args.port,
+        log_level="warning",
+    )
@@ -0,0 +1,211 @@
+"""
+Background refresher for the knowledge base and vector store.
+
+A daemon thread polls watched objects with conditional GETs (ETag /
+If-None-Match). Unchanged objects cost one 304; changed ones are passed to
+their `apply` callback, which builds the new in-memory object off to the side
+and then swaps a single reference, so in-flight requests keep using the
+buffer they already hold. Failures back off exponentially up to a cap and
+never take the current version down.
+
+Sources:
+  S3Source   - boto3 get_object with IfNoneMatch
+  FileSource - directory on disk, ETag from mtime and size; stands in for S3
+               in local development and tests
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+from vector_store import HEADER_FILE, load_store, store_files
+from ann_index import IVF_FILE, HNSW_FILE, HNSW_META_FILE
+
+
+class NotFound(KeyError):
+    pass
+
+
+class S3Source:
+    def __init__(self, bucket, client=None):
+        self.bucket = bucket
+        self.client = client
+
+    def _get_client(self):
+        # boto3 is slow to import, so wait until the first fetch
+        if self.client is None:
+            import boto3
+
+            self.client = boto3.client("s3")
+        return self.client
+
+    def fetch(self, key, etag=None):
+        """
+        Return (body, etag); body is None when the object still matches `etag`.
+        """
+        from botocore.exceptions import ClientError
+
+        params = {"Bucket": self.bucket, "Key": key}
+        if etag:
+            params["IfNoneMatch"] = etag
+        try:
+            response = self._get_client().get_object(**params)
+        except ClientError as e:
+            code = e.response.get("Error", {}).get("Code")
+            if code in ("304", "NotModified"):
+                return None, etag
+            if code in ("404", "NoSuchKey"):
+                raise NotFound(key) from e
+            raise
+        return response["Body"].read(), response["ETag"]
+
+
+class FileSource:
+    def __init__(self, root):
+        self.root = root
+
+    def fetch(self, key, etag=None):
+        path = os.path.join(self.root, key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError as e:
+            raise NotFound(key) from e
+
+        current = f'"{stat.st_mtime_ns}-{stat.st_size}"'
+        if etag == current:
+            return None, etag
+        with open(path, "rb") as f:
+            return f.read(), current
+
+
+class WatchedObject:
+    def __init__(self, name, key, apply):
+        self.name = name
+        self.key = key
+        self.apply = apply  # apply(body) -> version label
+        self.etag = None
+        self.version = None
+        self.loaded_at = None
+        self.last_checked = None
+        self.last_error = None
+        self.failures = 0
+
+    def status(self):
+        return {
+            "key": self.key,
+            "version": self.version,
+            "etag": self.etag,
+            "loaded_at": self.loaded_at,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+            "failures": self.failures,
+        }
+
+
+class Refresher:
+    def __init__(self, source, interval=60.0, retry_base=2.0, max_backoff=600.0):
+        self.source = source
+        self.interval = interval
+        self.retry_base = retry_base
+        self.max_backoff = max_backoff
+        self.watched = []
+        self._stop = threading.Event()
+        self._thread = None
+
+    def watch(self, name, key, apply):
+        self.watched.append(WatchedObject(name, key, apply))
+
+    def poll_once(self, names=None):
+        """
+        Check every watched object (or just `names`) once. Returns the names that were reloaded.
+        Raises the first error after checking the rest, so the caller can back off.
+        """
+        reloaded, first_error = [], None
+        for obj in self.watched:
+            if names is not None and obj.name not in names:
+                continue
+            obj.last_checked = time.time()
+            try:
+                body, etag = self.source.fetch(obj.key, obj.etag)
+                if body is not None:
+                    obj.version = obj.apply(body)
+                    obj.etag = etag
+                    obj.loaded_at = obj.last_checked
+                    reloaded.append(obj.name)
+                    print(f"🔄 Loaded {obj.name} version {obj.version}")
+                obj.last_error = None
+                obj.failures = 0
+            except Exception as e:
+                obj.last_error = str(e)
+                obj.failures += 1
+                first_error = first_error or e
+                print(f"⚠️ Error refreshing {obj.name}: {e}")
+        if first_error is not None:
+            raise first_error
+        return reloaded
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="kb-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        # The initial load happens at startup, so the first poll waits a full interval
+        failures = 0
+        delay = self.interval
+        while not self._stop.wait(delay):
+            try:
+                self.poll_once()
+                failures = 0
+                delay = self.interval
+            except Exception:
+                failures += 1
+                delay = min(self.retry_base * (2 ** (failures - 1)), self.max_backoff)
+
+    def status(self):
+        return {obj.name: obj.status() for obj in self.watched}
+
+
+def download_store(source, prefix, header_body, cache_dir):
+    """
+    Download the vector store whose header is `header_body` from `prefix` into a fresh
+    versioned directory under `cache_dir`, verify every file against the header and return the local path.
+    Older downloads are pruned, keeping the previous one for requests still using it.
+    """
+    header = json.loads(header_body)
+    name = f"v{header.get('version', 0)}-{header['checksum'].split(':')[-1][:12]}"
+    path = os.path.join(cache_dir, name)
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    required = store_files(header)
+    for file_name in required + [IVF_FILE, HNSW_FILE, HNSW_META_FILE]:
+        try:
+            body, _ = source.fetch(f"{prefix}/{file_name}")
+        except NotFound:
+            if file_name in required:
+                raise
+            continue
+        with open(os.path.join(tmp_path, file_name), "wb") as f:
+            f.write(body)
+    with open(os.path.join(tmp_path, HEADER_FILE), "wb") as f:
+        f.write(header_body)
+
+    # A store caught mid-upload fails here and is retried on the next poll
+    load_store(tmp_path, verify=True)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(tmp_path, path)
+
+    previous = sorted(
+        (os.path.join(cache_dir, d) for d in os.listdir(cache_dir) if d != name and not d.endswith(".tmp")),
+        key=os.path.getmtime,
+    )
+    for old in previous[:-1]:
+        shutil.rmtree(old, ignore_errors=True)
+    return path
@@ -0,0 +1,155 @@
+"""
+Local nearest-neighbour classifier over the statements retrieved for a query.
+
+Each neighbour votes for its category with weight score ** power. The
+confidence is the winning category's share of the total weight; when it
+clears the (calibrated) threshold and the best neighbour is close enough,
+/analyze answers without calling Gemini.
+"""
+import argparse
+import json
+import os
+from collections import defaultdict
+
+import numpy as np
+
+KNN_ENABLED = os.getenv("KNN_ENABLED", "true").lower() == "true"
+KNN_CONFIDENCE_THRESHOLD = float(os.getenv("KNN_CONFIDENCE_THRESHOLD", "0.8"))
+KNN_MIN_SIMILARITY = float(os.getenv("KNN_MIN_SIMILARITY", "0.75"))
+KNN_POWER = float(os.getenv("KNN_POWER", "4"))
+
+
+def knn_vote(similar, power=KNN_POWER):
+    """
+    Return (category, confidence) from a list of {"category", "score"} neighbours.
+    """
+    votes = defaultdict(float)
+    for neighbour in similar:
+        votes[neighbour["category"]] += max(float(neighbour["score"]), 0.0) ** power
+
+    total = sum(votes.values())
+    if not total:
+        return None, 0.0
+    category = max(votes, key=votes.get)
+    return category, votes[category] / total
+
+
+def rank_vote(similar, allowed_categories=None):
+    """
+    Category with the most 1 / (rank + 1) weight among the neighbours, or None.
+
+    Used for degraded answers when Gemini is unavailable; ranks work for
+    lexical results too, whose scores are not cosine similarities.
+    """
+    votes = defaultdict(float)
+    for rank, neighbour in enumerate(similar):
+        if allowed_categories is None or neighbour["category"] in allowed_categories:
+            votes[neighbour["category"]] += 1.0 / (rank + 1)
+    return max(votes, key=votes.get) if votes else None
+
+
+class KNNClassifier:
+    def __init__(
+        self,
+        confidence_threshold=KNN_CONFIDENCE_THRESHOLD,
+        min_similarity=KNN_MIN_SIMILARITY,
+        power=KNN_POWER,
+        enabled=KNN_ENABLED,
+    ):
+        self.confidence_threshold = confidence_threshold
+        self.min_similarity = min_similarity
+        self.power = power
+        self.enabled = enabled
+
+    def classify(self, similar, allowed_categories=None):
+        """
+        Return {"category", "confidence", "confident"} for the retrieved neighbours.
+
+        `confident` is False when the vote is too split, the best match is too
+        far away, or the winner is not a category we can serve content for.
+        """
+        category, confidence = knn_vote(similar, self.power)
+        best_score = max((float(n["score"]) for n in similar), default=0.0)
+        confident = (
+            self.enabled
+            and category is not None
+            and confidence >= self.confidence_threshold
+            and best_score >= self.min_similarity
+            and (allowed_categories is None or category in allowed_categories)
+        )
+        return {"category": category, "confidence": round(confidence, 3), "confident": confident}
+
+
+def calibrate(neighbour_lists, labels, target_precision=0.9, power=KNN_POWER, min_similarity=KNN_MIN_SIMILARITY):
+    """
+    Pick the lowest confidence threshold whose fast-path precision meets target_precision.
+
+    Returns {"threshold", "precision", "coverage"}, or None if no threshold qualifies.
+    Coverage is the share of inputs that would skip the LLM.
+    """
+    votes = [knn_vote(similar, power) for similar in neighbour_lists]
+    best = [max((float(n["score"]) for n in similar), default=0.0) for similar in neighbour_lists]
+
+    for threshold in np.arange(0.5, 1.0001, 0.01):
+        taken = [
+            (category == label)
+            for (category, confidence), score, label in zip(votes, best, labels)
+            if confidence >= threshold and score >= min_similarity
+        ]
+        if taken and sum(taken) / len(taken) >= target_precision:
+            return {
+                "threshold": round(float(threshold), 2),
+                "precision": round(sum(taken) / len(taken), 4),
+                "coverage": round(len(taken) / len(labels), 4),
+            }
+    return None
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from dotenv import load_dotenv
+
+    from embedding_cache import EmbeddingCache, LRUCache, SQLiteCache
+    from embedding_client import EMBEDDING_MODEL, EmbeddingClient
+    from evaluation_data import EMBEDDINGS_DB, EMBEDDINGS_TTL, TEST_FILE, load_test_set
+    from main import SEARCH_TOP_K
+    from semantic_search import find_similar_statements_hybrid_many, load_index, set_index
+
+    parser = argparse.ArgumentParser(
+        description="Calibrate the kNN confidence threshold on held-out queries (the Comprehend test split)"
+    )
+    parser.add_argument("store", help="Vector store directory")
+    parser.add_argument("--test-file", default=TEST_FILE, help="Headerless text,label CSV of held-out queries")
+    parser.add_argument("--limit", type=int, help="Use only the first N queries")
+    parser.add_argument("--embedding-cache", default=EMBEDDINGS_DB,
+                        help="SQLite embedding cache, shared with evaluate.py so reruns make no upstream calls")
+    parser.add_argument("--k", type=int, default=SEARCH_TOP_K, help="Neighbours per query (the server's SEARCH_TOP_K)")
+    parser.add_argument("--target-precision", type=float, default=0.9)
+    args = parser.parse_args()
+    load_dotenv()
+
+    # Corpus rows are embedded as "category: statement" and sit next to their own
+    # duplicates, so they make optimistic queries. Calibrate on real user texts,
+    # embedded and searched exactly as /analyze does it.
+    texts, labels = load_test_set(args.test_file, args.limit)
+    cache = EmbeddingCache(LRUCache(max_entries=len(texts) + 1), SQLiteCache(args.embedding_cache, ttl=EMBEDDINGS_TTL))
+
+    async def embed_queries():
+        missing = sorted({text for text in texts if cache.get(text, EMBEDDING_MODEL) is None})
+        if missing:
+            async with EmbeddingClient(os.getenv("GEMINI_API_KEY"), model=EMBEDDING_MODEL) as client:
+                async for batch, embeddings in client.embed_batches(missing):
+                    if embeddings is None:
+                        raise SystemExit("❌ Could not embed the held-out queries")
+                    for text, embedding in zip(batch, embeddings):
+                        cache.put(text, EMBEDDING_MODEL, embedding)
+        return [cache.get(text, EMBEDDING_MODEL) for text in texts]
+
+    set_index(load_index(args.store))
+    neighbour_lists = find_similar_statements_hybrid_many(asyncio.run(embed_queries()), texts, args.k)
+
+    report = calibrate(neighbour_lists, labels, args.target_precision)
+    print(json.dumps({"queries": len(texts), **(report or {})}, indent=2))
+    if report is None:
+        print(f"⚠️ No threshold reaches precision {args.target_precision}")
@@ -0,0 +1,95 @@
+"""
+In-process BM25 index over the knowledge-base statements.
+
+Postings are stored CSR-style in flat NumPy arrays (term offsets, doc ids,
+precomputed BM25 impact per posting), so a query is a handful of slice
+reads and one scatter-add with no network call. Used on its own when the
+embedding API is slow or down, and fused with dense results by reciprocal
+rank fusion otherwise (see semantic_search.VectorIndex.hybrid_search).
+"""
+import os
+import re
+from collections import Counter
+
+import numpy as np
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+TOKEN = re.compile(r"[a-z0-9]+")
+APOSTROPHES = re.compile(r"['’]")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from has have i im in is it its me my of on or so that the this "
+    "to was we were with you your".split()
+)
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(APOSTROPHES.sub("", text.lower())) if token not in STOPWORDS]
+
+
+class BM25Index:
+    def __init__(self, vocabulary, offsets, doc_ids, impacts, count):
+        self.vocabulary = vocabulary  # term -> term id
+        self.offsets = offsets  # term id -> postings slice [offsets[t], offsets[t + 1])
+        self.doc_ids = doc_ids
+        self.impacts = impacts  # BM25 contribution of the term to the doc
+        self.count = count
+
+    @classmethod
+    def build(cls, statements, k1=BM25_K1, b=BM25_B):
+        vocabulary = {}
+        terms, docs, freqs = [], [], []
+        lengths = []
+        for doc, statement in enumerate(statements):
+            tokens = tokenize(statement)
+            lengths.append(len(tokens))
+            for token, freq in Counter(tokens).items():
+                terms.append(vocabulary.setdefault(token, len(vocabulary)))
+                docs.append(doc)
+                freqs.append(freq)
+
+        count = len(lengths)
+        terms = np.asarray(terms, dtype=np.int32)
+        docs = np.asarray(docs, dtype=np.int32)
+        freqs = np.asarray(freqs, dtype=np.float32)
+        lengths = np.asarray(lengths, dtype=np.float32)
+
+        order = np.argsort(terms, kind="stable")
+        terms, docs, freqs = terms[order], docs[order], freqs[order]
+        offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(vocabulary)), out=offsets[1:])
+
+        doc_freq = np.diff(offsets).astype(np.float32)
+        idf = np.log1p((count - doc_freq + 0.5) / (doc_freq + 0.5))
+        average = lengths.mean() if count else 1.0
+        norm = k1 * (1 - b + b * lengths[docs] / max(average, 1e-9))
+        impacts = (idf[terms] * freqs * (k1 + 1) / (freqs + norm)).astype(np.float32)
+        return cls(vocabulary, offsets, docs, impacts, count)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.doc_ids.nbytes + self.impacts.nbytes
+
+    def search(self, text, k=5):
+        """
+        (doc ids, BM25 scores) of the best k statements sharing at least one term with `text`.
+        """
+        term_ids = {self.vocabulary[token] for token in tokenize(text) if token in self.vocabulary}
+        if not term_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        scores = np.zeros(self.count, dtype=np.float32)
+        for term in term_ids:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            # A term occurs once per doc in its postings, so fancy-index += is safe
+            scores[self.doc_ids[start:end]] += self.impacts[start:end]
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        ranked = matched[np.argsort(-scores[matched], kind="stable")]
+        return ranked, scores[ranked]
@@ -1,28 +1,59 @@
+"""
+Turn the raw status/statement CSV into the knowledge base the vector builder reads.
+
+The CSV is read in chunks, cleaned with vectorized pandas string operations
+and appended to a JSON Lines file ({"category", "statement"} per line), so
+memory stays flat however large the dataset is:
+    python backend/preprocess_dataset.py --input backend/mental_health_data.csv --output mental_health_knowledge.jsonl
+"""
+import argparse
+import os
+
 import pandas as pd
-import json
 
-# Load the CSV file
-df = pd.read_csv("backend/mental_health_data.csv")
+INPUT_FILE = "backend/mental_health_data.csv"
+OUTPUT_FILE = "mental_health_knowledge.jsonl"
+CHUNK_SIZE = 50000
+
 
-# Drop rows where 'status' or 'statement' is missing
-df = df.dropna(subset=["status", "statement"])
+def clean_chunk(chunk):
+    """
+    Drop missing or empty rows and normalize one chunk into category/statement columns.
+    """
+    chunk = chunk.dropna(subset=["status", "statement"])
+    cleaned = pd.DataFrame({
+        "category": chunk["status"].str.strip().str.lower(),
+        "statement": chunk["statement"].str.strip(),
+    })
+    return cleaned[(cleaned["category"] != "") & (cleaned["statement"] != "")]
 
-# Convert to list of dictionaries for RAG compatibility
-formatted_data = []
 
-for _, row in df.iterrows():
-    category = str(row["status"]).strip().lower()
-    statement = str(row["statement"]).strip()
+def preprocess(input_path, output_path, chunksize=CHUNK_SIZE):
+    """
+    Stream input_path into output_path as JSONL. Returns the number of records written.
+    """
+    tmp_path = f"{output_path}.tmp"
+    written = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        reader = pd.read_csv(input_path, usecols=["status", "statement"], dtype=str, chunksize=chunksize)
+        for chunk in reader:
+            cleaned = clean_chunk(chunk)
+            if cleaned.empty:
+                continue
+            lines = cleaned.to_json(orient="records", lines=True, force_ascii=False)
+            f.write(lines if lines.endswith("\n") else lines + "\n")
+            written += len(cleaned)
+    # Readers never see a half-written file
+    os.replace(tmp_path, output_path)
+    return written
 
-    # Skip empty entries just in case
-    if category and statement:
-        formatted_data.append({
-            "category": category,
-            "statement": statement
-        })
 
-# Save to JSON
-with open("mental_health_knowledge.json", "w") as f:
-    json.dump(formatted_data, f, indent=2)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the raw CSV into the JSONL knowledge base")
+    parser.add_argument("--input", default=INPUT_FILE)
+    parser.add_argument("--output", default=OUTPUT_FILE)
+    parser.add_argument("--chunksize", type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
 
-print("✅ Dataset preprocessing complete. File saved as mental_health_knowledge.json.")
+    count = preprocess(args.input, args.output, args.chunksize)
+    print(f"✅ Dataset preprocessing complete. {count} records saved to {args.output}.")
@@ -0,0 +1,97 @@
+"""
+Append-only segment log used by the vector store builder for checkpoints.
+
+Each checkpoint writes one new segment holding only the vectors embedded
+since the previous checkpoint:
+  segment-000001.f32   - raw float32 block for the new vectors
+  segment-000001.json  - dimension, count and per-row hash/category/statement
+
+The .json file is written last and acts as the commit marker, so a crash
+mid-checkpoint leaves at most an orphaned .f32 that is ignored on resume.
+Entries are keyed by a content hash of the embedded text, which is how the
+builder spots new, edited and removed statements between runs.
+"""
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+SEGMENT_PATTERN = "segment-*.json"
+
+
+def content_hash(category, statement):
+    return hashlib.sha256(f"{category}\x00{statement}".encode("utf-8")).hexdigest()
+
+
+class SegmentLog:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def segments(self):
+        """
+        Committed segment names in append order.
+        """
+        paths = sorted(glob.glob(os.path.join(self.directory, SEGMENT_PATTERN)))
+        return [os.path.splitext(os.path.basename(p))[0] for p in paths]
+
+    def append(self, entries, embeddings):
+        """
+        Write one segment for `entries` ({"hash", "category", "statement"}) and their embeddings.
+        """
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if len(entries) == 0:
+            return None
+        if matrix.ndim != 2 or len(matrix) != len(entries):
+            raise ValueError("Segment entries and embeddings must line up row for row")
+
+        existing = self.segments()
+        number = int(existing[-1].split("-")[1]) + 1 if existing else 1
+        name = f"segment-{number:06d}"
+
+        _write_atomic(os.path.join(self.directory, f"{name}.f32"), matrix.tobytes())
+        _write_atomic(os.path.join(self.directory, f"{name}.json"), json.dumps({
+            "dimension": int(matrix.shape[1]),
+            "count": int(matrix.shape[0]),
+            "hashes": [entry["hash"] for entry in entries],
+            "categories": [entry["category"] for entry in entries],
+            "statements": [entry["statement"] for entry in entries],
+        }, ensure_ascii=False).encode("utf-8"))
+        return name
+
+    def read(self, name):
+        """
+        Return (meta, embeddings) for one committed segment; embeddings are memory-mapped.
+        """
+        with open(os.path.join(self.directory, f"{name}.json")) as f:
+            meta = json.load(f)
+        embeddings = np.memmap(
+            os.path.join(self.directory, f"{name}.f32"),
+            dtype=np.float32,
+            mode="r",
+            shape=(meta["count"], meta["dimension"]),
+        )
+        return meta, embeddings
+
+    def hashes(self):
+        committed = set()
+        for name in self.segments():
+            with open(os.path.join(self.directory, f"{name}.json")) as f:
+                committed.update(json.load(f)["hashes"])
+        return committed
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -1,30 +1,328 @@
+import os
 import pickle
+import threading
+from collections import defaultdict
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+from vector_store import load_store, StatementTable, CategoryColumn
+from ann_index import load_ann_index
+from lexical_index import BM25Index
+
+VECTOR_STORE_PATH = os.getenv("VECTOR_STORE_PATH", "vector_store")
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "exact")  # exact | ivf | hnsw
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "0")) or None  # None = value saved with the index
+HNSW_EF = int(os.getenv("HNSW_EF", "0")) or None
+SEARCH_PRECISION = os.getenv("SEARCH_PRECISION", "float32")  # float32 | float16 | int8 (if the store has it)
+RERANK_FACTOR = int(os.getenv("RERANK_FACTOR", "4"))
+LEXICAL_INDEX = os.getenv("LEXICAL_INDEX", "true").lower() == "true"  # build BM25 over the statements at load
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"  # fuse BM25 with dense results
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))  # per ranking, before fusion
+RRF_K = int(os.getenv("RRF_K", "60"))
+LEGACY_PICKLE_PATH = "vector_store.pkl"
+
+
+class VectorIndex:
+    """
+    In-memory search index over the vector store.
+
+    Embeddings are held as one contiguous, L2-normalized float32 matrix so a
+    query is a single matrix-vector dot product; categories (uint8 codes) and
+    statements (one UTF-8 blob) are columns indexed by row. When the store
+    carries a float16/int8 copy and `precision` selects it, the scan runs over
+    the compact copy and the best k * rerank_factor rows are re-scored
+    against the float32 matrix.
+    """
+
+    def __init__(self, embeddings, statements, categories, normalized=False, quantized=None):
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.size == 0:
+            matrix = matrix.reshape(0, 0)
+        if matrix.ndim != 2:
+            raise ValueError("Expected a 2-D embedding matrix")
+        if not (len(matrix) == len(statements) == len(categories)):
+            raise ValueError("Embeddings, statements and categories must have the same length")
+
+        # Pre-normalized stores (e.g. a memmap) are used as-is so pages stay shared
+        self.matrix = matrix if normalized else _normalize_rows(matrix)
+        if not isinstance(statements, StatementTable):
+            statements = StatementTable.from_strings(list(statements))
+        if not isinstance(categories, CategoryColumn):
+            categories = CategoryColumn.from_values(list(categories))
+        self.statements = statements
+        self.categories = categories
+        # precision -> (compact matrix, per-row scales or None)
+        self.quantized = quantized or {}
+        self.precision = SEARCH_PRECISION if SEARCH_PRECISION in self.quantized else "float32"
+        self.rerank_factor = RERANK_FACTOR
+        # Store header (version, checksum, ...) when loaded from a binary store
+        self.header = None
+        # Optional approximate backend (ann_index.IVFIndex / HNSWIndex); None means exact scan
+        self.ann = None
+        # Optional BM25 index over the statements (lexical_index.BM25Index); None means dense only
+        self.lexical = None
+
+    @classmethod
+    def from_entries(cls, entries):
+        """
+        Build an index from a list of {"category", "statement", "embedding"} dicts.
+        """
+        return cls(
+            [entry["embedding"] for entry in entries],
+            [entry["statement"] for entry in entries],
+            [entry["category"] for entry in entries],
+        )
+
+    @classmethod
+    def from_store(cls, path):
+        """
+        Build an index over a binary vector store without copying its embeddings.
+        """
+        stored = load_store(path)
+        index = cls(
+            stored.embeddings,
+            stored.statements,
+            stored.categories,
+            normalized=stored.header.get("normalized", False),
+            quantized=stored.quantized,
+        )
+        index.header = stored.header
+        return index
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1]
+
+    def search(self, query_embedding, k=5):
+        """
+        Return the top-k results for a single query embedding.
+        """
+        return self.search_many([query_embedding], k)[0]
+
+    def search_many(self, query_embeddings, k=5):
+        """
+        Return the top-k results for each query, computed as one matmul.
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        return [self._results(ids, scores) for ids, scores in self._search_ids(queries, k)]
+
+    def lexical_search(self, text, k=5):
+        """
+        Top-k statements by BM25 alone, with no embedding needed. There is no cosine
+        score to report, so `score` is 0.0 (the kNN vote never trusts these) and the
+        BM25 score is in `lexical_score`.
+        """
+        ids, scores = self.lexical.search(text, k)
+        return [
+            {**result, "score": 0.0, "lexical_score": round(float(score), 3)}
+            for result, score in zip(self._results(ids, np.zeros(len(ids))), scores)
+        ]
+
+    def hybrid_search(self, query_embedding, text, k=5, candidates=HYBRID_CANDIDATES, rrf_k=RRF_K):
+        """
+        Fuse the dense and BM25 rankings by reciprocal rank fusion. Results keep their
+        cosine similarity as `score`, so the kNN vote reads them like dense results.
+        """
+        return self.hybrid_search_many([query_embedding], [text], k, candidates, rrf_k)[0]
+
+    def hybrid_search_many(self, query_embeddings, texts, k=5, candidates=HYBRID_CANDIDATES, rrf_k=RRF_K):
+        """
+        hybrid_search for several queries; the dense side runs as one matrix-matrix search.
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        results = []
+        for query, (dense_ids, _), text in zip(queries, self._search_ids(queries, max(k, candidates)), texts):
+            lexical_ids, _ = self.lexical.search(text, max(k, candidates))
+            fused = defaultdict(float)
+            for ranking in (dense_ids, lexical_ids):
+                for rank, row in enumerate(ranking):
+                    fused[int(row)] += 1.0 / (rrf_k + rank + 1)
+            rows = sorted(fused, key=lambda row: (-fused[row], row))[:k]
+            results.append(self._results(rows, np.asarray(self.matrix[rows]) @ query))
+        return results
+
+    def search_ids(self, query_embedding, k=5):
+        """
+        (row ids, scores) of the top-k rows for one query.
+        """
+        queries = _normalize_rows(np.atleast_2d(np.asarray(query_embedding, dtype=np.float32)))
+        return self._search_ids(queries, k)[0]
+
+    def resident_bytes(self, precision=None):
+        """
+        Bytes the search scans or reads per query path: the scanned matrix plus the columns.
+        """
+        precision = precision or self.precision
+        if precision == "float32":
+            scanned = self.matrix.nbytes
+        else:
+            data, scales = self.quantized[precision]
+            scanned = data.nbytes + (scales.nbytes if scales is not None else 0)
+        return scanned + self.statements.nbytes + self.categories.nbytes
+
+    def warm(self):
+        """
+        Touch one value per page so the scanned matrix is resident before traffic arrives.
+        """
+        scanned = self.matrix if self.precision == "float32" else self.quantized[self.precision][0]
+        flat = np.asarray(scanned).reshape(-1)
+        if flat.size:
+            stride = max(1, 4096 // flat.itemsize)
+            float(flat[::stride].sum())
+
+    def _search_ids(self, queries, k):
+        if self.ann is not None:
+            return [self.ann.search(query, k) for query in queries]
+
+        if self.precision == "float32":
+            similarities = queries @ self.matrix.T
+            indices = _top_k_indices(similarities, k)
+            return [(row_idx, similarities[i][row_idx]) for i, row_idx in enumerate(indices)]
+
+        # Scan the compact copy, then re-rank the best candidates at full precision
+        approximate = self._approximate_scores(queries)
+        candidates = _top_k_indices(approximate, k * self.rerank_factor)
+        results = []
+        for query, rows in zip(queries, candidates):
+            exact = np.asarray(self.matrix[np.sort(rows)]) @ query
+            order = np.argsort(-exact, kind="stable")[:k]
+            results.append((np.sort(rows)[order], exact[order]))
+        return results
+
+    def _approximate_scores(self, queries, chunk_size=16384):
+        data, scales = self.quantized[self.precision]
+        scores = np.empty((len(queries), data.shape[0]), dtype=np.float32)
+        for start in range(0, data.shape[0], chunk_size):
+            block = np.asarray(data[start:start + chunk_size], dtype=np.float32)
+            block_scores = queries @ block.T
+            if scales is not None:
+                block_scores *= scales[start:start + chunk_size]
+            scores[:, start:start + chunk_size] = block_scores
+        return scores
+
+    def _results(self, indices, scores):
+        return [
+            {
+                "statement": self.statements[idx],
+                "category": self.categories[idx],
+                "score": round(float(score), 3),
+            }
+            for idx, score in zip(indices, scores)
+        ]
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k_indices(similarities, k):
+    """
+    Row-wise top-k via argpartition, then sort only the k survivors.
+    """
+    n = similarities.shape[1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty((similarities.shape[0], 0), dtype=np.intp)
+    if k < n:
+        candidates = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(n), (similarities.shape[0], 1))
+    candidate_scores = np.take_along_axis(similarities, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def load_index(path=VECTOR_STORE_PATH, backend=SEARCH_BACKEND):
+    """
+    Open the binary vector store, falling back to the legacy pickle if it has not been converted yet.
+    """
+    if os.path.isdir(path):
+        # Pin one version so the ANN index matches the matrix even if the store is swapped meanwhile
+        path = os.path.realpath(path)
+        index = VectorIndex.from_store(path)
+        if backend != "exact":
+            index.ann = load_ann_index(path, index.matrix, backend=backend, nprobe=IVF_NPROBE, ef=HNSW_EF)
+            if index.ann is None:
+                print(f"⚠️ No {backend} index in {path}, using exact search")
+        return attach_lexical(index)
+
+    print(f"⚠️ No vector store at {path}, loading legacy {LEGACY_PICKLE_PATH} "
+          f"(convert it with: python vector_store.py convert {LEGACY_PICKLE_PATH} {path})")
+    with open(LEGACY_PICKLE_PATH, "rb") as f:
+        return attach_lexical(VectorIndex.from_entries(pickle.load(f)))
+
+
+def attach_lexical(index):
+    if LEXICAL_INDEX:
+        index.lexical = BM25Index.build(index.statements)
+        print(f"📚 BM25 index: {len(index.lexical.vocabulary)} terms, {index.lexical.nbytes / 1024:.0f} KB")
+    return index
+
+
+# The index is loaded once, on first use (or by the startup warm-up) rather than at import
+INDEX = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_index():
+    global INDEX
+    if INDEX is None:
+        with _INDEX_LOCK:
+            if INDEX is None:
+                INDEX = load_index()
+    return INDEX
+
+
+def set_index(index):
+    """
+    Swap in a new index. Requests that already hold the old one keep using it.
+    """
+    global INDEX
+    INDEX = index
 
-# Load vector store from disk
-with open("vector_store.pkl", "rb") as f:
-    VECTOR_STORE = pickle.load(f)
 
 def find_similar_statements(query_embedding, top_k=5):
     """
     Given a query embedding, return the top-k most similar statements.
     """
-    # Extract just the embeddings from the vector store
-    embeddings = np.array([entry["embedding"] for entry in VECTOR_STORE])
+    return get_index().search(query_embedding, k=top_k)
+
+
+def find_similar_statements_many(query_embeddings, top_k=5):
+    """
+    Top-k similar statements for each of several query embeddings, as one matrix-matrix search.
+    """
+    return get_index().search_many(query_embeddings, k=top_k)
+
+
+def find_similar_statements_hybrid(query_embedding, text, top_k=5):
+    """
+    Dense search fused with BM25 over the query text; plain dense search when hybrid is off.
+    """
+    index = get_index()
+    if index.lexical is None or not HYBRID_SEARCH:
+        return index.search(query_embedding, k=top_k)
+    return index.hybrid_search(query_embedding, text, k=top_k)
 
-    # Compute cosine similarity
-    similarities = cosine_similarity([query_embedding], embeddings)[0]
 
-    # Get top k indices sorted by similarity
-    top_indices = np.argsort(similarities)[::-1][:top_k]
+def find_similar_statements_hybrid_many(query_embeddings, texts, top_k=5):
+    """
+    find_similar_statements_hybrid for several queries, with one matrix-matrix dense search.
+    """
+    index = get_index()
+    if index.lexical is None or not HYBRID_SEARCH:
+        return index.search_many(query_embeddings, k=top_k)
+    return index.hybrid_search_many(query_embeddings, texts, k=top_k)
 
-    # Collect top k similar items
-    results = []
-    for idx in top_indices:
-        results.append({
-            "statement": VECTOR_STORE[idx]["statement"],
-            "category": VECTOR_STORE[idx]["category"],
-            "score": round(similarities[idx], 3)
-        })
-    return results
+
+def find_similar_statements_lexical(text, top_k=5):
+    """
+    Zero-network fallback: BM25 only, for when the query cannot be embedded.
+    """
+    index = get_index()
+    if index.lexical is None:
+        raise LookupError("No lexical index loaded")
+    return index.lexical_search(text, k=top_k)
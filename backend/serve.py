@@ -0,0 +1,134 @@
+"""
+Multi-worker deployment with one shared copy of the index:
+    cd backend/
+    python serve.py --workers 4 --host 0.0.0.0 --port 8000
+
+The parent loads the vector store once (with its BM25 / IVF structures),
+publishes it through shared_index and then runs uvicorn workers with
+SHARED_INDEX_MANIFEST set, so each worker maps the published arrays instead
+of loading its own copy. The Gemini client, HTTP pool, embedding cache and
+knowledge-base JSON stay per worker: they are small, and network clients
+must not be shared between processes.
+
+Worker lifecycle is uvicorn's supervisor: a worker that dies is replaced
+(and maps the current generation), SIGHUP restarts every worker, SIGTTIN /
+SIGTTOU add or remove one, SIGINT / SIGTERM shut down, after which the
+parent removes its files. With S3_VECTOR_STORE_PREFIX set the parent also
+polls the store and publishes each new version; workers switch within
+SHARED_INDEX_POLL_INTERVAL and the previous file is unlinked after
+SHARED_INDEX_GRACE seconds.
+"""
+import argparse
+import os
+import threading
+
+import uvicorn
+
+import shared_index
+from kb_refresher import FileSource, Refresher, S3Source, download_store
+from semantic_search import VECTOR_STORE_PATH, load_index
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Same settings main.py reads for hot reload; in this mode the parent does the polling
+BUCKET_NAME = os.getenv("S3_BUCKET_NAME", "mental-health-solver-yatish-0622")
+KB_SOURCE = os.getenv("KB_SOURCE", "s3")
+KB_SOURCE_ROOT = os.getenv("KB_SOURCE_ROOT", ".")
+KB_REFRESH_INTERVAL = float(os.getenv("KB_REFRESH_INTERVAL", "60"))
+S3_VECTOR_STORE_PREFIX = os.getenv("S3_VECTOR_STORE_PREFIX", "")
+VECTOR_STORE_CACHE_DIR = os.getenv("VECTOR_STORE_CACHE_DIR", "/tmp/vector_store_cache")
+
+# Seconds an unpublished generation stays on disk for workers that have not switched yet
+SHARED_INDEX_GRACE = float(os.getenv("SHARED_INDEX_GRACE", "30"))
+
+
+class Publisher:
+    """
+    Owns the published generations: writes new ones and unlinks old ones after a grace period.
+    """
+
+    def __init__(self, directory=shared_index.SHARED_INDEX_DIR, grace=SHARED_INDEX_GRACE):
+        self.directory = directory
+        self.grace = grace
+        self.generation = 0
+        self.published = []
+        self._timers = []
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, shared_index.MANIFEST_FILE)
+
+    def publish(self, index, store_path=None):
+        manifest = shared_index.publish(index, self.directory, self.generation, store_path)
+        if self.published:
+            timer = threading.Timer(self.grace, shared_index.remove_generation, (self.published[-1], self.directory))
+            timer.daemon = True
+            timer.start()
+            self._timers.append(timer)
+        self.published.append(manifest)
+        self.generation += 1
+
+        size = os.path.getsize(os.path.join(self.directory, manifest["data"]))
+        print(f"🧩 Published index generation {manifest['generation']}: {len(index)} rows, "
+              f"{size / 1e6:.1f} MB in {self.directory}")
+        return str(manifest["generation"])
+
+    def close(self):
+        for timer in self._timers:
+            timer.cancel()
+        for manifest in self.published:
+            shared_index.remove_generation(manifest, self.directory)
+        if os.path.exists(self.manifest_path):
+            os.remove(self.manifest_path)
+
+
+def load_and_publish(publisher):
+    """
+    Publish the initial index. Returns the refresher that republishes store updates, or None.
+    """
+    if not S3_VECTOR_STORE_PREFIX:
+        store_path = os.path.realpath(VECTOR_STORE_PATH) if os.path.isdir(VECTOR_STORE_PATH) else None
+        publisher.publish(load_index(store_path or VECTOR_STORE_PATH), store_path)
+        return None
+
+    refresher = Refresher(
+        FileSource(KB_SOURCE_ROOT) if KB_SOURCE == "file" else S3Source(BUCKET_NAME),
+        interval=KB_REFRESH_INTERVAL,
+    )
+
+    def apply_vector_store(header_body):
+        os.makedirs(VECTOR_STORE_CACHE_DIR, exist_ok=True)
+        path = download_store(refresher.source, S3_VECTOR_STORE_PREFIX, header_body, VECTOR_STORE_CACHE_DIR)
+        # The parent's own copy is dropped once published; workers only ever map the shared one
+        return publisher.publish(load_index(path), path)
+
+    refresher.watch("vector_store", f"{S3_VECTOR_STORE_PREFIX}/header.json", apply_vector_store)
+    refresher.poll_once()
+    return refresher
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the backend with several workers sharing one index")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    for path in shared_index.remove_stale():
+        print(f"🧹 Removed stale {path}")
+
+    publisher = Publisher()
+    refresher = load_and_publish(publisher)
+    # uvicorn starts workers fresh (spawn); they find the index through the environment
+    os.environ["SHARED_INDEX_MANIFEST"] = publisher.manifest_path
+    os.environ["SHARED_INDEX_DIR"] = publisher.directory
+    if refresher is not None:
+        refresher.start()
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers,
+                    app_dir=BACKEND_DIR, log_level=args.log_level)
+    finally:
+        if refresher is not None:
+            refresher.stop()
+        publisher.close()
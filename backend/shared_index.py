@@ -0,0 +1,177 @@
+"""
+One copy of the search index shared by every worker process.
+
+serve.py loads the index once in the parent and writes every array a search
+reads into a single file under SHARED_INDEX_DIR (tmpfs /dev/shm when it
+exists):
+  matrix, quantized copies, statement blob/offsets, category codes,
+  IVF centroids and lists, BM25 postings
+A small JSON manifest next to it records the byte layout plus the header,
+category names and BM25 vocabulary. Workers map the file read-only and
+view the arrays in place, so they all share the same physical pages and an
+extra worker does not cost another copy of the index.
+
+Each publish is a new generation (a new data file, then the manifest is
+swapped atomically); the old file can be unlinked while workers still map it.
+"""
+import glob
+import json
+import mmap
+import os
+import tempfile
+
+import numpy as np
+
+from ann_index import IVFIndex, load_ann_index
+from lexical_index import BM25Index
+from semantic_search import HNSW_EF, VectorIndex
+from vector_store import CategoryColumn, StatementTable
+
+SHARED_INDEX_DIR = os.getenv("SHARED_INDEX_DIR") or ("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+MANIFEST_FILE = "shared_index.json"
+DATA_PREFIX = "shared_index"
+ALIGNMENT = 64  # bytes; keeps every array cache-line aligned within the file
+
+
+def index_arrays(index):
+    """
+    Every array a search reads, by name.
+    """
+    arrays = {
+        "matrix": index.matrix,
+        "statements.blob": index.statements.blob,
+        "statements.offsets": index.statements.offsets,
+        "categories.codes": index.categories.codes,
+    }
+    for precision, (data, scales) in index.quantized.items():
+        arrays[f"quantized.{precision}"] = data
+        if scales is not None:
+            arrays[f"quantized.{precision}.scales"] = scales
+    if isinstance(index.ann, IVFIndex):
+        arrays["ivf.centroids"] = index.ann.centroids
+        arrays["ivf.list_offsets"] = index.ann.list_offsets
+        arrays["ivf.list_ids"] = index.ann.list_ids
+    if index.lexical is not None:
+        arrays["bm25.offsets"] = index.lexical.offsets
+        arrays["bm25.doc_ids"] = index.lexical.doc_ids
+        arrays["bm25.impacts"] = index.lexical.impacts
+    return arrays
+
+
+def publish(index, directory=SHARED_INDEX_DIR, generation=0, store_path=None):
+    """
+    Write the index for workers to map and point the manifest at it. Returns the manifest.
+
+    `store_path` lets workers load an HNSW graph themselves; hnswlib keeps it in
+    its own heap, so that backend cannot be shared.
+    """
+    os.makedirs(directory, exist_ok=True)
+    data_file = f"{DATA_PREFIX}-{os.getpid()}-{generation}.bin"
+    layout, offset = {}, 0
+    tmp_path = os.path.join(directory, data_file + ".tmp")
+    with open(tmp_path, "wb") as f:
+        for name, array in index_arrays(index).items():
+            array = np.ascontiguousarray(array)
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            f.seek(offset)
+            array.tofile(f)
+            layout[name] = {"offset": offset, "dtype": array.dtype.str, "shape": list(array.shape)}
+            offset += array.nbytes
+    os.replace(tmp_path, os.path.join(directory, data_file))
+
+    manifest = {
+        "generation": generation,
+        "pid": os.getpid(),
+        "data": data_file,
+        "arrays": layout,
+        "header": index.header,
+        "categories": index.categories.names,
+        "quantizations": sorted(index.quantized),
+        "ann": getattr(index.ann, "name", None),
+        "ivf_nprobe": getattr(index.ann, "nprobe", None),
+        "store_path": store_path,
+        "lexical_count": len(index.lexical) if index.lexical is not None else None,
+        "vocabulary": sorted(index.lexical.vocabulary, key=index.lexical.vocabulary.get)
+        if index.lexical is not None else None,
+    }
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f)
+    # Workers polling the manifest never see a half-written one
+    os.replace(manifest_path + ".tmp", manifest_path)
+    return manifest
+
+
+def attach(manifest, directory=SHARED_INDEX_DIR):
+    """
+    Read-only VectorIndex over a published generation. Only the BM25 vocabulary dict is copied.
+    """
+    with open(os.path.join(directory, manifest["data"]), "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        # One read-only mapping for the whole file; the arrays below are views into it
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+    arrays = {}
+    for name, spec in manifest["arrays"].items():
+        dtype, shape = np.dtype(spec["dtype"]), tuple(spec["shape"])
+        count = int(np.prod(shape, dtype=np.int64))
+        arrays[name] = np.frombuffer(buffer, dtype=dtype, count=count, offset=spec["offset"] if count else 0).reshape(shape)
+    quantized = {
+        precision: (arrays[f"quantized.{precision}"], arrays.get(f"quantized.{precision}.scales"))
+        for precision in manifest["quantizations"]
+    }
+    index = VectorIndex(
+        arrays["matrix"],
+        StatementTable(arrays["statements.blob"], arrays["statements.offsets"]),
+        CategoryColumn(arrays["categories.codes"], manifest["categories"]),
+        normalized=True,
+        quantized=quantized,
+    )
+    index.header = manifest["header"]
+
+    if "ivf.centroids" in arrays:
+        index.ann = IVFIndex(
+            index.matrix, arrays["ivf.centroids"], arrays["ivf.list_offsets"], arrays["ivf.list_ids"],
+            nprobe=manifest["ivf_nprobe"],
+        )
+    elif manifest["ann"] == "hnsw" and manifest["store_path"]:
+        index.ann = load_ann_index(manifest["store_path"], index.matrix, backend="hnsw", ef=HNSW_EF)
+
+    if "bm25.offsets" in arrays:
+        index.lexical = BM25Index(
+            {term: term_id for term_id, term in enumerate(manifest["vocabulary"])},
+            arrays["bm25.offsets"], arrays["bm25.doc_ids"], arrays["bm25.impacts"], manifest["lexical_count"],
+        )
+    return index
+
+
+def remove_generation(manifest, directory=SHARED_INDEX_DIR):
+    """
+    Unlink a generation's data file. Workers that still map it keep valid pages until they let go.
+    """
+    try:
+        os.remove(os.path.join(directory, manifest["data"]))
+    except FileNotFoundError:
+        pass
+
+
+def remove_stale(directory=SHARED_INDEX_DIR):
+    """
+    Delete data files left behind by parents that are no longer running. Returns the paths removed.
+    """
+    removed = []
+    for path in glob.glob(os.path.join(directory, f"{DATA_PREFIX}-*.bin*")):
+        pid = os.path.basename(path)[len(DATA_PREFIX) + 1:].split("-", 1)[0]
+        if pid.isdigit() and not _pid_alive(int(pid)):
+            os.remove(path)
+            removed.append(path)
+    return removed
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
@@ -0,0 +1,111 @@
+"""
+Startup subsystem: background loading behind a readiness gate.
+
+Heavy resources (the S3 knowledge base, the vector index, the Gemini client)
+are registered with a loader and loaded on daemon threads once the app
+starts, so FastAPI can accept connections immediately. Request handlers
+wait on the gate (bounded by a timeout) instead of module import doing the
+work up front. A failed load is retried with exponential backoff, and a
+resource with an `is_loaded` check is ready as soon as something else
+(e.g. a refresher) has loaded it, so one failed first attempt does not keep
+the worker answering 503.
+"""
+import asyncio
+import threading
+import time
+
+
+class BackgroundResource:
+    def __init__(self, name, loader, is_loaded=None, retry_base=2.0, max_backoff=60.0):
+        self.name = name
+        self.loader = loader
+        self.is_loaded = is_loaded
+        self.retry_base = retry_base
+        self.max_backoff = max_backoff
+        # Set after the first attempt, successful or not, so waiters are not held past it
+        self.ready = threading.Event()
+        self.error = None
+        self.load_seconds = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._load, name=f"load-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _load(self):
+        failures = 0
+        while True:
+            start = time.perf_counter()
+            try:
+                self.loader()
+                self.error = None
+                return
+            except Exception as e:
+                self.error = e
+                failures += 1
+                delay = min(self.retry_base * (2 ** (failures - 1)), self.max_backoff)
+                print(f"❌ Failed to load {self.name}: {e} (retrying in {delay:.0f}s)")
+            finally:
+                self.load_seconds = round(time.perf_counter() - start, 3)
+                self.ready.set()
+
+            time.sleep(delay)
+            if self.is_loaded is not None and self.is_loaded():
+                self.error = None
+                return
+
+    @property
+    def loaded(self):
+        if not self.ready.is_set():
+            return False
+        if self.is_loaded is not None and self.is_loaded():
+            return True
+        return self.error is None
+
+    def status(self):
+        loaded = self.loaded
+        return {
+            "ready": loaded,
+            "error": str(self.error) if self.error and not loaded else None,
+            "load_seconds": self.load_seconds,
+        }
+
+
+class Startup:
+    def __init__(self):
+        self.resources = {}
+
+    def register(self, name, loader, is_loaded=None):
+        """
+        `is_loaded()` reports whether the resource is available however it got loaded.
+        """
+        self.resources[name] = BackgroundResource(name, loader, is_loaded)
+
+    def start(self):
+        for resource in self.resources.values():
+            resource.start()
+
+    def is_ready(self):
+        return all(r.loaded for r in self.resources.values())
+
+    def wait(self, timeout=None):
+        """
+        Block until every resource has finished loading; returns is_ready().
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for resource in self.resources.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            resource.ready.wait(remaining)
+        return self.is_ready()
+
+    async def wait_async(self, timeout=None):
+        if self.is_ready():
+            return True
+        return await asyncio.to_thread(self.wait, timeout)
+
+    def status(self):
+        return {name: resource.status() for name, resource in self.resources.items()}
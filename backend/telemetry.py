@@ -0,0 +1,380 @@
+"""
+Request telemetry: per-stage timing spans, Prometheus metrics, structured logs,
+optional OTLP trace export and an on-demand sampling profiler.
+
+  span(stage)          - times a block into analyze_stage_seconds{stage} and the
+                         request's Server-Timing header (plus an OTel span when
+                         OTLP export is on)
+  REGISTRY.render()    - Prometheus text exposition for GET /metrics
+  log_event(...)       - one JSON line per event, so CloudWatch can filter on fields
+  TelemetryMiddleware  - request ids, request duration histogram, Server-Timing,
+                         and the X-Profile header hook
+
+Metrics live in-process without extra dependencies. OTLP export needs
+opentelemetry-sdk and opentelemetry-exporter-otlp-proto-http and is only
+imported when OTEL_EXPORTER_OTLP_ENDPOINT is set; with it unset a span costs
+two perf_counter calls and a dict update.
+"""
+import asyncio
+import contextvars
+import json
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "mental-health-solver")
+
+# Sampling profiler, enabled per request with `X-Profile: <PROFILE_TOKEN>`; off when the token is empty
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/profiles")
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Stage durations of the current request, shared by reference with the middleware
+_timings = contextvars.ContextVar("timings", default=None)
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class CounterMetric(Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.values = defaultdict(float)
+
+    def inc(self, amount=1.0, **labels):
+        with self._lock:
+            self.values[self._key(labels)] += amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self.series.items())
+        lines = []
+        names = self.labelnames + ("le",)
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(names, key + (bound,))} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(names, key + ('+Inf',))} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    """
+    Values read from existing state at scrape time: `collect()` returns [(labels dict, value), ...].
+    """
+
+    def __init__(self, name, documentation, kind, collect, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self):
+        return [
+            f"{self.name}{_format_labels(self.labelnames, self._key(labels))} {float(value)}"
+            for labels, value in self.collect()
+        ]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(CounterMetric(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name, documentation, kind, collect, labelnames=()):
+        return self.register(CallbackMetric(name, documentation, kind, collect, labelnames))
+
+    def render(self):
+        blocks = []
+        for metric in self.metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                log_event("metrics_error", level="warning", metric=metric.name, error=str(e))
+        return "\n".join(blocks) + "\n"
+
+
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "path", "status")
+)
+STAGE_SECONDS = REGISTRY.histogram(
+    "analyze_stage_seconds", "Latency of each pipeline stage", ("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "analyze_stage_errors_total", "Pipeline stages that raised (including timeouts)", ("stage",)
+)
+
+# OTel tracer, set by setup_otlp(); None keeps spans on the cheap path
+_tracer = None
+
+
+def setup_otlp(endpoint=OTLP_ENDPOINT, service_name=SERVICE_NAME):
+    """
+    Export spans over OTLP/HTTP when an endpoint is configured and the SDK is installed.
+    """
+    global _tracer
+    if not endpoint:
+        return False
+    try:
+        from opentelemetry import trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        print("⚠️ OTEL_EXPORTER_OTLP_ENDPOINT is set but opentelemetry-sdk / the OTLP exporter are not installed")
+        return False
+
+    provider = TracerProvider(resource=Resource.create({"service.name": service_name}))
+    # The exporter reads OTEL_EXPORTER_OTLP_ENDPOINT / _HEADERS itself
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    trace.set_tracer_provider(provider)
+    _tracer = trace.get_tracer("mental-health-solver")
+    print(f"📡 Exporting traces to {endpoint}")
+    return True
+
+
+@contextmanager
+def span(stage, **attributes):
+    """
+    Time a pipeline stage. Nested or repeated stages accumulate in the request's timings.
+    """
+    if not METRICS_ENABLED:
+        yield
+        return
+
+    if _tracer is None:
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            STAGE_ERRORS.inc(stage=stage)
+            raise
+        finally:
+            _record(stage, time.perf_counter() - start)
+        return
+
+    with _tracer.start_as_current_span(stage, attributes=attributes):
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            STAGE_ERRORS.inc(stage=stage)
+            raise
+        finally:
+            _record(stage, time.perf_counter() - start)
+
+
+def _record(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def current_timings():
+    """
+    Stage durations (ms) recorded so far for the current request.
+    """
+    return {stage: round(seconds * 1000, 3) for stage, seconds in (_timings.get() or {}).items()}
+
+
+def log_event(event, level="info", **fields):
+    """
+    Write one structured JSON log line (request id included when inside a request).
+    """
+    record = {"ts": round(time.time(), 3), "level": level, "event": event}
+    request_id = _request_id.get()
+    if request_id is not None:
+        record["request_id"] = request_id
+    record.update(fields)
+    print(json.dumps(record, default=str), flush=True)
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every other thread every `interval` seconds into folded
+    stacks ("thread;outer;...;inner count"), the input format of flamegraph tools.
+
+    Samples are process-wide, so concurrent requests show up too; profile on a quiet instance.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def _run(self):
+        own = threading.get_ident()
+        names = {}
+        while not self._stop.wait(self.interval):
+            names.update((t.ident, t.name) for t in threading.enumerate())
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.folded())
+        return path
+
+
+class TelemetryMiddleware:
+    """
+    ASGI middleware: assigns a request id, records request latency, adds Server-Timing
+    with the stage durations, and runs the sampling profiler when asked to via X-Profile.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._paths = None
+
+    def _path_label(self, scope):
+        # Label by route so unknown paths cannot blow up series cardinality
+        if self._paths is None:
+            self._paths = {getattr(route, "path", None) for route in scope["app"].routes}
+        return scope["path"] if scope["path"] in self._paths else "other"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        request_id = headers.get(b"x-request-id", b"").decode("latin-1")
+        # Client-supplied ids end up in log lines and profile file names
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        timings = {}
+        _timings.set(timings)
+        _request_id.set(request_id)
+
+        profiler = None
+        if PROFILE_TOKEN and headers.get(b"x-profile", b"").decode("latin-1") == PROFILE_TOKEN:
+            profiler = SamplingProfiler().start()
+
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                extra = [(b"x-request-id", request_id.encode("latin-1"))]
+                if timings:
+                    server_timing = ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+                    extra.append((b"server-timing", server_timing.encode("latin-1")))
+                if profiler is not None:
+                    extra.append((b"x-profile-id", request_id.encode("latin-1")))
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            elapsed = time.perf_counter() - start
+            REQUEST_SECONDS.observe(elapsed, method=scope["method"], path=self._path_label(scope), status=status)
+            if profiler is not None:
+                # Joining the sampler thread and writing the file would otherwise block the event loop
+                path = await asyncio.to_thread(
+                    lambda: profiler.stop().save(os.path.join(PROFILE_DIR, f"{request_id}.folded"))
+                )
+                log_event("profile_saved", path=path, samples=profiler.samples, duration_ms=round(elapsed * 1000, 3))
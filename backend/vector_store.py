@@ -0,0 +1,553 @@
+"""
+Binary on-disk format for the vector store.
+
+A store is a directory holding:
+  header.json      - format/store version, dimension, count, model name, category
+                     names, the quantized copies that were written, and the size
+                     and sha256 of every other file plus a checksum over them all
+  embeddings.f32   - raw row-major float32 block, L2-normalized, opened with np.memmap
+  categories.u8    - one uint8 category code per row (names live in the header)
+  statements.bin   - all statements as one UTF-8 blob
+  statements.idx   - uint64 offsets into the blob (count + 1 entries)
+  embeddings.f16   - optional float16 copy of the embeddings
+  embeddings.i8    - optional int8 copy, scalar-quantized per row ...
+  scales.f32       - ... with one float32 scale per row
+
+The path a reader opens is a symlink into `<path>.versions/`. A write builds a
+new version directory and atomically replaces the symlink, so readers see the
+old store or the new one and never a missing one; the previous version is
+kept for readers that resolved the link just before the swap. A version that
+only adds rows (StoreWriter.extending) hard-links the previous version's files
+and appends to them; every version reads just the byte lengths its own header
+records, so the bytes appended later are invisible to it.
+
+Everything is mapped read-only, so worker processes share pages through the
+OS page cache and load time does not grow with the dataset. With a quantized
+copy the search scans the small matrix and only touches the float32 rows it
+re-ranks.
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import time
+from collections import namedtuple
+
+import numpy as np
+
+FORMAT_VERSION = 2
+HEADER_FILE = "header.json"
+EMBEDDINGS_FILE = "embeddings.f32"
+CATEGORIES_FILE = "categories.u8"
+STATEMENTS_FILE = "statements.bin"
+STATEMENT_OFFSETS_FILE = "statements.idx"
+FLOAT16_FILE = "embeddings.f16"
+INT8_FILE = "embeddings.i8"
+INT8_SCALES_FILE = "scales.f32"
+RECORDS_FILE = "records.json"  # format version 1 only
+DEFAULT_MODEL = "models/embedding-001"
+VERSIONS_SUFFIX = ".versions"
+KEEP_VERSIONS = 2  # the served version plus the one before it
+
+QUANTIZATIONS = ("float16", "int8")
+QUANTIZED_FILES = {"float16": (FLOAT16_FILE,), "int8": (INT8_FILE, INT8_SCALES_FILE)}
+STORE_FILES = (EMBEDDINGS_FILE, CATEGORIES_FILE, STATEMENTS_FILE, STATEMENT_OFFSETS_FILE)
+
+StoredVectors = namedtuple("StoredVectors", ["header", "embeddings", "statements", "categories", "quantized"])
+
+
+class StoreFormatError(ValueError):
+    pass
+
+
+class StatementTable:
+    """
+    Statements as one UTF-8 blob plus offsets; rows are decoded on access.
+    """
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode("utf-8") for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return bytes(self.blob[int(self.offsets[row]):int(self.offsets[row + 1])]).decode("utf-8")
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    @property
+    def nbytes(self):
+        return self.blob.nbytes + self.offsets.nbytes
+
+
+class CategoryColumn:
+    """
+    Interned categories: a uint8 code per row plus the list of names.
+    """
+
+    def __init__(self, codes, names):
+        self.codes = codes
+        self.names = list(names)
+
+    @classmethod
+    def from_values(cls, values):
+        names = sorted(set(values))
+        if len(names) > 256:
+            raise StoreFormatError("At most 256 categories fit in uint8 codes")
+        lookup = {name: code for code, name in enumerate(names)}
+        return cls(np.fromiter((lookup[v] for v in values), dtype=np.uint8, count=len(values)), names)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, row):
+        return self.names[self.codes[row]]
+
+    def __iter__(self):
+        return (self.names[code] for code in self.codes)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+def quantize_int8(matrix):
+    """
+    Symmetric per-row int8 quantization. Returns (codes, scales) with row ~= codes * scale.
+    """
+    scales = np.abs(matrix).max(axis=1, initial=0.0) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class StoreWriter:
+    """
+    Write a new store version block by block, so a build never has to hold every row.
+
+    Rows are L2-normalized as they are appended; category codes are assigned in
+    first-seen order unless `categories` fixes the names up front. `commit`
+    writes the header and swaps the version in; leaving the `with` block
+    without committing discards it.
+    """
+
+    def __init__(self, path, dimension, model=DEFAULT_MODEL, version=1, quantizations=(), categories=(), _base=None):
+        unknown = set(quantizations) - set(QUANTIZATIONS)
+        if unknown:
+            raise StoreFormatError(f"Unknown quantization: {', '.join(sorted(unknown))}")
+        self.path = path
+        self.dimension = dimension
+        self.model = model
+        self.version = version
+        self.quantizations = [q for q in QUANTIZATIONS if q in quantizations]
+        self.names = []
+        self.codes = {}
+        for name in categories:
+            self._code(name)
+        self.count = 0
+        self.blob_bytes = 0
+
+        self.tmp_path = _new_version_dir(path, version)
+        file_names = list(STORE_FILES)
+        for quantization in self.quantizations:
+            file_names.extend(QUANTIZED_FILES[quantization])
+        self.files = {}
+        if _base is None:
+            for name in file_names:
+                self.files[name] = open(os.path.join(self.tmp_path, name), "wb")
+            np.zeros(1, dtype=np.uint64).tofile(self.files[STATEMENT_OFFSETS_FILE])
+            return
+
+        base_path, base_header = _base
+        for name in file_names:
+            file_path = os.path.join(self.tmp_path, name)
+            os.link(os.path.join(base_path, name), file_path)
+            f = self.files[name] = open(file_path, "r+b")
+            # Drop anything an abandoned build appended past the base version's rows
+            f.truncate(base_header["files"][name]["bytes"])
+            f.seek(0, os.SEEK_END)
+        self.count = base_header["count"]
+        self.blob_bytes = base_header["files"][STATEMENTS_FILE]["bytes"]
+
+    @classmethod
+    def extending(cls, path, version):
+        """
+        Writer for a version that keeps every row of the served store and appends new ones,
+        without rewriting the served rows. Raises StoreFormatError for a store without
+        per-file sizes, which has to be rewritten once, and when the served version is not
+        the newest one: its files share inodes with the newer versions, which the extension
+        would truncate.
+        """
+        base_path = os.path.realpath(path)
+        header = read_header(base_path)
+        if header["format_version"] != FORMAT_VERSION or "files" not in header:
+            raise StoreFormatError(f"{path} predates appendable stores; rebuild it in full")
+        if base_path != latest_version(path):
+            raise StoreFormatError(f"{path} is not its newest version; rebuild it in full")
+        return cls(
+            path,
+            header["dimension"],
+            model=header["model"],
+            version=version,
+            quantizations=header.get("quantizations", []),
+            categories=header["categories"],
+            _base=(base_path, header),
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        if self.files is not None:
+            self.abort()
+
+    def append(self, embeddings, statements, categories):
+        matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if matrix.size == 0:
+            matrix = matrix.reshape(0, self.dimension)
+        if matrix.ndim != 2 or matrix.shape[1] != self.dimension:
+            raise StoreFormatError(f"Expected rows of dimension {self.dimension}")
+        if not (len(matrix) == len(statements) == len(categories)):
+            raise StoreFormatError("Embeddings, statements and categories must line up row for row")
+
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix = matrix / norms
+
+        codes = np.fromiter((self._code(c) for c in categories), dtype=np.uint8, count=len(categories))
+        encoded = [s.encode("utf-8") for s in statements]
+        offsets = self.blob_bytes + np.cumsum([len(e) for e in encoded], dtype=np.uint64)
+
+        matrix.tofile(self.files[EMBEDDINGS_FILE])
+        codes.tofile(self.files[CATEGORIES_FILE])
+        self.files[STATEMENTS_FILE].write(b"".join(encoded))
+        offsets.astype(np.uint64).tofile(self.files[STATEMENT_OFFSETS_FILE])
+        if "float16" in self.quantizations:
+            matrix.astype(np.float16).tofile(self.files[FLOAT16_FILE])
+        if "int8" in self.quantizations:
+            int8_codes, scales = quantize_int8(matrix)
+            int8_codes.tofile(self.files[INT8_FILE])
+            scales.tofile(self.files[INT8_SCALES_FILE])
+
+        self.count += len(matrix)
+        self.blob_bytes += sum(len(e) for e in encoded)
+
+    def commit(self, before_swap=None):
+        """
+        Finish the version, swap it in and return its header. `before_swap(version_path)`
+        runs once the version is complete but not yet served, e.g. to build its ANN index.
+        """
+        self._close()
+        header = {
+            "format_version": FORMAT_VERSION,
+            "version": self.version,
+            "dtype": "float32",
+            "dimension": int(self.dimension),
+            "count": int(self.count),
+            "model": self.model,
+            "normalized": True,
+            "categories": self.names,
+            "quantizations": self.quantizations,
+        }
+        header["files"] = {
+            name: {
+                "bytes": os.path.getsize(os.path.join(self.tmp_path, name)),
+                "sha256": _checksum(os.path.join(self.tmp_path, name)),
+            }
+            for name in store_files(header)
+        }
+        header["checksum"] = _combined_checksum(header["files"])
+        with open(os.path.join(self.tmp_path, HEADER_FILE), "w") as f:
+            json.dump(header, f, indent=2)
+
+        if before_swap is not None:
+            before_swap(self.tmp_path)
+        _swap_into_place(self.tmp_path, self.path)
+        return header
+
+    def abort(self):
+        self._close()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def _code(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            if len(self.names) == 256:
+                raise StoreFormatError("At most 256 categories fit in uint8 codes")
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def _close(self):
+        for f in (self.files or {}).values():
+            f.close()
+        self.files = None
+
+
+def write_store(path, embeddings, statements, categories, model=DEFAULT_MODEL, version=1, quantizations=()):
+    """
+    Write a vector store as a new version directory and atomically point `path` at it.
+    `quantizations` selects extra compact copies of the embeddings ("float16", "int8").
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if matrix.size == 0:
+        matrix = matrix.reshape(0, 0)
+    if matrix.ndim != 2 or not (len(matrix) == len(statements) == len(categories)):
+        raise StoreFormatError("Embeddings, statements and categories must line up row for row")
+
+    with StoreWriter(path, matrix.shape[1], model, version, quantizations, categories=sorted(set(categories))) as writer:
+        writer.append(matrix, statements, categories)
+        return writer.commit()
+
+
+def read_header(path):
+    with open(os.path.join(path, HEADER_FILE)) as f:
+        header = json.load(f)
+    if header.get("format_version") not in (1, FORMAT_VERSION):
+        raise StoreFormatError(f"Unsupported vector store format: {header.get('format_version')}")
+    return header
+
+
+def store_files(header):
+    """
+    Files that make up a store with this header (header.json excluded).
+    """
+    if header["format_version"] == 1:
+        return [EMBEDDINGS_FILE, RECORDS_FILE]
+    files = list(STORE_FILES)
+    for quantization in header.get("quantizations", []):
+        files.extend(QUANTIZED_FILES[quantization])
+    return files
+
+
+def load_store(path, verify=False):
+    """
+    Open a vector store. Every column comes back memory-mapped read-only.
+    """
+    # Resolve the symlink once so a concurrent swap cannot mix files from two versions
+    path = os.path.realpath(path)
+    header = read_header(path)
+    if verify:
+        verify_store(path, header)
+
+    count, dimension = header["count"], header["dimension"]
+    embeddings = _map(path, EMBEDDINGS_FILE, np.float32, (count, dimension))
+
+    if header["format_version"] == 1:
+        with open(os.path.join(path, RECORDS_FILE)) as f:
+            records = json.load(f)
+        names = records["categories"]
+        statements = StatementTable.from_strings(records["statements"])
+        categories = CategoryColumn(np.asarray(records["category_codes"], dtype=np.uint8), names)
+        return StoredVectors(header, embeddings, statements, categories, {})
+
+    blob_bytes = header["files"][STATEMENTS_FILE]["bytes"] if "files" in header else None
+    statements = StatementTable(
+        _map(path, STATEMENTS_FILE, np.uint8, (blob_bytes,) if blob_bytes is not None else None),
+        _map(path, STATEMENT_OFFSETS_FILE, np.uint64, (count + 1,)),
+    )
+    categories = CategoryColumn(_map(path, CATEGORIES_FILE, np.uint8, (count,)), header["categories"])
+
+    quantized = {}
+    if "float16" in header.get("quantizations", []):
+        quantized["float16"] = (_map(path, FLOAT16_FILE, np.float16, (count, dimension)), None)
+    if "int8" in header.get("quantizations", []):
+        quantized["int8"] = (
+            _map(path, INT8_FILE, np.int8, (count, dimension)),
+            _map(path, INT8_SCALES_FILE, np.float32, (count,)),
+        )
+
+    return StoredVectors(header, embeddings, statements, categories, quantized)
+
+
+def verify_store(path, header):
+    """
+    Check every file against the sizes and digests in the header; raises StoreFormatError.
+    A file may be longer than recorded when a later version appended to it; only the
+    recorded bytes belong to this version. Stores written before per-file digests
+    only carry a checksum of embeddings.f32.
+    """
+    files = header.get("files")
+    if files is None:
+        embeddings_path = os.path.join(path, EMBEDDINGS_FILE)
+        if "sha256:" + _checksum(embeddings_path) != header["checksum"]:
+            raise StoreFormatError(f"Checksum mismatch for {embeddings_path}")
+        return
+
+    missing = set(store_files(header)) - set(files)
+    if missing:
+        raise StoreFormatError(f"No digest recorded for {', '.join(sorted(missing))}")
+    for name, expected in files.items():
+        file_path = os.path.join(path, name)
+        if not os.path.exists(file_path) or os.path.getsize(file_path) < expected["bytes"]:
+            raise StoreFormatError(f"Size mismatch for {file_path}")
+        if _checksum(file_path, expected["bytes"]) != expected["sha256"]:
+            raise StoreFormatError(f"Checksum mismatch for {file_path}")
+    if _combined_checksum(files) != header["checksum"]:
+        raise StoreFormatError(f"Header checksum does not match the file digests in {path}")
+
+
+def convert_pickle(pickle_path, store_path, model=DEFAULT_MODEL, quantizations=()):
+    """
+    One-shot conversion of a legacy vector_store.pkl (list of dicts) into the binary format.
+    """
+    with open(pickle_path, "rb") as f:
+        entries = pickle.load(f)
+
+    header = write_store(
+        store_path,
+        [entry["embedding"] for entry in entries],
+        [entry["statement"] for entry in entries],
+        [entry["category"] for entry in entries],
+        model=model,
+        quantizations=quantizations,
+    )
+    load_store(store_path, verify=True)
+    return header
+
+
+def benchmark(path, k=5, queries=500, rerank_factor=4):
+    """
+    Resident bytes per vector, recall@k against exact float32 search and per-query
+    latency for each precision the store carries.
+    """
+    from semantic_search import VectorIndex
+
+    index = VectorIndex.from_store(path)
+    rng = np.random.default_rng(0)
+    sample = rng.choice(len(index), size=min(queries, len(index)), replace=False)
+    # Perturb stored rows so queries are near, but not identical to, the corpus
+    query_matrix = np.asarray(index.matrix[sample]) + rng.normal(0, 0.02, (len(sample), index.dimension))
+    query_matrix = query_matrix.astype(np.float32)
+
+    exact = None
+    report = {"count": len(index), "dimension": index.dimension, "k": k, "precisions": []}
+    for precision in ["float32"] + list(index.quantized):
+        index.precision = precision
+        index.rerank_factor = rerank_factor
+        start = time.perf_counter()
+        results = [index.search_ids(q, k) for q in query_matrix]
+        elapsed = time.perf_counter() - start
+        found = [set(ids.tolist()) for ids, _ in results]
+        if exact is None:
+            exact = found
+
+        hits = sum(len(f & e) for f, e in zip(found, exact))
+        report["precisions"].append({
+            "precision": precision,
+            "bytes_per_vector": round(index.resident_bytes(precision) / max(1, len(index)), 1),
+            "recall": round(hits / max(1, sum(len(e) for e in exact)), 4),
+            "mean_ms": round(elapsed / len(query_matrix) * 1000, 4),
+        })
+    return report
+
+
+def _map(path, file_name, dtype, shape):
+    file_path = os.path.join(path, file_name)
+    if os.path.getsize(file_path) == 0 or (shape is not None and 0 in shape):
+        return np.empty(shape if shape is not None else (0,), dtype=dtype)
+    return np.memmap(file_path, dtype=dtype, mode="r", shape=shape)
+
+
+def _checksum(file_path, limit=None, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    remaining = limit if limit is not None else float("inf")
+    with open(file_path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(int(min(chunk_size, remaining)))
+            if not chunk:
+                break
+            digest.update(chunk)
+            remaining -= len(chunk)
+    return digest.hexdigest()
+
+
+def _new_version_dir(path, version):
+    versions = f"{path}{VERSIONS_SUFFIX}"
+    # Zero-padded timestamps sort in creation order
+    version_path = os.path.join(versions, f"{time.time_ns():020d}-v{version}")
+    os.makedirs(version_path)
+    return version_path
+
+
+def _committed_versions(versions):
+    # Version directories with a header, oldest first; the rest are still being written or were abandoned
+    if not os.path.isdir(versions):
+        return []
+    return sorted(name for name in os.listdir(versions) if os.path.exists(os.path.join(versions, name, HEADER_FILE)))
+
+
+def latest_version(path):
+    """
+    Real path of the newest committed version of the store at `path`, or None.
+    """
+    committed = _committed_versions(f"{path}{VERSIONS_SUFFIX}")
+    return os.path.realpath(os.path.join(f"{path}{VERSIONS_SUFFIX}", committed[-1])) if committed else None
+
+
+def _combined_checksum(files):
+    # One identifier for the whole store: a digest over the per-file digests
+    digest = hashlib.sha256()
+    for name in sorted(files):
+        digest.update(f"{name}:{files[name]['bytes']}:{files[name]['sha256']}\n".encode("utf-8"))
+    return "sha256:" + digest.hexdigest()
+
+
+def _swap_into_place(version_path, path):
+    """
+    Point the `path` symlink at `version_path` with a single os.replace, then prune old versions.
+    """
+    versions = os.path.dirname(version_path)
+    if os.path.isdir(path) and not os.path.islink(path):
+        # One-time migration of a store written before versioning; readers opening
+        # `path` during this single rename get FileNotFoundError and must retry
+        os.rename(path, os.path.join(versions, f"{0:020d}-legacy"))
+
+    link_tmp = f"{path}.link.tmp"
+    if os.path.lexists(link_tmp):
+        os.remove(link_tmp)
+    os.symlink(os.path.relpath(os.path.abspath(version_path), os.path.dirname(os.path.abspath(path))), link_tmp)
+    os.replace(link_tmp, path)
+
+    # Only committed versions: a concurrent build may still be filling a directory here
+    current = os.path.basename(version_path)
+    older = [name for name in _committed_versions(versions) if name != current]
+    for name in older[:len(older) - (KEEP_VERSIONS - 1)]:
+        shutil.rmtree(os.path.join(versions, name), ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vector store tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    convert = commands.add_parser("convert", help="Convert a legacy vector_store.pkl")
+    convert.add_argument("pickle_path")
+    convert.add_argument("store_path")
+    convert.add_argument("--quantize", nargs="*", choices=QUANTIZATIONS, default=[])
+
+    bench = commands.add_parser("benchmark", help="Bytes per vector and recall impact per precision")
+    bench.add_argument("store_path")
+    bench.add_argument("--k", type=int, default=5)
+    bench.add_argument("--queries", type=int, default=500)
+    bench.add_argument("--rerank-factor", type=int, default=4)
+
+    args = parser.parse_args()
+    if args.command == "convert":
+        header = convert_pickle(args.pickle_path, args.store_path, quantizations=args.quantize)
+        print(f"✅ Converted {header['count']} vectors (dim {header['dimension']}) into {args.store_path}")
+    else:
+        print(json.dumps(benchmark(args.store_path, args.k, args.queries, args.rerank_factor), indent=2))
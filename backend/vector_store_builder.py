@@ -1,97 +1,320 @@
+import argparse
+import asyncio
 import json
 import os
-import pickle
-import requests
+import time
+import numpy as np
 from dotenv import load_dotenv
 from tqdm import tqdm
+from embedding_client import EmbeddingClient
+from segment_log import SegmentLog, content_hash
+from vector_store import QUANTIZATIONS, StoreWriter, latest_version, load_store, read_header
+from ann_index import build_ann_index, load_ann_index
 
 # Load Gemini API key from .env
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 # Constants
-INPUT_FILE = "/Users/yatishdurgaappanapalli/Desktop/Mental Health Solver/mental_health_knowledge.json"
-OUTPUT_FILE = "vector_store.pkl"
-EMBEDDING_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models/embedding-001:embedContent"
-
-# Load dataset
-with open(INPUT_FILE, "r") as f:
-    try:
-        data = json.load(f)
-    except json.JSONDecodeError as e:
-        raise ValueError("Invalid JSON format") from e
-
-# Flatten data if it's a dict of category → [statements]
-if isinstance(data, dict):
-    flat_data = []
-    for category, statements in data.items():
-        for statement in statements:
-            flat_data.append({
-                "category": category,
-                "statement": statement
-            })
-    data = flat_data
-
-# Validate format
-if not isinstance(data, list) or not all(isinstance(entry, dict) for entry in data):
-    raise TypeError("Expected a list of dictionaries in the JSON file.")
-
-# Load or initialize vector store
-if os.path.exists(OUTPUT_FILE):
-    with open(OUTPUT_FILE, "rb") as f:
-        vector_store = pickle.load(f)
-        processed_statements = {entry["statement"] for entry in vector_store}
-        print(f"✅ Resuming from {len(vector_store)} previously saved embeddings.")
-else:
-    vector_store = []
-    processed_statements = set()
-    print("🆕 Starting fresh vector embedding...")
-
-# Generate embeddings
-for item in tqdm(data, desc="Generating embeddings"):
-    category = str(item.get("category", "")).strip().lower()
-    statement = str(item.get("statement", "")).strip()
-
-    if not category or not statement or statement in processed_statements:
-        continue
-
-    full_text = f"{category}: {statement}"
-    payload = {
-        "model": "models/embedding-001",
-        "content": {
-            "parts": [{"text": full_text}]
+INPUT_FILE = os.getenv(
+    "KNOWLEDGE_FILE",
+    "/Users/yatishdurgaappanapalli/Desktop/Mental Health Solver/mental_health_knowledge.jsonl"
+)
+STORE_DIR = "vector_store"  # binary store served by semantic_search
+BUILD_DIR = "vector_store.segments"  # append-only checkpoint log, cleared after compaction
+EMBEDDING_MODEL = "models/embedding-001"
+ANN_BACKEND = os.getenv("ANN_BACKEND", "ivf")  # ivf | hnsw | none
+CHECKPOINT_EVERY = 500
+# Compact copies written next to the float32 matrix: "int8", "float16", "float16,int8" or "none"
+STORE_QUANTIZATION = [q for q in os.getenv("STORE_QUANTIZATION", "int8").split(",") if q and q != "none"]
+
+# Embedding pipeline tuning
+BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
+CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+REQUESTS_PER_SECOND = float(os.getenv("EMBED_REQUESTS_PER_SECOND", "10"))
+
+parser = argparse.ArgumentParser(description="Build the vector store from the knowledge base")
+parser.add_argument("--delta", action="store_true",
+                    help="Reuse vectors from the current store and embed only new or edited statements")
+parser.add_argument("--compact", action="store_true",
+                    help="With --delta, rewrite the store in input order even when statements were only added")
+args = parser.parse_args()
+
+def iter_records(path):
+    """
+    Yield {"category", "statement"} records from the knowledge base, lazily for JSONL.
+
+    A .json file (a list of records or a dict of category -> [statements]) is
+    still accepted, but has to be loaded whole.
+    """
+    if path.endswith(".jsonl"):
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError as e:
+                    raise ValueError(f"Invalid JSON on line {line_number} of {path}") from e
+        return
+
+    with open(path, "r") as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError("Invalid JSON format") from e
+
+    # Flatten data if it's a dict of category → [statements]
+    if isinstance(data, dict):
+        for category, statements in data.items():
+            for statement in statements:
+                yield {"category": category, "statement": statement}
+        return
+
+    # Validate format
+    if not isinstance(data, list):
+        raise TypeError("Expected a list of dictionaries in the JSON file.")
+    yield from data
+
+
+def iter_entries(path):
+    """
+    Normalized entries keyed by a hash of the embedded text, in input order (first occurrence wins).
+    """
+    seen = set()
+    for item in iter_records(path):
+        if not isinstance(item, dict):
+            raise TypeError("Expected a list of dictionaries in the JSON file.")
+        category = str(item.get("category", "")).strip().lower()
+        statement = str(item.get("statement", "")).strip()
+
+        if not category or not statement:
+            continue
+
+        key = content_hash(category, statement)
+        if key not in seen:
+            seen.add(key)
+            yield {"hash": key, "category": category, "statement": statement}
+
+
+# Vectors we already have: the current store (delta mode) plus any checkpointed segments
+segments = SegmentLog(BUILD_DIR)
+base = None
+base_rows = {}
+if args.delta and os.path.isdir(STORE_DIR):
+    # Pin the served version: new versions extend or replace exactly this one
+    base_path = os.path.realpath(STORE_DIR)
+    base = load_store(base_path)
+    if base.header["model"] != EMBEDDING_MODEL:
+        print(f"⚠️ Store was built with {base.header['model']}, re-embedding everything with {EMBEDDING_MODEL}")
+        base = None
+    else:
+        base_rows = {
+            content_hash(category, statement): row
+            for row, (category, statement) in enumerate(zip(base.categories, base.statements))
         }
-    }
-
-    try:
-        response = requests.post(
-            f"{EMBEDDING_ENDPOINT}?key={GEMINI_API_KEY}",
-            headers={"Content-Type": "application/json"},
-            json=payload
-        )
-        response.raise_for_status()
-        embedding = response.json()["embedding"]["values"]
-
-        vector_store.append({
-            "category": category,
-            "statement": statement,
-            "embedding": embedding
-        })
-
-        processed_statements.add(statement)
-
-        # Save checkpoint every 500 entries
-        if len(vector_store) % 500 == 0:
-            with open(OUTPUT_FILE, "wb") as f:
-                pickle.dump(vector_store, f)
-            print(f"💾 Checkpoint saved at {len(vector_store)} vectors.")
-
-    except requests.RequestException as e:
-        print(f"❌ Failed to embed: {full_text}")
-        print(response.text if 'response' in locals() else str(e))
-
-# Final save
-with open(OUTPUT_FILE, "wb") as f:
-    pickle.dump(vector_store, f)
-
-print(f"✅ Vector store saved: {OUTPUT_FILE}")
+
+checkpointed = segments.hashes()
+if checkpointed:
+    print(f"✅ Resuming from {len(checkpointed)} checkpointed embeddings in {BUILD_DIR}.")
+print(f"🆕 Streaming {INPUT_FILE} and embedding new statements...")
+
+# Filled in while the input streams through the embedding stage
+stats = {"entries": 0, "pending": 0}
+input_hashes = set()
+
+
+def iter_pending():
+    """
+    Entries that still need an embedding, produced lazily as the embedding stage asks for batches.
+    """
+    for entry in iter_entries(INPUT_FILE):
+        stats["entries"] += 1
+        input_hashes.add(entry["hash"])
+        if entry["hash"] not in base_rows and entry["hash"] not in checkpointed:
+            stats["pending"] += 1
+            yield entry
+
+
+async def generate_embeddings(pending):
+    """
+    Embed pending entries through the batched client, appending a segment every CHECKPOINT_EVERY vectors.
+    """
+    buffer, buffer_embeddings = [], []
+    failed = 0
+    start = time.perf_counter()
+
+    async with EmbeddingClient(
+        GEMINI_API_KEY,
+        model=EMBEDDING_MODEL,
+        batch_size=BATCH_SIZE,
+        concurrency=CONCURRENCY,
+        requests_per_second=REQUESTS_PER_SECOND,
+    ) as client:
+        with tqdm(desc="Generating embeddings", unit="item") as progress:
+            batches = client.embed_batches(
+                pending,
+                text_of=lambda entry: f"{entry['category']}: {entry['statement']}",
+                progress=progress,
+            )
+            async for batch, embeddings in batches:
+                if embeddings is None:
+                    failed += len(batch)
+                    continue
+
+                buffer.extend(batch)
+                buffer_embeddings.extend(embeddings)
+
+                if len(buffer) >= CHECKPOINT_EVERY:
+                    name = segments.append(buffer, buffer_embeddings)
+                    print(f"💾 Checkpoint {name}: {len(buffer)} new vectors.")
+                    buffer, buffer_embeddings = [], []
+
+    segments.append(buffer, buffer_embeddings)
+
+    elapsed = time.perf_counter() - start
+    embedded = stats["pending"] - failed
+    print(f"⚡ Embedded {embedded} items in {elapsed:.1f}s ({embedded / elapsed if elapsed else 0:.1f} items/s, "
+          f"{client.retries} retries, {failed} failed)")
+
+
+def compact(writer_for):
+    """
+    Stream the new store from the base store and the segment log, in input order.
+
+    The input is streamed a second time for the order and written one chunk at
+    a time, so only content hashes are held for the whole corpus. Within a
+    chunk, rows are gathered per source with one fancy-indexing copy each;
+    entries that are no longer in the knowledge base (removed or edited) are
+    simply not copied. `writer_for(dimension)` opens the StoreWriter; returns
+    the committed header.
+    """
+    sources = []  # (embeddings, {hash: row})
+    if base is not None:
+        sources.append((base.embeddings, base_rows))
+    for name in segments.segments():
+        meta, embeddings = segments.read(name)
+        sources.append((embeddings, {key: row for row, key in enumerate(meta["hashes"])}))
+
+    # An empty base store has no dimension of its own
+    dimension = next((embeddings.shape[1] for embeddings, rows in sources if rows), 0)
+
+    def write_chunk(writer, chunk):
+        matrix = np.empty((len(chunk), dimension), dtype=np.float32)
+        claimed = set()
+        # Later sources (newer segments) win if a hash shows up twice
+        for embeddings, rows in reversed(sources):
+            dest, src = [], []
+            for i, entry in enumerate(chunk):
+                if entry["hash"] in rows and i not in claimed:
+                    dest.append(i)
+                    src.append(rows[entry["hash"]])
+            if dest:
+                matrix[dest] = embeddings[src]
+                claimed.update(dest)
+        writer.append(matrix, [entry["statement"] for entry in chunk], [entry["category"] for entry in chunk])
+
+    with writer_for(dimension) as writer:
+        chunk = []
+        for entry in iter_entries(INPUT_FILE):
+            if any(entry["hash"] in rows for _, rows in sources):
+                chunk.append(entry)
+                if len(chunk) == CHECKPOINT_EVERY:
+                    write_chunk(writer, chunk)
+                    chunk = []
+        write_chunk(writer, chunk)
+
+        missing = stats["entries"] - writer.count
+        if missing:
+            print(f"⚠️ {missing} statements have no embedding yet; rerun with --delta to fill them in.")
+        return writer.commit(before_swap=build_ann)
+
+
+def append_new():
+    """
+    Append the checkpointed vectors of statements the base store does not have to a
+    version that hard-links the base store's files, so none of its rows are rewritten.
+    New rows go after the existing ones, in segment order, not input order.
+    """
+    written = set()
+    with StoreWriter.extending(STORE_DIR, version) as writer:
+        for name in segments.segments():
+            meta, embeddings = segments.read(name)
+            rows = []
+            for row, key in enumerate(meta["hashes"]):
+                if key in input_hashes and key not in base_rows and key not in written:
+                    written.add(key)
+                    rows.append(row)
+            if rows:
+                writer.append(
+                    embeddings[rows],
+                    [meta["statements"][row] for row in rows],
+                    [meta["categories"][row] for row in rows],
+                )
+
+        missing = stats["entries"] - writer.count
+        if missing:
+            print(f"⚠️ {missing} statements have no embedding yet; rerun with --delta to fill them in.")
+        return writer.commit(before_swap=extend_ann)
+
+
+def build_ann(version_path):
+    """
+    Build the ANN index into a finished version before it is swapped in.
+    """
+    if ANN_BACKEND == "none":
+        return
+    embeddings = load_store(version_path).embeddings
+    if len(embeddings):
+        build_ann_index(embeddings, backend=ANN_BACKEND).save(version_path)
+        print(f"💾 {ANN_BACKEND} index built for {version_path}")
+
+
+def extend_ann(version_path):
+    """
+    Add the appended rows to the base store's ANN index, or build one if it has none.
+    """
+    ann = load_ann_index(base_path, base.embeddings, backend=ANN_BACKEND) if ANN_BACKEND != "none" else None
+    if ann is None:
+        return build_ann(version_path)
+    ann.extend(load_store(version_path).embeddings).save(version_path)
+    print(f"💾 {ANN_BACKEND} index extended for {version_path}")
+
+
+def can_append(removed):
+    """
+    Whether this delta only adds rows to the newest store version, written with per-file
+    sizes and the configured quantizations. The store has no tombstones, so removed or
+    edited statements always mean a full rewrite.
+    """
+    return (
+        base is not None
+        and not args.compact
+        and not removed
+        and base.header["count"] > 0
+        and "files" in base.header
+        and base.header.get("quantizations", []) == [q for q in QUANTIZATIONS if q in STORE_QUANTIZATION]
+        and os.path.realpath(STORE_DIR) == latest_version(STORE_DIR)
+    )
+
+
+asyncio.run(generate_embeddings(iter_pending()))
+removed = base_rows.keys() - input_hashes
+if base is not None:
+    print(f"🔁 Delta build: {stats['entries'] - stats['pending']} reused, {stats['pending']} embedded, "
+          f"{len(removed)} removed.")
+
+# Write a new store version (a new version directory the store symlink is switched to): append
+# when the delta only adds statements, otherwise compact everything into input order
+version = read_header(STORE_DIR).get("version", 0) + 1 if os.path.isdir(STORE_DIR) else 1
+if can_append(removed):
+    header = append_new()
+    mode = "appended"
+else:
+    header = compact(lambda dimension: StoreWriter(
+        STORE_DIR, dimension, model=EMBEDDING_MODEL, version=version, quantizations=STORE_QUANTIZATION,
+    ))
+    mode = "compacted"
+segments.clear()
+
+print(f"✅ Vector store v{version} {mode}: {STORE_DIR} ({header['count']} vectors, checksum {header['checksum']})")
@@ -1,6 +1,29 @@
 import React, { useState, useRef, useEffect } from 'react';
-import axios from 'axios';
 import { FaRobot, FaPaperPlane } from 'react-icons/fa';
+import { analyzeTextStream } from '../services/api';
+
+// Build the bot message from whatever parts of the stream have arrived so far
+function formatBotText({ result, similar, reply }) {
+  let botText = '';
+
+  if (result) {
+    const { prediction, tips = [], books = [], videos = [], quotes = [] } = result;
+    botText += `🧠 It looks like you're experiencing: **${prediction}**.\n\n`;
+    if (reply) botText += `${reply.trim()}\n\n`;
+    if (tips.length) botText += `💡 *Tips*:\n${tips.map((t) => `• ${t}`).join('\n')}\n\n`;
+    if (books.length) botText += `📘 *Books*:\n${books.map((b) => `• ${b}`).join('\n')}\n\n`;
+    if (videos.length) botText += `🎥 *Videos*:\n${videos.map((v) => `• ${v}`).join('\n')}\n\n`;
+    if (quotes.length) botText += `💬 *Quote*:\n"${quotes[0]}"\n\n`;
+  }
+
+  if (similar.length) {
+    botText += `🧑‍🤝‍🧑 *Similar Experiences*:\n${similar
+      .map((s, idx) => `${idx + 1}. "${s.statement}" (${s.category}, Score: ${s.score.toFixed(2)})`)
+      .join('\n')}`;
+  }
+
+  return botText.trim();
+}
 
 function HomePage() {
   const [inputText, setInputText] = useState('');
@@ -21,34 +44,40 @@ function HomePage() {
     setInputText('');
     setLoading(true);
 
+    // The bot message appears with the first event and is updated in place as the rest stream in
+    const botId = `${Date.now()}-${Math.random()}`;
+    const reply = { similar: [], result: null, reply: '' };
+    let botShown = false;
+    const showReply = (text = formatBotText(reply)) => {
+      const bot = { id: botId, type: 'bot', text };
+      const shown = botShown;
+      botShown = true;
+      setMessages((prev) => (shown ? prev.map((m) => (m.id === botId ? bot : m)) : [...prev, bot]));
+    };
+
     try {
-      const res = await axios.post('http://127.0.0.1:8000/analyze', {
-        text: userMessage.text,
+      await analyzeTextStream(userMessage.text, {
+        onSimilar: ({ similar_statements = [] }) => {
+          reply.similar = similar_statements;
+          showReply();
+        },
+        onCategory: (result) => {
+          reply.result = result;
+          showReply();
+        },
+        onToken: ({ text }) => {
+          reply.reply += text;
+          showReply();
+        },
+        onError: ({ detail }) => {
+          console.error(detail);
+          // Keep what already arrived; only a stream that failed before the category is an error reply
+          if (!reply.result) showReply('❗ Oops! Something went wrong. Please try again.');
+        },
       });
-
-      const { prediction, tips = [], books = [], videos = [], quotes = [], similar_statements = [] } = res.data;
-
-      // Build bot response dynamically
-      let botText = `🧠 It looks like you're experiencing: **${prediction}**.\n\n`;
-
-      if (tips.length) botText += `💡 *Tips*:\n${tips.map((t) => `• ${t}`).join('\n')}\n\n`;
-      if (books.length) botText += `📘 *Books*:\n${books.map((b) => `• ${b}`).join('\n')}\n\n`;
-      if (videos.length) botText += `🎥 *Videos*:\n${videos.map((v) => `• ${v}`).join('\n')}\n\n`;
-      if (quotes.length) botText += `💬 *Quote*:\n"${quotes[0]}"\n\n`;
-
-      if (similar_statements.length) {
-        botText += `🧑‍🤝‍🧑 *Similar Experiences*:\n${similar_statements
-          .map((s, idx) => `${idx + 1}. "${s.statement}" (${s.category}, Score: ${s.score.toFixed(2)})`)
-          .join('\n')}`;
-      }
-
-      setMessages((prev) => [...prev, { type: 'bot', text: botText.trim() }]);
     } catch (err) {
       console.error(err);
-      setMessages((prev) => [
-        ...prev,
-        { type: 'bot', text: '❗ Oops! Something went wrong. Please try again.' },
-      ]);
+      if (!reply.result) showReply('❗ Oops! Something went wrong. Please try again.');
     } finally {
       setLoading(false);
     }
@@ -109,7 +138,7 @@ function HomePage() {
         >
           {messages.map((msg, idx) => (
             <div
-              key={idx}
+              key={msg.id ?? idx}
               style={{
                 alignSelf: msg.type === 'user' ? 'flex-end' : 'flex-start',
                 backgroundColor: msg.type === 'user' ? '#1493cb' : '#ffffff',
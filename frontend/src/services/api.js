@@ -20,3 +20,50 @@ export const analyzeText = async (text) => {
     throw error;
   }
 };
+
+// Streams /analyze/stream (Server-Sent Events over POST).
+// handlers: { onSimilar, onCategory, onToken, onDone, onError }
+export const analyzeTextStream = async (text, handlers = {}) => {
+  const response = await fetch(`${API_BASE_URL}/analyze/stream`, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+    },
+    body: JSON.stringify({ text }),
+  });
+
+  if (!response.ok || !response.body) {
+    throw new Error("Failed to analyze text");
+  }
+
+  const eventHandlers = {
+    similar: handlers.onSimilar,
+    category: handlers.onCategory,
+    token: handlers.onToken,
+    done: handlers.onDone,
+    error: handlers.onError,
+  };
+
+  const reader = response.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+
+  while (true) {
+    const { value, done } = await reader.read();
+    if (done) break;
+
+    buffer += decoder.decode(value, { stream: true });
+    const events = buffer.split("\n\n");
+    buffer = events.pop();
+
+    for (const rawEvent of events) {
+      let event = "message";
+      let data = "";
+      for (const line of rawEvent.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      eventHandlers[event]?.(data ? JSON.parse(data) : {});
+    }
+  }
+};
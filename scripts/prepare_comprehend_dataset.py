@@ -1,51 +1,81 @@
+"""
+Prepare the Amazon Comprehend train/test CSVs from data/mental_health_data.csv.
+
+Default mode loads the CSV with pandas and cleans it in one thread. --stream
+reads the CSV in chunks, cleans the chunks across a process pool (in input
+order) and keeps only the cleaned, mapped rows; the split and output are
+the same code, so for a fixed seed both modes write byte-identical files:
+    python prepare_comprehend_dataset.py --stream --workers 8 --chunksize 20000
+"""
+import argparse
+import multiprocessing
+import numpy as np
 import pandas as pd
 import re
 import nltk
 import os
 import sys
+from collections import deque
 from nltk.corpus import stopwords
 from nltk.stem import WordNetLemmatizer
 from sklearn.model_selection import train_test_split
 
-# Download resources
-nltk.download('stopwords')
-nltk.download('wordnet')
-
 # Path setup
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 INPUT_PATH = os.path.join(SCRIPT_DIR, "../data/mental_health_data.csv")
 OUTPUT_DIR = os.path.join(SCRIPT_DIR, "../data/cleaned")
-os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-if not os.path.exists(INPUT_PATH):
-    print(f"❌ Input file not found at: {INPUT_PATH}")
-    sys.exit(1)
+# NLTK resources, downloaded once into the NLTK data path and reused afterwards
+NLTK_RESOURCES = {"stopwords": "corpora/stopwords", "wordnet": "corpora/wordnet"}
+
+NON_ALPHA = re.compile(r"[^a-zA-Z\s]")
+MAX_TEXT_LENGTH = 4900
+
+
+def ensure_nltk_resources():
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(name)
 
-# Read data
-df = pd.read_csv(INPUT_PATH, names=["text", "label"])
 
-# Swap columns if label looks too long
-if df["label"].str.len().mean() > 100:
-    print("⚠️ Swapping columns due to label length.")
-    df = df.rename(columns={"text": "label", "label": "text"})
+# Text cleaner (set up per process by init_cleaner)
+lemmatizer = None
+stop_words = None
+_lemmas = {}  # token -> lemma; vocabularies are small next to token counts
+
+
+def init_cleaner():
+    global lemmatizer, stop_words
+    if lemmatizer is None:
+        lemmatizer = WordNetLemmatizer()
+        stop_words = set(stopwords.words("english"))
+
+
+def lemmatize(token):
+    lemma = _lemmas.get(token)
+    if lemma is None:
+        lemma = _lemmas[token] = lemmatizer.lemmatize(token)
+    return lemma
 
-# Text cleaner
-lemmatizer = WordNetLemmatizer()
-stop_words = set(stopwords.words("english"))
 
 def clean_text(text):
     if pd.isna(text): return ""
     text = str(text).lower()
-    text = re.sub(r"[^a-zA-Z\s]", "", text)
+    text = NON_ALPHA.sub("", text)
     tokens = text.split()
-    tokens = [lemmatizer.lemmatize(w) for w in tokens if w not in stop_words]
+    tokens = [lemmatize(w) for w in tokens if w not in stop_words]
     return " ".join(tokens)
 
-# Apply cleaning
-print("🧹 Cleaning data...")
-df["text"] = df["text"].apply(clean_text)
-df["label"] = df["label"].astype(str).str.strip().str.lower()
-df["label"] = df["label"].str.replace(r"[^\w\s]", "", regex=True)
+
+def clean_texts(texts):
+    """
+    Pool task: clean one chunk of texts.
+    """
+    init_cleaner()
+    return [clean_text(text) for text in texts]
+
 
 # CATEGORY MAP (expanded)
 CATEGORY_MAP = {
@@ -156,41 +186,223 @@ CATEGORY_MAP = {
     ]
 }
 
-# Flatten map for reverse lookup
-TERM_TO_CATEGORY = {}
-for category, keywords in CATEGORY_MAP.items():
-    for keyword in keywords:
-        TERM_TO_CATEGORY[keyword.strip().lower()] = category
+# Ties (a label scoring the same for several categories, or a keyword listed under
+# several) resolve to the first category in this list: risk categories before everyday ones
+CATEGORY_PRIORITY = [
+    "suicidal", "abuse", "addiction", "bipolar", "personality disorder",
+    "depression", "anxiety", "stress", "relationship", "normal",
+]
+
+# Shared keywords where the priority order picks the less likely reading
+KEYWORD_OVERRIDES = {"panic": "anxiety", "paranoid": "anxiety", "over": "relationship"}
+
+# Words too common in ordinary labels to decide a category on their own ("almost done",
+# "at peace"); inside a longer label they only add weight to the other matches
+GENERIC_KEYWORDS = {
+    "done", "final", "plan", "gone", "peace", "pills", "over", "enough", "finished",
+    "escape", "relief", "freedom", "note", "method", "building", "bridge", "cliff",
+    "need", "using", "high", "clean", "used", "split", "ended", "hit", "tests",
+}
+GENERIC_WEIGHT = 0.25
+
+LABEL_TOKEN = re.compile(r"[a-z0-9]+")
+APOSTROPHES = re.compile(r"['’]")
+
+
+def tokenize_label(text):
+    # "Can't" -> "cant" to match the keyword spelling; other punctuation separates words
+    return LABEL_TOKEN.findall(APOSTROPHES.sub("", text.lower()))
+
+
+class CategoryMatcher:
+    """
+    Maps free-text labels to CATEGORY_MAP categories.
+
+    A keyword listed under several categories belongs to the first of them in
+    CATEGORY_PRIORITY unless KEYWORD_OVERRIDES says otherwise, whether it is
+    the whole label or part of one. A label that is exactly one keyword maps
+    to that keyword's category. Other labels go through a token-level
+    Aho-Corasick automaton over the keyword phrases, matching whole words
+    ("med" does not match "medical") in one pass. A phrase inside a longer matched phrase does not count on its own
+    ("panic attack" is anxiety, not the "panic" listed under abuse). Each
+    remaining match adds its length in words to its category, GENERIC_KEYWORDS
+    only GENERIC_WEIGHT, and the highest score wins, ties by CATEGORY_PRIORITY.
+    A label matching generic keywords only stays unmapped.
+    """
+
+    def __init__(self, category_map, priority=CATEGORY_PRIORITY, overrides=KEYWORD_OVERRIDES,
+                 generic=GENERIC_KEYWORDS):
+        self.rank = {category: i for i, category in enumerate(priority)}
+        for category in category_map:
+            self.rank.setdefault(category, len(self.rank))
+
+        # Duplicate keywords keep their highest-priority category unless overridden
+        phrases = {}
+        for category, keywords in category_map.items():
+            for keyword in keywords:
+                tokens = tuple(tokenize_label(keyword))
+                if tokens and (tokens not in phrases or self.rank[category] < self.rank[phrases[tokens]]):
+                    phrases[tokens] = category
+        for keyword, category in overrides.items():
+            phrases[tuple(tokenize_label(keyword))] = category
+        # A label that is one whole keyword maps to it even when the keyword is generic
+        self.exact = phrases
+
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]  # node -> [(phrase length, category, weight), ...] ending here
+        generic = {tuple(tokenize_label(keyword)) for keyword in generic}
+        for tokens, category in phrases.items():
+            node = 0
+            for token in tokens:
+                child = self.goto[node].get(token)
+                if child is None:
+                    child = self.goto[node][token] = len(self.goto)
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                node = child
+            weight = GENERIC_WEIGHT if tokens in generic else float(len(tokens))
+            self.out[node].append((len(tokens), category, weight))
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for token, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and token not in self.goto[state]:
+                    state = self.fail[state]
+                self.fail[child] = self.goto[state].get(token, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def find(self, tokens):
+        """
+        Every phrase occurrence as (start, end, category, weight), in one pass.
+        """
+        goto, fail, out = self.goto, self.fail, self.out
+        matches = []
+        node = 0
+        for i, token in enumerate(tokens):
+            while node and token not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(token, 0)
+            if out[node]:
+                matches.extend((i + 1 - length, i + 1, category, weight) for length, category, weight in out[node])
+        return matches
+
+    def match(self, label):
+        if not isinstance(label, str):
+            return None
+        tokens = tuple(tokenize_label(label))
+        category = self.exact.get(tokens)
+        if category is not None:
+            return category
+
+        matches = self.find(tokens)
+        # By start, longest first: anything ending within the reach so far sits inside a longer phrase
+        matches.sort(key=lambda m: (m[0], -m[1]))
+        scores, reach, specific = {}, -1, False
+        for _, end, category, weight in matches:
+            if end <= reach:
+                continue
+            reach = end
+            scores[category] = scores.get(category, 0.0) + weight
+            specific = specific or weight > GENERIC_WEIGHT
+        if not specific:
+            return None
+        return min(scores, key=lambda category: (-scores[category], self.rank[category]))
+
+    def map_series(self, labels):
+        """
+        Map a whole label column, matching each distinct label once.
+        """
+        codes, uniques = pd.factorize(labels)
+        mapped = np.array([self.match(label) for label in uniques] + [None], dtype=object)
+        return pd.Series(mapped[codes], index=labels.index)
+
+
+CATEGORY_MATCHER = CategoryMatcher(CATEGORY_MAP)
+
 
 def map_to_category(label):
-    label = label.lower().strip()
-    label = re.sub(r"[^\w\s]", "", label)
-    return TERM_TO_CATEGORY.get(label, None)
+    return CATEGORY_MATCHER.match(label)
+
+
+def finish_rows(df):
+    """
+    Map labels to categories, then drop unmapped, empty and overlong rows. Row-wise, so chunk-safe.
+    """
+    df["label"] = CATEGORY_MATCHER.map_series(df["label"])
+
+    # Drop unmapped
+    df = df[df["label"].notnull()]
+
+    # Filter long/empty
+    df = df[df["text"].str.strip() != ""]
+    df = df[df["text"].str.len() <= MAX_TEXT_LENGTH]
+    return df
+
 
-df["label"] = df["label"].map(map_to_category)
+def load_dataset(path):
+    """
+    Single-threaded path: read the whole CSV and clean it row by row.
+    """
+    df = pd.read_csv(path, names=["text", "label"])
 
-# Drop unmapped
-df = df[df["label"].notnull()]
+    # Swap columns if label looks too long
+    if df["label"].str.len().mean() > 100:
+        print("⚠️ Swapping columns due to label length.")
+        df = df.rename(columns={"text": "label", "label": "text"})
 
-# Filter long/empty
-df = df[df["text"].str.strip() != ""]
-df = df[df["text"].str.len() <= 4900]
+    # Apply cleaning
+    print("🧹 Cleaning data...")
+    init_cleaner()
+    df["text"] = df["text"].apply(clean_text)
+    return finish_rows(df)
 
-print(f"📊 Data after initial cleaning: {len(df)} rows")
-print(f"📊 Label distribution before filtering:")
-print(df["label"].value_counts().sort_index())
 
-# IMPROVED: Remove rare labels with stricter minimum
-MIN_SAMPLES_PER_LABEL = 10  # Increased from 2 to ensure stable splits
-label_counts = df["label"].value_counts()
-valid_labels = label_counts[label_counts >= MIN_SAMPLES_PER_LABEL].index
-df = df[df["label"].isin(valid_labels)]
+def should_swap(path, chunksize):
+    """
+    The column-swap check of load_dataset (mean label length > 100), computed chunk by chunk.
+    """
+    total, count = 0, 0
+    for chunk in pd.read_csv(path, names=["text", "label"], dtype=str, chunksize=chunksize):
+        lengths = chunk["label"].str.len()
+        total += lengths.sum()
+        count += lengths.count()
+    return count > 0 and total / count > 100
+
+
+def load_dataset_streaming(path, workers, chunksize):
+    """
+    Streaming path: clean CSV chunks across a process pool, keeping at most
+    2 * workers chunks in flight and only the cleaned, mapped rows in memory.
+    """
+    swap = should_swap(path, chunksize)
+    if swap:
+        print("⚠️ Swapping columns due to label length.")
+
+    print(f"🧹 Cleaning data in chunks of {chunksize} rows with {workers} workers...")
+    kept = []
+    in_flight = deque()
+
+    def collect(chunk, pending):
+        chunk["text"] = pending.get()
+        kept.append(finish_rows(chunk))
+
+    with multiprocessing.Pool(workers, initializer=init_cleaner) as pool:
+        for chunk in pd.read_csv(path, names=["text", "label"], dtype=str, chunksize=chunksize):
+            if swap:
+                chunk = chunk.rename(columns={"text": "label", "label": "text"})
+            in_flight.append((chunk, pool.apply_async(clean_texts, (chunk["text"].tolist(),))))
+            if len(in_flight) >= 2 * workers:
+                collect(*in_flight.popleft())
+        while in_flight:
+            collect(*in_flight.popleft())
+
+    return pd.concat(kept) if kept else pd.DataFrame(columns=["text", "label"])
 
-print(f"\n📊 After removing labels with < {MIN_SAMPLES_PER_LABEL} samples:")
-print(f"📊 Remaining rows: {len(df)}")
-print(f"📊 Remaining categories: {df['label'].nunique()}")
-print(f"📊 Final label distribution:")
-print(df["label"].value_counts().sort_index())
 
 # IMPROVED: Safer train-test split
 def safe_train_test_split(df, test_size=0.2, random_state=42):
@@ -249,56 +461,98 @@ def safe_train_test_split(df, test_size=0.2, random_state=42):
         print("✅ Manual split completed - all labels guaranteed in both sets")
         return train_df, test_df
 
-# Perform the safe split
-if len(df) == 0:
-    print("❌ No data remaining after filtering!")
-    sys.exit(1)
-
-train_df, test_df = safe_train_test_split(df, test_size=0.2, random_state=42)
-
-# Final verification
-train_labels = set(train_df['label'].unique())
-test_labels = set(test_df['label'].unique())
-
-print(f"\n🔍 Final verification:")
-print(f"📊 Training samples: {len(train_df)}")
-print(f"📊 Test samples: {len(test_df)}")
-print(f"📊 Training labels: {len(train_labels)}")
-print(f"📊 Test labels: {len(test_labels)}")
-print(f"📊 Labels in train but not test: {train_labels - test_labels}")
-print(f"📊 Labels in test but not train: {test_labels - train_labels}")
-
-if test_labels - train_labels:
-    print("❌ ERROR: Test set contains labels not in training set!")
-    sys.exit(1)
-
-if len(test_df) == 0:
-    print("❌ ERROR: Test set is empty!")
-    sys.exit(1)
-
-# Verify minimum samples per label in both sets
-print(f"\n📊 Training set label distribution:")
-train_label_counts = train_df['label'].value_counts().sort_index()
-print(train_label_counts)
-
-print(f"\n📊 Test set label distribution:")
-test_label_counts = test_df['label'].value_counts().sort_index()
-print(test_label_counts)
-
-# Save files
-train_output_path = os.path.join(OUTPUT_DIR, "comprehend_train.csv")
-test_output_path = os.path.join(OUTPUT_DIR, "comprehend_test.csv")
-
-train_df.to_csv(train_output_path, index=False, header=False)
-test_df.to_csv(test_output_path, index=False, header=False)
-
-print(f"\n✅ Files saved successfully:")
-print(f"📁 Training: {train_output_path}")
-print(f"📁 Test: {test_output_path}")
-print(f"\n🎯 Success! Data is ready for Amazon Comprehend training.")
-
-# Additional validation - peek at first few lines
-print(f"\n👀 Sample training data:")
-print(train_df.head(3).to_string(index=False))
-print(f"\n👀 Sample test data:")
-print(test_df.head(3).to_string(index=False))
\ No newline at end of file
+def main():
+    parser = argparse.ArgumentParser(description="Prepare the Comprehend train/test CSVs")
+    parser.add_argument("--input", default=INPUT_PATH)
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--stream", action="store_true", help="Read in chunks and clean across a process pool")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunksize", type=int, default=20000, help="Rows per chunk (also used when writing)")
+    args = parser.parse_args()
+    chunksize = args.chunksize
+
+    ensure_nltk_resources()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    if not os.path.exists(args.input):
+        print(f"❌ Input file not found at: {args.input}")
+        sys.exit(1)
+
+    if args.stream:
+        df = load_dataset_streaming(args.input, args.workers, chunksize)
+    else:
+        df = load_dataset(args.input)
+
+    print(f"📊 Data after initial cleaning: {len(df)} rows")
+    print(f"📊 Label distribution before filtering:")
+    print(df["label"].value_counts().sort_index())
+
+    # IMPROVED: Remove rare labels with stricter minimum
+    MIN_SAMPLES_PER_LABEL = 10  # Increased from 2 to ensure stable splits
+    label_counts = df["label"].value_counts()
+    valid_labels = label_counts[label_counts >= MIN_SAMPLES_PER_LABEL].index
+    df = df[df["label"].isin(valid_labels)]
+
+    print(f"\n📊 After removing labels with < {MIN_SAMPLES_PER_LABEL} samples:")
+    print(f"📊 Remaining rows: {len(df)}")
+    print(f"📊 Remaining categories: {df['label'].nunique()}")
+    print(f"📊 Final label distribution:")
+    print(df["label"].value_counts().sort_index())
+
+    # Perform the safe split
+    if len(df) == 0:
+        print("❌ No data remaining after filtering!")
+        sys.exit(1)
+
+    train_df, test_df = safe_train_test_split(df, test_size=0.2, random_state=42)
+
+    # Final verification
+    train_labels = set(train_df['label'].unique())
+    test_labels = set(test_df['label'].unique())
+
+    print(f"\n🔍 Final verification:")
+    print(f"📊 Training samples: {len(train_df)}")
+    print(f"📊 Test samples: {len(test_df)}")
+    print(f"📊 Training labels: {len(train_labels)}")
+    print(f"📊 Test labels: {len(test_labels)}")
+    print(f"📊 Labels in train but not test: {train_labels - test_labels}")
+    print(f"📊 Labels in test but not train: {test_labels - train_labels}")
+
+    if test_labels - train_labels:
+        print("❌ ERROR: Test set contains labels not in training set!")
+        sys.exit(1)
+
+    if len(test_df) == 0:
+        print("❌ ERROR: Test set is empty!")
+        sys.exit(1)
+
+    # Verify minimum samples per label in both sets
+    print(f"\n📊 Training set label distribution:")
+    train_label_counts = train_df['label'].value_counts().sort_index()
+    print(train_label_counts)
+
+    print(f"\n📊 Test set label distribution:")
+    test_label_counts = test_df['label'].value_counts().sort_index()
+    print(test_label_counts)
+
+    # Save files
+    train_output_path = os.path.join(args.output_dir, "comprehend_train.csv")
+    test_output_path = os.path.join(args.output_dir, "comprehend_test.csv")
+
+    train_df.to_csv(train_output_path, index=False, header=False, chunksize=chunksize)
+    test_df.to_csv(test_output_path, index=False, header=False, chunksize=chunksize)
+
+    print(f"\n✅ Files saved successfully:")
+    print(f"📁 Training: {train_output_path}")
+    print(f"📁 Test: {test_output_path}")
+    print(f"\n🎯 Success! Data is ready for Amazon Comprehend training.")
+
+    # Additional validation - peek at first few lines
+    print(f"\n👀 Sample training data:")
+    print(train_df.head(3).to_string(index=False))
+    print(f"\n👀 Sample test data:")
+    print(test_df.head(3).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# The backend and scripts are flat modules imported by name, as they are when run from their directories
+for directory in ("backend", "scripts"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
@@ -0,0 +1,172 @@
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+import pytest
+
+import main
+import semantic_search
+from fake_services import fake_embedding
+from lexical_index import BM25Index
+from semantic_search import VectorIndex
+
+STATEMENTS = ["heart racing before every exam", "deadlines at work never stop", "feeling calm after a walk"]
+LABELS = ["anxiety", "stress", "normal"]
+CATEGORIES = {name: {"tips": [f"{name} tip"]} for name in LABELS}
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class SlowModel:
+    """
+    Stands in for the Gemini model: answers "anxiety" after `delay` seconds.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return Response("Anxiety")
+
+
+class StreamingModel(SlowModel):
+    """
+    SlowModel that also streams a reply in `chunks` when called with stream=True.
+    """
+
+    def __init__(self, delay, chunks):
+        super().__init__(delay)
+        self.chunks = chunks
+
+    async def generate_content_async(self, prompt, stream=False, **kwargs):
+        if not stream:
+            return await super().generate_content_async(prompt, **kwargs)
+
+        async def reply():
+            for chunk in self.chunks:
+                yield Response(chunk)
+        return reply()
+
+
+@pytest.fixture(autouse=True)
+def service(monkeypatch):
+    index = VectorIndex(np.array([fake_embedding(s, 16) for s in STATEMENTS]), STATEMENTS, LABELS)
+    index.lexical = BM25Index.build(STATEMENTS)
+    monkeypatch.setattr(semantic_search, "INDEX", index)
+    monkeypatch.setattr(main, "CATEGORIES", CATEGORIES)
+    monkeypatch.setattr(main, "CLASSIFIER_MODE", "llm")
+    monkeypatch.setattr(main, "COALESCING_ENABLED", False)
+    monkeypatch.setattr(main, "DEGRADE_ON_FAILURE", False)
+
+    async def ready():
+        pass
+
+    async def embed(text):
+        return np.array(fake_embedding(text, 16), dtype=np.float32)
+
+    monkeypatch.setattr(main, "require_ready", ready)
+    monkeypatch.setattr(main, "get_query_embedding", embed)
+
+
+def _post_all(texts):
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/analyze", json={"text": text}) for text in texts))
+    return asyncio.run(run())
+
+
+def test_run_stage_names_the_stage_that_timed_out():
+    with pytest.raises(main.StageTimeout) as error:
+        asyncio.run(main.run_stage("classification", asyncio.sleep(5), 0.05))
+    assert error.value.stage == "classification"
+
+
+def test_slow_classification_returns_504_naming_the_stage(monkeypatch):
+    monkeypatch.setattr(main, "model", SlowModel(5.0))
+    monkeypatch.setattr(main, "LLM_TIMEOUT", 0.1)
+
+    start = time.monotonic()
+    (response,) = _post_all(["heart racing"])
+
+    assert time.monotonic() - start < 2.0
+    assert response.status_code == 504
+    assert response.json()["detail"] == "Upstream timeout: classification"
+
+
+def test_slow_classification_degrades_to_the_neighbour_vote(monkeypatch):
+    monkeypatch.setattr(main, "model", SlowModel(5.0))
+    monkeypatch.setattr(main, "LLM_TIMEOUT", 0.1)
+    monkeypatch.setattr(main, "DEGRADE_ON_FAILURE", True)
+
+    (response,) = _post_all(["heart racing before every exam"])
+
+    assert response.status_code == 200
+    assert response.json()["metadata"]["decision_path"] == "fallback"
+    assert response.json()["prediction"] in LABELS
+
+
+def test_concurrent_requests_wait_on_gemini_together(monkeypatch):
+    model = SlowModel(0.5)
+    monkeypatch.setattr(main, "model", model)
+
+    start = time.monotonic()
+    responses = _post_all([f"request {i}" for i in range(8)])
+
+    # Serialized, eight 0.5 s calls would take 4 s
+    assert time.monotonic() - start < 2.0
+    assert model.calls == 8
+    assert all(r.status_code == 200 for r in responses)
+    assert {r.json()["prediction"] for r in responses} == {"anxiety"}
+    assert {r.json()["metadata"]["decision_path"] for r in responses} == {"llm"}
+
+
+def _stream(text):
+    """
+    (event, data) pairs of one /analyze/stream response.
+    """
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.post("/analyze/stream", json={"text": text})
+            return response.headers["content-type"], response.text
+    content_type, body = asyncio.run(run())
+    assert content_type.startswith("text/event-stream")
+
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields["event"], json.loads(fields["data"])))
+    return events
+
+
+def test_stream_sends_neighbours_then_category_then_reply_tokens(monkeypatch):
+    monkeypatch.setattr(main, "model", StreamingModel(0.0, ["You are ", "", "not alone."]))
+
+    events = _stream("heart racing before every exam")
+
+    assert [event for event, _ in events] == ["similar", "category", "token", "token", "done"]
+    similar, category = events[0][1], events[1][1]
+    assert similar["similar_statements"][0]["statement"] == STATEMENTS[0]
+    assert similar["provisional_category"] in LABELS
+    assert category["prediction"] == "anxiety" and category["tips"] == ["anxiety tip"]
+    assert category["metadata"]["decision_path"] == "llm"
+    assert "".join(data["text"] for event, data in events if event == "token") == "You are not alone."
+
+
+def test_stream_ends_with_an_error_event_when_a_stage_times_out(monkeypatch):
+    monkeypatch.setattr(main, "model", StreamingModel(5.0, ["never sent"]))
+    monkeypatch.setattr(main, "LLM_TIMEOUT", 0.1)
+
+    events = _stream("heart racing")
+
+    assert [event for event, _ in events] == ["similar", "error"]
+    assert events[-1][1] == {"detail": "Upstream timeout: classification"}
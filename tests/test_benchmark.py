@@ -0,0 +1,60 @@
+import json
+import os
+
+import pytest
+
+from benchmark import BACKEND_DIR, LATENCY_KEYS, THROUGHPUT_KEYS, compare, summarize
+
+BASELINE_FILE = os.path.join(BACKEND_DIR, "benchmark_baseline.json")
+
+
+def test_summarize_reports_percentiles_and_throughput():
+    summary = summarize([0.001 * i for i in range(1, 101)], elapsed=2.0, errors=3)
+
+    assert summary["count"] == 100 and summary["errors"] == 3
+    assert summary["mean_ms"] == pytest.approx(50.5)
+    assert summary["p50_ms"] == pytest.approx(50.5)
+    assert summary["p95_ms"] == pytest.approx(95.05)
+    assert summary["p99_ms"] == pytest.approx(99.01)
+    assert summary["rps"] == 50.0
+
+
+def test_summarize_handles_no_requests():
+    summary = summarize([], elapsed=0.0)
+    assert summary["count"] == 0 and summary["p99_ms"] == 0.0 and summary["rps"] == 0.0
+
+
+def test_compare_flags_slower_latency_and_lower_throughput_beyond_tolerance():
+    baseline = {
+        "search": {"p50_ms": 10.0, "p95_ms": 20.0, "p99_ms": 30.0, "rps": 100.0},
+        "builder": {"p50_ms": 5.0, "p95_ms": 5.0, "p99_ms": 5.0, "items_per_s": 1000.0},
+        "retired": {"p50_ms": 1.0},
+    }
+    results = {
+        # p95 within 20%, p99 just past it, throughput down 30%
+        "search": {"p50_ms": 10.0, "p95_ms": 23.9, "p99_ms": 36.1, "rps": 70.0},
+        # Faster everywhere
+        "builder": {"p50_ms": 1.0, "p95_ms": 1.0, "p99_ms": 1.0, "items_per_s": 5000.0},
+        "new": {"p50_ms": 999.0},
+    }
+
+    assert compare(results, baseline, tolerance=0.2) == [
+        "search p99_ms: 36.1 vs baseline 30.0",
+        "search rps: 70.0 vs baseline 100.0",
+    ]
+    assert compare(results, baseline, tolerance=0.5) == []
+
+
+def test_committed_baseline_covers_every_default_suite():
+    with open(BASELINE_FILE) as f:
+        baseline = json.load(f)
+
+    results = baseline["results"]
+    assert any(name.startswith("search") for name in results)
+    assert any(name.startswith("builder") for name in results)
+    assert any(name.startswith("load") for name in results)
+    # Every result carries something compare() checks
+    for name, result in results.items():
+        assert any(key in result for key in LATENCY_KEYS + THROUGHPUT_KEYS), name
+    # A run compared against itself has no regressions
+    assert compare(results, results) == []
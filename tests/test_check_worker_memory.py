@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pytest
+
+from check_worker_memory import check
+
+# Interpreter, FastAPI and the Gemini/httpx clients come to ~100-130 MB per worker before any index
+WORKER_MEMORY_BUDGET_MB = float(os.getenv("WORKER_MEMORY_BUDGET_MB", "200"))
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="reads /proc/<pid>/smaps_rollup")
+def test_memory_per_extra_worker_in_shared_mode():
+    report = check(workers=3, corpus_size=5000, dimension=64, max_worker_mb=WORKER_MEMORY_BUDGET_MB)
+    shared = report["modes"]["shared"]
+
+    assert report["passed"], shared
+    # The index is mapped by every worker, so RSS may grow by up to its size on top of the budget
+    assert shared["rss_per_extra_worker_mb"] <= WORKER_MEMORY_BUDGET_MB + report["index_mb"], shared
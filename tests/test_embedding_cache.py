@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from embedding_cache import EmbeddingCache, LRUCache, SQLiteCache, cache_key
+
+MODEL = "models/embedding-001"
+
+
+def test_embeddings_are_cached_as_read_only_float32_arrays(tmp_path):
+    cache = EmbeddingCache(LRUCache(), SQLiteCache(str(tmp_path / "cache.db")))
+    stored = cache.put("Hello  world", MODEL, [0.5] * 768)
+
+    assert stored.dtype == np.float32 and stored.nbytes == 768 * 4
+    with pytest.raises(ValueError):
+        stored[0] = 1.0
+    assert cache.get("hello world", MODEL) is stored
+
+    from_disk = EmbeddingCache(LRUCache(), cache.disk).get("hello world", MODEL)
+    assert from_disk.dtype == np.float32 and np.array_equal(from_disk, stored)
+
+
+def test_disk_cap_holds_across_processes_sharing_the_file(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first, second = SQLiteCache(path, max_entries=5), SQLiteCache(path, max_entries=5)
+    for i in range(4):
+        first.put(f"a{i}", np.ones(4))
+        second.put(f"b{i}", np.ones(4))
+
+    assert first.size == second.size == 5
+    assert first.evictions + second.evictions == 3
+
+
+def test_disk_size_counts_rows_not_writes(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.db"), ttl=-1)
+    cache.put("key", np.ones(4))
+    cache.put("key", np.zeros(4))
+    assert cache.size == 1
+    # Expired on read: the row is dropped and the count follows
+    assert cache.get("key") is None
+    assert cache.size == 0
+    assert SQLiteCache(cache.path).size == 0
+
+
+def test_cache_key_ignores_case_and_whitespace():
+    assert cache_key("  Hello\tWorld ", MODEL) == cache_key("hello world", MODEL)
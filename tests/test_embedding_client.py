@@ -0,0 +1,113 @@
+import asyncio
+
+import httpx
+import pytest
+
+from embedding_client import EmbeddingClient, EmbeddingError, base_url_from_endpoint
+from fake_services import FakeServer, create_fake_app, fake_embedding
+
+DIMENSION = 8
+
+
+def _run(coroutine):
+    return asyncio.run(coroutine)
+
+
+async def _embed_all(client, texts):
+    results = {}
+    async for batch, embeddings in client.embed_batches(texts):
+        results.update(zip(batch, embeddings))
+    return results
+
+
+def test_batches_against_a_fake_embedding_server():
+    app = create_fake_app(dimension=DIMENSION)
+    texts = [f"text {i}" for i in range(25)]
+
+    with FakeServer(app) as url:
+        async def go():
+            async with EmbeddingClient("test-key", base_url=f"{url}/v1beta", batch_size=10, concurrency=2,
+                                       requests_per_second=1000) as client:
+                return await _embed_all(client, texts), client.requests
+
+        results, requests = _run(go())
+
+    assert app.state.calls["batch_embed"] == requests == 3
+    assert all(results[text] == pytest.approx(fake_embedding(text, DIMENSION)) for text in texts)
+
+
+def test_injected_client_is_used_and_left_open():
+    app = create_fake_app(dimension=DIMENSION)
+
+    async def go():
+        http_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://fake")
+        async with EmbeddingClient("test-key", base_url="http://fake/v1beta", client=http_client) as client:
+            embedding = await client.embed("hello")
+        assert not http_client.is_closed
+        await http_client.aclose()
+        return embedding
+
+    assert _run(go()) == pytest.approx(fake_embedding("hello", DIMENSION))
+    assert app.state.calls["embed"] == 1
+
+
+def _flaky_transport(failures, status=429):
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        if len(attempts) <= failures:
+            return httpx.Response(status, headers={"Retry-After": "0"})
+        body = request.read()
+        count = body.count(b'"content"')
+        return httpx.Response(200, json={"embeddings": [{"values": [0.0] * DIMENSION}] * count})
+
+    return httpx.MockTransport(handler), attempts
+
+
+def test_rate_limited_requests_are_retried():
+    transport, attempts = _flaky_transport(failures=2)
+
+    async def go():
+        async with EmbeddingClient("test-key", base_url="http://fake", client=httpx.AsyncClient(transport=transport),
+                                   requests_per_second=1000) as client:
+            return await client.embed_batch(["a", "b"]), client
+
+    embeddings, client = _run(go())
+    assert len(embeddings) == 2
+    assert len(attempts) == client.requests == 3
+    assert client.retries == 2
+
+
+def test_failed_batches_are_yielded_without_embeddings():
+    transport, _ = _flaky_transport(failures=100, status=503)
+
+    async def go():
+        async with EmbeddingClient("test-key", base_url="http://fake", client=httpx.AsyncClient(transport=transport),
+                                   requests_per_second=1000, max_retries=1, backoff_base=0) as client:
+            return [embeddings async for _, embeddings in client.embed_batches(["a", "b"])]
+
+    assert _run(go()) == [None]
+
+
+def test_non_retryable_errors_raise():
+    transport, attempts = _flaky_transport(failures=1, status=400)
+
+    async def go():
+        async with EmbeddingClient("test-key", base_url="http://fake", client=httpx.AsyncClient(transport=transport),
+                                   requests_per_second=1000) as client:
+            await client.embed_batch(["a"])
+
+    with pytest.raises(EmbeddingError):
+        _run(go())
+    assert len(attempts) == 1
+
+
+def test_legacy_endpoint_setting_moves_both_calls():
+    endpoint = "http://fake/v1beta/models/embedding-001:embedContent"
+    assert base_url_from_endpoint(endpoint) == "http://fake/v1beta"
+    assert base_url_from_endpoint(None) is None
+
+    client = EmbeddingClient("test-key", base_url=base_url_from_endpoint(endpoint))
+    assert client.url == "http://fake/v1beta/models/embedding-001:batchEmbedContents"
+    assert client.embed_url == endpoint
@@ -0,0 +1,97 @@
+import asyncio
+import contextlib
+from types import SimpleNamespace
+
+from fastapi import FastAPI
+from pydantic import BaseModel
+
+import evaluate
+
+TEXTS = ["exam nerves", "work deadlines", "uncached: new every time"]
+LABELS = ["anxiety", "stress", "anxiety"]
+
+
+class AnalyzeRequest(BaseModel):
+    text: str
+
+
+class StandInMain:
+    """
+    The parts of main.py evaluate() drives. Query embeddings are cached per index,
+    except for texts starting with "uncached", which cost a request every time.
+    """
+
+    ANALYZE_BUDGET = 5.0
+    SEARCH_TIMEOUT = 1.0
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+        self.embedder = SimpleNamespace(requests=0)
+        self.cache = set()
+        self.index = "startup"
+        self.requests = []  # (index, classifier mode) per /analyze call
+        self.CLASSIFIER_MODE = "auto"
+        self.SEARCH_TOP_K = 5
+        self.CLASSIFY_PROMPT = "default"
+        self.app = FastAPI()
+
+        @self.app.post("/analyze")
+        async def analyze(request: AnalyzeRequest):
+            self.requests.append((self.index, self.CLASSIFIER_MODE))
+            await self.get_query_embedding(request.text)
+            if self.CLASSIFIER_MODE == "llm":
+                self.recorder.calls += 1
+            return {"prediction": "anxiety", "metadata": {"decision_path": self.CLASSIFIER_MODE}}
+
+    @contextlib.asynccontextmanager
+    async def lifespan(self, app):
+        yield
+
+    def warm_up(self):
+        return True
+
+    async def get_query_embedding(self, text):
+        if (self.index, text) not in self.cache:
+            self.embedder.requests += 1
+            if not text.startswith("uncached"):
+                self.cache.add((self.index, text))
+
+    def set_index(self, index):
+        self.index = index
+
+
+def _evaluate(tmp_path, configs):
+    recorder = SimpleNamespace(calls=0, upstream=0)
+    main = StandInMain(recorder)
+    indexes = {"a": "a", "b": "b"}
+    reports, embedding_requests = asyncio.run(evaluate.evaluate(
+        main, recorder, TEXTS, LABELS, configs, {"default": "default"}, indexes, 4, str(tmp_path / "app.log")
+    ))
+    return main, reports, embedding_requests
+
+
+def test_each_index_gets_an_untimed_knn_pass_before_its_configurations(tmp_path, capsys):
+    configs = evaluate.build_grid([5], ["auto", "llm"], ["default"], ["a", "b"])
+    main, reports, _ = _evaluate(tmp_path, configs)
+
+    warm_up = main.requests[:2 * len(TEXTS)]
+    assert warm_up == [("a", "knn")] * len(TEXTS) + [("b", "knn")] * len(TEXTS)
+    assert len(main.requests) == (2 + len(configs)) * len(TEXTS)
+    assert [report["decision_paths"] for report in reports] == [
+        {config["classifier"]: len(TEXTS)} for config in configs
+    ]
+    assert "🔥 Warmed up 2 index(es)" in capsys.readouterr().out
+
+
+def test_embedding_requests_are_counted_per_configuration(tmp_path):
+    configs = evaluate.build_grid([5], ["auto", "llm"], ["default"], ["a", "b"])
+    main, reports, embedding_requests = _evaluate(tmp_path, configs)
+
+    # The up-front prefetch embeds each text once, on the index loaded at startup
+    assert embedding_requests == len(TEXTS)
+    # Index b's cold cache is filled by its warm-up pass, not billed to its first configuration
+    assert [report["upstream_calls"]["embedding"] for report in reports] == [1, 1, 1, 1]
+    assert [report["upstream_calls"]["llm"] for report in reports] == [
+        len(TEXTS) if config["classifier"] == "llm" else 0 for config in configs
+    ]
+    assert main.embedder.requests == len(TEXTS) + 2 * len(TEXTS) + len(configs)
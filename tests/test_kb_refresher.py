@@ -0,0 +1,127 @@
+import json
+import os
+
+import boto3
+import numpy as np
+import pytest
+from botocore.config import Config
+
+from fake_services import FakeServer, create_fake_app
+from kb_refresher import FileSource, NotFound, Refresher, S3Source, download_store
+from vector_store import load_store, write_store
+
+
+@pytest.fixture
+def s3(tmp_path):
+    """
+    (S3Source over the fake S3 endpoint serving tmp_path/bucket, that directory, the fake app).
+    """
+    root = tmp_path / "bucket"
+    root.mkdir()
+    app = create_fake_app(s3_root=str(root))
+    with FakeServer(app) as url:
+        client = boto3.client(
+            "s3",
+            endpoint_url=url,
+            region_name="us-east-1",
+            aws_access_key_id="test",
+            aws_secret_access_key="test",
+            config=Config(s3={"addressing_style": "path"}, retries={"max_attempts": 1}),
+        )
+        yield S3Source("bucket", client=client), root, app
+
+
+def test_s3_fetch_is_conditional_on_the_etag(s3):
+    source, root, app = s3
+    (root / "kb.json").write_text('{"stress": {}}')
+
+    body, etag = source.fetch("kb.json")
+    assert body == b'{"stress": {}}'
+    assert source.fetch("kb.json", etag) == (None, etag)
+
+    (root / "kb.json").write_text('{"anxiety": {}}')
+    body, new_etag = source.fetch("kb.json", etag)
+    assert body == b'{"anxiety": {}}' and new_etag != etag
+    with pytest.raises(NotFound):
+        source.fetch("missing.json")
+    assert app.state.calls["s3"] == 4
+
+
+def test_refresher_reloads_only_changed_objects(s3):
+    source, root, _ = s3
+    (root / "kb.json").write_text('{"v": 1}')
+    loaded = []
+    refresher = Refresher(source)
+    refresher.watch("knowledge_base", "kb.json", lambda body: loaded.append(json.loads(body)) or str(len(loaded)))
+
+    assert refresher.poll_once() == ["knowledge_base"]
+    assert refresher.poll_once() == []
+    (root / "kb.json").write_text('{"v": 2}')
+    assert refresher.poll_once() == ["knowledge_base"]
+    assert loaded == [{"v": 1}, {"v": 2}]
+    assert refresher.status()["knowledge_base"]["version"] == "2"
+
+
+def test_failed_apply_keeps_the_current_version_and_retries(tmp_path):
+    (tmp_path / "kb.json").write_text('{"v": 1}')
+    refresher = Refresher(FileSource(str(tmp_path)))
+    current = {}
+
+    def apply(body):
+        data = json.loads(body)
+        current.update(data)
+        return str(data["v"])
+
+    refresher.watch("knowledge_base", "kb.json", apply)
+    refresher.poll_once()
+
+    (tmp_path / "kb.json").write_text("not json")
+    with pytest.raises(ValueError):
+        refresher.poll_once()
+    status = refresher.status()["knowledge_base"]
+    assert status["version"] == "1" and status["failures"] == 1 and status["last_error"]
+    assert current == {"v": 1}
+
+    # The etag was not advanced, so a fixed object is picked up on the next poll
+    (tmp_path / "kb.json").write_text('{"v": 3}')
+    assert refresher.poll_once() == ["knowledge_base"]
+    assert refresher.status()["knowledge_base"]["failures"] == 0
+
+
+def test_vector_store_is_downloaded_through_s3_and_verified(s3, tmp_path):
+    source, root, _ = s3
+    header = write_store(
+        str(tmp_path / "built"), np.eye(4, dtype=np.float32), list("abcd"), ["stress"] * 4, version=7,
+    )
+    built = os.path.realpath(tmp_path / "built")
+    (root / "store").mkdir()
+    for name in os.listdir(built):
+        os.link(os.path.join(built, name), root / "store" / name)
+
+    header_body = (root / "store" / "header.json").read_bytes()
+    path = download_store(source, "store", header_body, str(tmp_path / "cache"))
+    assert load_store(path, verify=True).header["checksum"] == header["checksum"]
+    assert os.path.basename(path).startswith("v7-")
+
+
+def test_failed_knowledge_base_load_keeps_the_worker_unready(monkeypatch):
+    import main
+    from startup import Startup
+
+    def unavailable(key, etag=None):
+        raise OSError("S3 unavailable")
+
+    monkeypatch.setattr(main, "CATEGORIES", {})
+    monkeypatch.setattr(main.REFRESHER.source, "fetch", unavailable)
+    with pytest.raises(OSError):
+        main.load_categories()
+
+    startup = Startup()
+    startup.register("knowledge_base", main.load_categories, is_loaded=main.STARTUP.resources["knowledge_base"].is_loaded)
+    startup.resources["knowledge_base"].retry_base = 60.0
+    assert not startup.wait(timeout=5)
+    assert not startup.is_ready()
+
+    # The refresher's next successful poll makes the worker ready without waiting for the retry
+    monkeypatch.setattr(main, "CATEGORIES", {"normal": {"tips": []}})
+    assert startup.is_ready()
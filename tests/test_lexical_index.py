@@ -0,0 +1,67 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from lexical_index import BM25Index, tokenize
+
+STATEMENTS = [
+    "I can't sleep at night and my heart is racing",
+    "Work deadlines keep piling up",
+    "My heart feels heavy since the breakup",
+    "Racing thoughts keep me up at night, every night",
+    "Everything is fine today",
+]
+
+
+def _reference_scores(statements, query, k1=1.2, b=0.75):
+    # Textbook BM25 (Lucene idf), one document at a time
+    docs = [tokenize(statement) for statement in statements]
+    average = sum(len(doc) for doc in docs) / len(docs)
+    scores = []
+    for doc in docs:
+        freqs = Counter(doc)
+        score = 0.0
+        for term in set(tokenize(query)):
+            doc_freq = sum(term in other for other in docs)
+            if term not in freqs:
+                continue
+            idf = math.log(1 + (len(docs) - doc_freq + 0.5) / (doc_freq + 0.5))
+            freq = freqs[term]
+            score += idf * freq * (k1 + 1) / (freq + k1 * (1 - b + b * len(doc) / average))
+        scores.append(score)
+    return scores
+
+
+def test_scores_match_the_bm25_formula():
+    index = BM25Index.build(STATEMENTS, k1=1.2, b=0.75)
+    query = "racing heart at night"
+    expected = _reference_scores(STATEMENTS, query)
+
+    ids, scores = index.search(query, k=len(STATEMENTS))
+
+    assert list(ids) == sorted((i for i, s in enumerate(expected) if s > 0), key=lambda i: -expected[i])
+    assert scores == pytest.approx([expected[i] for i in ids], rel=1e-5)
+
+
+def test_top_k_keeps_the_full_ranking_order():
+    rng = np.random.default_rng(0)
+    words = ["anxious", "tired", "work", "sleep", "heart", "night", "sad", "calm"]
+    statements = [" ".join(rng.choice(words, size=rng.integers(1, 8))) for _ in range(200)]
+    index = BM25Index.build(statements)
+
+    all_ids, all_scores = index.search("tired sad night", k=len(statements))
+    ids, scores = index.search("tired sad night", k=7)
+
+    assert np.all(np.diff(all_scores) <= 0)
+    assert list(scores) == list(all_scores[:7])
+    # Ties may come out in either order, but the set at each score must agree
+    assert set(ids) <= set(all_ids[all_scores >= scores[-1]])
+
+
+def test_stopwords_and_unknown_terms_match_nothing():
+    index = BM25Index.build(STATEMENTS)
+    ids, scores = index.search("the and my zebra", k=3)
+    assert len(ids) == 0 and len(scores) == 0
+    assert tokenize("I'm at the doctor's") == ["doctors"]
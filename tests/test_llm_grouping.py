@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+import main
+from fake_services import fake_generation
+
+CATEGORIES = {name: {"tips": []} for name in ("anxiety", "stress", "normal")}
+
+
+class Response:
+    def __init__(self, text):
+        self.text = text
+
+
+class RecordingModel:
+    """
+    Stands in for the Gemini model: records prompts and answers them with `answer(prompt)`.
+    """
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        await asyncio.sleep(0.01)
+        return Response(self.answer(prompt))
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    monkeypatch.setattr(main, "CATEGORIES", CATEGORIES)
+
+    def install(answer):
+        model = RecordingModel(answer)
+        monkeypatch.setattr(main, "model", model)
+        return model
+
+    return install
+
+
+def test_grouped_prompt_is_built_from_the_configured_prompt(gemini, monkeypatch):
+    monkeypatch.setattr(main, "CLASSIFY_PROMPT", "Custom prompt for {text} with {similar}\nOnly return the category name.")
+    model = gemini(lambda prompt: "1: anxiety\n2: Stress.")
+    similar = [{"statement": "I can't breathe", "category": "anxiety"}]
+
+    categories = asyncio.run(main.classify_group_with_gemini([("first", similar), ("second", [])]))
+
+    assert categories == ["anxiety", "stress"]
+    (prompt,) = model.prompts
+    assert "<task 1>\nCustom prompt for first with - \"I can't breathe\" (Category: anxiety)" in prompt
+    assert "<task 2>\nCustom prompt for second with \nOnly return the category name.\n</task 2>" in prompt
+
+
+def test_unusable_item_answer_is_classified_on_its_own(gemini):
+    model = gemini(lambda prompt: "1: anxiety\n2: not sure" if "<task" in prompt else "stress")
+
+    categories = asyncio.run(main.classify_texts([("first", []), ("second", []), ("third", [])]))
+
+    # Item 2 had a bad answer and item 3 none; each is asked again alone
+    assert categories == ["anxiety", "stress", "stress"]
+    assert len(model.prompts) == 3
+    assert ["second" in p for p in model.prompts[1:]].count(True) == 1
+    assert not any("<task" in p or "first" in p for p in model.prompts[1:])
+
+
+@pytest.mark.skipif(main.LLM_GROUPING, reason="LLM_GROUPING is enabled in the environment")
+def test_concurrent_requests_share_only_identical_texts(gemini):
+    model = gemini(lambda prompt: "anxiety")
+
+    async def classify_concurrently():
+        texts = ["I feel anxious", "i feel  ANXIOUS", "Work is too much"]
+        return await asyncio.gather(*(main.LLM_BATCHER.submit((text, [])) for text in texts))
+
+    assert asyncio.run(classify_concurrently()) == ["anxiety"] * 3
+    # One single-text prompt per distinct text; different users' texts never share a prompt
+    assert len(model.prompts) == 2
+    assert not any("<task" in p for p in model.prompts)
+
+
+def test_fake_gemini_answers_grouped_tasks_like_single_prompts():
+    items = [("I feel anxious", []), ("Work is too much", [{"statement": "deadlines", "category": "stress"}])]
+    singles = [fake_generation(main.build_classify_prompt(text, similar)) for text, similar in items]
+    tasks = "\n\n".join(
+        f"<task {i}>\n{main.build_classify_prompt(text, similar).strip()}\n</task {i}>"
+        for i, (text, similar) in enumerate(items, start=1)
+    )
+
+    answer = fake_generation(main.GROUP_PROMPT.format(count=len(items), tasks=tasks))
+
+    assert answer.splitlines() == [f"{i}: {category}" for i, category in enumerate(singles, start=1)]
@@ -0,0 +1,85 @@
+import multiprocessing
+import random
+import sys
+
+import pytest
+
+import prepare_comprehend_dataset as prepare
+from prepare_comprehend_dataset import map_to_category
+
+LABELS = ["feeling sad", "panic attack", "work stress", "happy", "kill myself", "drinking"]
+WORDS = ["I", "was", "running", "to", "the", "stores", "and", "crying", "about", "my", "cats", "today", "can't", "sleep"]
+
+
+class StubLemmatizer:
+    """
+    Stands in for WordNetLemmatizer, whose corpus may not be installed: crude plural stripping.
+    """
+
+    def lemmatize(self, token):
+        return token[:-1] if token.endswith("s") and len(token) > 3 else token
+
+
+class StubStopwords:
+    def words(self, language):
+        return ["i", "was", "to", "the", "and", "about", "my"]
+
+
+@pytest.fixture
+def stub_nltk(monkeypatch):
+    monkeypatch.setattr(prepare, "ensure_nltk_resources", lambda: None)
+    monkeypatch.setattr(prepare, "WordNetLemmatizer", StubLemmatizer)
+    monkeypatch.setattr(prepare, "stopwords", StubStopwords())
+    monkeypatch.setattr(prepare, "lemmatizer", None)
+    monkeypatch.setattr(prepare, "stop_words", None)
+    monkeypatch.setattr(prepare, "_lemmas", {})
+    # Forked workers inherit the stubs; spawned ones would re-import the real NLTK
+    monkeypatch.setattr(prepare, "multiprocessing", multiprocessing.get_context("fork"))
+
+
+def _write_csv(path, rows=3000, seed=7):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(rows):
+            text = " ".join(rng.choice(WORDS) for _ in range(rng.randint(0, 12)))
+            f.write(f'"{text}",{rng.choice(LABELS)}\n')
+
+
+def _prepare(monkeypatch, input_path, output_dir, *extra):
+    argv = ["prepare_comprehend_dataset.py", "--input", str(input_path), "--output-dir", str(output_dir), *extra]
+    monkeypatch.setattr(sys, "argv", argv)
+    prepare.main()
+    return {name: (output_dir / name).read_bytes() for name in ("comprehend_train.csv", "comprehend_test.csv")}
+
+
+def test_streaming_output_is_byte_identical(tmp_path, monkeypatch, stub_nltk):
+    input_path = tmp_path / "data.csv"
+    _write_csv(input_path)
+
+    single = _prepare(monkeypatch, input_path, tmp_path / "single")
+    # Uneven chunks across two workers, with more chunks than fit in flight at once
+    streamed = _prepare(
+        monkeypatch, input_path, tmp_path / "streamed", "--stream", "--workers", "2", "--chunksize", "137"
+    )
+
+    assert single["comprehend_train.csv"]
+    assert streamed == single
+
+
+def test_shared_keyword_maps_the_same_alone_and_in_a_phrase():
+    # Listed under suicidal and addiction; suicidal comes first in CATEGORY_PRIORITY
+    assert map_to_category("pills") == "suicidal"
+    assert map_to_category(" Pills! ") == "suicidal"
+    # Listed under anxiety and abuse; KEYWORD_OVERRIDES picks anxiety
+    assert map_to_category("panic") == "anxiety"
+    assert map_to_category("sudden panic at night") == "anxiety"
+    assert map_to_category("overwhelmed") == map_to_category("feeling overwhelmed") == "anxiety"
+    assert map_to_category("paranoid") == "anxiety"
+
+
+def test_generic_keywords_do_not_outrank_specific_ones():
+    assert map_to_category("stress at work, almost done") == "stress"
+    assert map_to_category("feeling at peace") is None
+    assert map_to_category("almost done") is None
+    assert map_to_category("I want to die, final note") == "suicidal"
+    assert map_to_category("panic attack at the hospital") == "anxiety"
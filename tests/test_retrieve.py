@@ -0,0 +1,68 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import main
+import semantic_search
+from lexical_index import BM25Index
+from semantic_search import VectorIndex
+
+STATEMENTS = ["heart racing before every exam", "deadlines at work never stop", "feeling calm after a walk"]
+
+
+@pytest.fixture(autouse=True)
+def index(monkeypatch):
+    rng = np.random.default_rng(5)
+    index = VectorIndex(rng.normal(size=(3, 8)).astype(np.float32), STATEMENTS, ["anxiety", "stress", "normal"])
+    index.lexical = BM25Index.build(STATEMENTS)
+    monkeypatch.setattr(semantic_search, "INDEX", index)
+    monkeypatch.setattr(main, "DEGRADE_ON_FAILURE", True)
+    return index
+
+
+def _slow_embedding(seconds):
+    async def embed(text):
+        await asyncio.sleep(seconds)
+        return np.ones(8, dtype=np.float32)
+    return embed
+
+
+def test_budget_caps_each_stage_by_the_time_left():
+    budget = main.Budget(1.0)
+    assert budget.timeout(5.0) == pytest.approx(1.0, abs=0.05)
+    assert budget.timeout(0.2) == 0.2
+    budget.deadline = time.monotonic() - 1
+    assert budget.timeout(5.0) == 0.0
+
+
+def test_embedding_past_the_budget_falls_back_to_lexical_search(monkeypatch):
+    monkeypatch.setattr(main, "get_query_embedding", _slow_embedding(5.0))
+
+    start = time.monotonic()
+    similar, mode = asyncio.run(main.retrieve("exam nerves, heart racing", main.Budget(0.1)))
+
+    assert time.monotonic() - start < 2.0
+    assert mode == "lexical"
+    assert similar[0]["statement"] == STATEMENTS[0]
+    assert similar[0]["score"] == 0.0 and similar[0]["lexical_score"] > 0
+
+
+def test_embedding_past_the_budget_times_out_without_degrading(monkeypatch):
+    monkeypatch.setattr(main, "get_query_embedding", _slow_embedding(5.0))
+    monkeypatch.setattr(main, "DEGRADE_ON_FAILURE", False)
+
+    with pytest.raises(main.StageTimeout) as error:
+        asyncio.run(main.retrieve("heart racing", main.Budget(0.1)))
+    assert error.value.stage == "embedding"
+
+
+def test_embedding_within_the_budget_uses_hybrid_search(monkeypatch, index):
+    monkeypatch.setattr(main, "get_query_embedding", _slow_embedding(0.0))
+    monkeypatch.setattr(main, "COALESCING_ENABLED", False)
+
+    similar, mode = asyncio.run(main.retrieve("heart racing", main.Budget(5.0)))
+
+    assert mode == ("hybrid" if semantic_search.HYBRID_SEARCH else "dense")
+    assert similar == semantic_search.find_similar_statements_hybrid(np.ones(8), "heart racing", main.SEARCH_TOP_K)
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from lexical_index import BM25Index
+from semantic_search import VectorIndex, _top_k_indices
+
+STATEMENTS = [
+    "panic attack on the train",
+    "my chest is tight and my heart is racing",
+    "deadlines at work never stop",
+    "heart racing before every exam",
+    "feeling calm after a long walk",
+    "cannot stop crying at night",
+]
+CATEGORIES = ["anxiety", "anxiety", "stress", "anxiety", "normal", "depression"]
+
+
+@pytest.fixture
+def index():
+    rng = np.random.default_rng(3)
+    index = VectorIndex(rng.normal(size=(len(STATEMENTS), 16)).astype(np.float32), STATEMENTS, CATEGORIES)
+    index.lexical = BM25Index.build(STATEMENTS)
+    return index
+
+
+@pytest.mark.parametrize("k", [1, 7, 199, 200, 500])
+def test_top_k_matches_a_full_sort(k):
+    rng = np.random.default_rng(1)
+    similarities = rng.normal(size=(4, 200)).astype(np.float32)
+
+    expected = np.argsort(-similarities, axis=1, kind="stable")[:, :k]
+    np.testing.assert_array_equal(_top_k_indices(similarities, k), expected)
+
+
+def test_search_many_ranks_rows_as_a_full_sort_would():
+    rng = np.random.default_rng(2)
+    matrix = rng.normal(size=(300, 16)).astype(np.float32)
+    index = VectorIndex(matrix, [str(i) for i in range(300)], ["normal"] * 300)
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+
+    for query, results in zip(queries, index.search_many(queries, k=10)):
+        normalized = query / np.linalg.norm(query)
+        similarities = index.matrix @ normalized
+        expected = np.argsort(-similarities, kind="stable")[:10]
+        assert [r["statement"] for r in results] == [str(row) for row in expected]
+        assert [r["score"] for r in results] == [round(float(similarities[row]), 3) for row in expected]
+        assert index.search(query, k=10) == results
+
+
+def _rrf(rankings, rrf_k):
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(fused, key=lambda row: (-fused[row], row))
+
+
+def test_hybrid_order_is_reciprocal_rank_fusion(index):
+    query = index.matrix[4] + 0.3 * index.matrix[2]
+    text = "heart racing"
+    dense_ids, _ = index.search_ids(query, k=len(STATEMENTS))
+    lexical_ids, _ = index.lexical.search(text, k=len(STATEMENTS))
+
+    results = index.hybrid_search(query, text, k=4, candidates=len(STATEMENTS), rrf_k=60)
+
+    expected = _rrf([dense_ids, lexical_ids], 60)[:4]
+    assert [r["statement"] for r in results] == [STATEMENTS[row] for row in expected]
+    # Scores stay cosine similarities for the kNN vote
+    normalized = query / np.linalg.norm(query)
+    assert [r["score"] for r in results] == [round(float(index.matrix[row] @ normalized), 3) for row in expected]
+
+
+def test_rows_found_by_both_rankings_outrank_single_ranking_leaders(index):
+    # Row 3 is second by dense and first by BM25; row 4 leads dense only
+    query = index.matrix[4] + 0.9 * index.matrix[3]
+    dense_ids, _ = index.search_ids(query, k=2)
+    assert list(dense_ids) == [4, 3]
+
+    results = index.hybrid_search(query, "exam", k=2, candidates=len(STATEMENTS))
+    assert results[0]["statement"] == STATEMENTS[3]
+
+
+def test_hybrid_many_matches_one_query_at_a_time(index):
+    rng = np.random.default_rng(4)
+    queries = rng.normal(size=(3, 16)).astype(np.float32)
+    texts = ["heart racing", "work deadlines", "crying at night"]
+
+    many = index.hybrid_search_many(queries, texts, k=3)
+
+    assert many == [index.hybrid_search(query, text, k=3) for query, text in zip(queries, texts)]
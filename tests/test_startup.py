@@ -0,0 +1,86 @@
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+from startup import Startup
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend")
+IMPORT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1000"))
+# Loaded on first use (Gemini client, S3, HNSW, ...), never while the API module imports
+DEFERRED_MODULES = ("google.generativeai", "boto3", "botocore", "hnswlib", "sklearn", "pandas", "scipy", "grpc")
+
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_failed_load_is_retried_until_it_succeeds():
+    available = threading.Event()
+    attempts = []
+
+    def flaky():
+        attempts.append(1)
+        if not available.is_set():
+            raise RuntimeError("S3 unavailable")
+
+    startup = Startup()
+    startup.register("knowledge_base", flaky)
+    startup.resources["knowledge_base"].retry_base = 0.01
+
+    assert not startup.wait(timeout=5)
+    assert startup.status()["knowledge_base"]["error"] == "S3 unavailable"
+    assert _wait_until(lambda: len(attempts) >= 2)
+    assert not startup.is_ready()
+
+    available.set()
+    assert _wait_until(startup.is_ready)
+    assert startup.status()["knowledge_base"]["error"] is None
+
+
+def test_resource_loaded_elsewhere_clears_a_failed_start():
+    loaded = threading.Event()
+
+    def always_fails():
+        raise RuntimeError("no index yet")
+
+    startup = Startup()
+    startup.register("index", always_fails, is_loaded=loaded.is_set)
+    startup.resources["index"].retry_base = 60.0
+
+    assert not startup.wait(timeout=5)
+    # e.g. the vector store refresher swapped an index in
+    loaded.set()
+    assert startup.is_ready()
+    status = startup.status()["index"]
+    assert status["ready"] and status["error"] is None
+
+
+def _import_main(code):
+    result = subprocess.run([sys.executable, *code], cwd=BACKEND_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr[-2000:]
+    return result
+
+
+def _import_ms():
+    # Cumulative microseconds for the top-level `main` import, as reported by -X importtime
+    stderr = _import_main(["-X", "importtime", "-c", "import main"]).stderr
+    return int(re.search(r"import time:\s+\d+ \|\s+(\d+) \| main$", stderr, re.M).group(1)) / 1000
+
+
+def test_import_time_budget():
+    # Best of three, so one slow run on a busy machine does not fail the budget
+    total_ms = min(_import_ms() for _ in range(3))
+    assert total_ms <= IMPORT_BUDGET_MS, f"import main took {total_ms:.0f} ms (budget {IMPORT_BUDGET_MS:.0f} ms)"
+
+
+def test_heavy_dependencies_are_not_imported_with_main():
+    stdout = _import_main(["-c", f"import sys, main; print([m for m in {DEFERRED_MODULES!r} if m in sys.modules])"]).stdout
+    assert stdout.strip() == "[]"
@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import telemetry
+from telemetry import Registry, SamplingProfiler, TelemetryMiddleware, span
+
+
+def test_registry_renders_the_prometheus_text_format():
+    registry = Registry()
+    counter = registry.counter("calls_total", "Upstream calls", ("kind",))
+    counter.inc(kind="embed")
+    counter.inc(2, kind='say "hi"\n')
+    registry.callback("queue_depth", "Items waiting", "gauge", lambda: [({"queue": "llm"}, 3)], ("queue",))
+
+    assert registry.render() == (
+        "# HELP calls_total Upstream calls\n"
+        "# TYPE calls_total counter\n"
+        'calls_total{kind="embed"} 1.0\n'
+        'calls_total{kind="say \\"hi\\"\\n"} 2.0\n'
+        "# HELP queue_depth Items waiting\n"
+        "# TYPE queue_depth gauge\n"
+        'queue_depth{queue="llm"} 3.0\n'
+    )
+
+
+def test_a_failing_metric_does_not_break_the_scrape():
+    registry = Registry()
+    registry.callback("broken", "Raises", "gauge", lambda: 1 / 0)
+    registry.counter("ok_total", "Fine").inc()
+
+    assert registry.render().endswith("# TYPE ok_total counter\nok_total 1.0\n")
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = Registry()
+    histogram = registry.histogram("latency_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+    for seconds in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(seconds, stage="search")
+
+    assert histogram.samples() == [
+        'latency_seconds_bucket{stage="search",le="0.1"} 2',
+        'latency_seconds_bucket{stage="search",le="1.0"} 3',
+        'latency_seconds_bucket{stage="search",le="+Inf"} 4',
+        'latency_seconds_sum{stage="search"} 3.65',
+        'latency_seconds_count{stage="search"} 4',
+    ]
+
+
+def _app():
+    app = FastAPI()
+    app.add_middleware(TelemetryMiddleware)
+
+    @app.get("/loop")
+    async def loop():
+        # Async routes run on the event loop thread
+        app.state.loop_thread = threading.current_thread()
+        return {}
+
+    @app.get("/stages")
+    def stages():
+        with span("embedding"):
+            pass
+        with span("search"):
+            pass
+        with span("search"):
+            pass
+        return {}
+
+    return app
+
+
+def test_server_timing_lists_each_stage_of_the_request(monkeypatch):
+    monkeypatch.setattr(telemetry, "METRICS_ENABLED", True)
+    with TestClient(_app()) as client:
+        response = client.get("/stages", headers={"X-Request-ID": "req-1"})
+
+    assert response.headers["x-request-id"] == "req-1"
+    entries = [entry.split(";dur=") for entry in response.headers["server-timing"].split(", ")]
+    assert [stage for stage, _ in entries] == ["embedding", "search"]
+    assert all(float(ms) >= 0 for _, ms in entries)
+
+
+def test_profile_is_stopped_and_saved_off_the_event_loop(monkeypatch, tmp_path):
+    monkeypatch.setattr(telemetry, "PROFILE_TOKEN", "secret")
+    monkeypatch.setattr(telemetry, "PROFILE_DIR", str(tmp_path))
+    stopped_on = []
+    stop = SamplingProfiler.stop
+
+    def recording_stop(self):
+        stopped_on.append(threading.current_thread())
+        return stop(self)
+
+    monkeypatch.setattr(SamplingProfiler, "stop", recording_stop)
+    app = _app()
+    with TestClient(app) as client:
+        response = client.get("/loop", headers={"X-Request-ID": "profiled", "X-Profile": "secret"})
+
+    assert response.headers["x-profile-id"] == "profiled"
+    assert (tmp_path / "profiled.folded").exists()
+    assert len(stopped_on) == 1 and stopped_on[0] is not app.state.loop_thread
+
+
+@pytest.mark.parametrize("request_id", ["../../etc/passwd", "x" * 65, ""])
+def test_unsafe_request_ids_are_replaced(request_id):
+    with TestClient(_app()) as client:
+        response = client.get("/stages", headers={"X-Request-ID": request_id})
+    assert response.headers["x-request-id"] != request_id
+    assert len(response.headers["x-request-id"]) == 32
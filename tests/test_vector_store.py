@@ -0,0 +1,192 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from kb_refresher import FileSource, download_store
+from vector_store import (
+    KEEP_VERSIONS, VERSIONS_SUFFIX, StoreFormatError, StoreWriter, load_store, store_files, write_store,
+)
+
+
+def _write(path, rows, version):
+    rng = np.random.default_rng(version)
+    return write_store(
+        path,
+        rng.normal(size=(rows, 4)).astype(np.float32),
+        [f"statement {i}" for i in range(rows)],
+        ["anxiety" if i % 2 else "stress" for i in range(rows)],
+        version=version,
+    )
+
+
+def test_store_path_is_a_symlink_swapped_to_each_new_version(tmp_path):
+    path = str(tmp_path / "vector_store")
+    _write(path, 3, version=1)
+    first = os.path.realpath(path)
+    assert os.path.islink(path)
+
+    _write(path, 5, version=2)
+    assert os.path.realpath(path) != first
+    assert load_store(path).header["count"] == 5
+    # The previous version survives for readers that resolved the link before the swap
+    assert load_store(first).header["count"] == 3
+
+
+def test_old_versions_are_pruned(tmp_path):
+    path = str(tmp_path / "vector_store")
+    for version in range(1, 5):
+        _write(path, 2, version)
+    assert len(os.listdir(path + VERSIONS_SUFFIX)) == KEEP_VERSIONS
+    assert os.path.basename(os.path.realpath(path)) in os.listdir(path + VERSIONS_SUFFIX)
+
+
+def test_plain_directory_store_is_migrated(tmp_path):
+    path = str(tmp_path / "vector_store")
+    _write(path, 2, version=1)
+    # Recreate a pre-versioning layout: the store as a real directory
+    target = os.path.realpath(path)
+    os.remove(path)
+    os.rename(target, path)
+
+    _write(path, 4, version=2)
+    assert os.path.islink(path)
+    assert load_store(path).header["count"] == 4
+
+
+def test_loaded_store_is_pinned_to_one_version(tmp_path):
+    path = str(tmp_path / "vector_store")
+    _write(path, 3, version=1)
+    stored = load_store(path)
+    _write(path, 6, version=2)
+    assert len(stored.statements) == 3
+    assert stored.statements[2] == "statement 2"
+
+
+def test_verify_covers_every_store_file(tmp_path):
+    path = str(tmp_path / "vector_store")
+    header = write_store(
+        path, np.eye(3, dtype=np.float32), ["a", "b", "c"], ["x", "y", "x"], quantizations=("float16", "int8"),
+    )
+    assert set(header["files"]) == set(store_files(header))
+    load_store(path, verify=True)
+
+    for name in store_files(header):
+        file_path = os.path.join(os.path.realpath(path), name)
+        with open(file_path, "rb") as f:
+            original = f.read()
+        with open(file_path, "wb") as f:
+            f.write(bytes([original[0] ^ 1]) + original[1:])
+        with pytest.raises(StoreFormatError):
+            load_store(path, verify=True)
+        with open(file_path, "wb") as f:
+            f.write(original)
+
+
+def test_download_store_rejects_a_partially_uploaded_store(tmp_path):
+    source_root = tmp_path / "bucket"
+    header = _write(str(source_root / "kb"), 4, version=3)
+    store = os.path.realpath(source_root / "kb")
+    os.remove(source_root / "kb")
+    os.rename(store, source_root / "kb")
+    with open(source_root / "kb" / "statements.bin", "r+b") as f:
+        f.truncate(3)
+
+    with pytest.raises(StoreFormatError):
+        download_store(FileSource(str(source_root)), "kb", json.dumps(header).encode(), str(tmp_path / "cache"))
+
+
+def test_store_writer_blocks_match_a_one_shot_write(tmp_path):
+    rng = np.random.default_rng(7)
+    matrix = rng.normal(size=(10, 4)).astype(np.float32)
+    statements = [f"statement é {i}" for i in range(10)]
+    categories = ["stress", "anxiety"] * 5
+
+    write_store(str(tmp_path / "whole"), matrix, statements, categories, quantizations=("int8",))
+    with StoreWriter(str(tmp_path / "blocks"), 4, quantizations=("int8",)) as writer:
+        for start in range(0, 10, 3):
+            writer.append(matrix[start:start + 3], statements[start:start + 3], categories[start:start + 3])
+        writer.commit()
+
+    whole, blocks = load_store(str(tmp_path / "whole")), load_store(str(tmp_path / "blocks"), verify=True)
+    assert np.array_equal(whole.embeddings, blocks.embeddings)
+    assert list(whole.statements) == list(blocks.statements) == statements
+    assert list(whole.categories) == list(blocks.categories) == categories
+    assert np.array_equal(whole.quantized["int8"][0], blocks.quantized["int8"][0])
+
+
+def test_unfinished_store_writer_leaves_the_served_store_alone(tmp_path):
+    path = str(tmp_path / "vector_store")
+    _write(path, 3, version=1)
+    served = os.path.realpath(path)
+    with pytest.raises(RuntimeError):
+        with StoreWriter(path, 4, version=2) as writer:
+            writer.append(np.ones((1, 4)), ["x"], ["stress"])
+            raise RuntimeError("build failed")
+    assert os.path.realpath(path) == served
+    assert os.listdir(path + VERSIONS_SUFFIX) == [os.path.basename(served)]
+
+
+def test_extending_writer_appends_without_rewriting_served_rows(tmp_path):
+    path = str(tmp_path / "vector_store")
+    _write(path, 3, version=1)
+    first = os.path.realpath(path)
+    inode = os.stat(os.path.join(first, "embeddings.f32")).st_ino
+
+    with StoreWriter.extending(path, version=2) as writer:
+        writer.append(np.ones((2, 4)), ["new 0", "new 1"], ["bipolar", "stress"])
+        header = writer.commit()
+
+    second = load_store(path, verify=True)
+    assert header["count"] == 5
+    assert os.stat(os.path.join(os.path.realpath(path), "embeddings.f32")).st_ino == inode
+    assert list(second.statements)[3:] == ["new 0", "new 1"]
+    assert list(second.categories)[3:] == ["bipolar", "stress"]
+    # The previous version still reads (and verifies) as exactly its own rows
+    previous = load_store(first, verify=True)
+    assert len(previous.statements) == 3 and previous.embeddings.shape == (3, 4)
+
+
+def test_abandoned_extension_does_not_leak_into_the_next(tmp_path):
+    path = str(tmp_path / "vector_store")
+    _write(path, 3, version=1)
+    with pytest.raises(RuntimeError):
+        with StoreWriter.extending(path, version=2) as writer:
+            writer.append(np.ones((4, 4)), ["junk"] * 4, ["stress"] * 4)
+            raise RuntimeError("build failed")
+
+    with StoreWriter.extending(path, version=2) as writer:
+        writer.append(np.ones((1, 4)), ["kept"], ["stress"])
+        writer.commit()
+    assert list(load_store(path, verify=True).statements)[3:] == ["kept"]
+
+
+def test_only_the_newest_version_can_be_extended(tmp_path):
+    path = str(tmp_path / "vector_store")
+    _write(path, 3, version=1)
+    first = os.path.realpath(path)
+    with StoreWriter.extending(path, version=2) as writer:
+        writer.append(np.ones((2, 4)), ["new 0", "new 1"], ["stress", "stress"])
+        writer.commit()
+    second = os.path.realpath(path)
+
+    # Roll back to version 1: extending it would truncate the files version 2 shares
+    os.symlink(os.path.relpath(first, str(tmp_path)), path + ".tmp")
+    os.replace(path + ".tmp", path)
+    with pytest.raises(StoreFormatError):
+        StoreWriter.extending(path, version=3)
+    assert load_store(second, verify=True).header["count"] == 5
+
+
+def test_pruning_skips_versions_still_being_written(tmp_path):
+    path = str(tmp_path / "vector_store")
+    _write(path, 2, version=1)
+    with StoreWriter(path, 4, version=2) as pending:
+        pending.append(np.ones((1, 4)), ["pending"], ["stress"])
+        for version in range(3, 6):
+            _write(path, 2, version)
+        assert os.path.isdir(pending.tmp_path)
+        header = pending.commit()
+    assert header["count"] == 1
+    assert load_store(path, verify=True).header["version"] == 2
@@ -0,0 +1,73 @@
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from fake_services import FakeServer, create_fake_app, fake_embedding
+from vector_store import load_store
+
+BUILDER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend", "vector_store_builder.py")
+
+
+@pytest.fixture(scope="module")
+def embedding_url():
+    with FakeServer(create_fake_app(dimension=8)) as url:
+        yield f"{url}/v1beta"
+
+
+def _write_kb(path, records):
+    with open(path, "w") as f:
+        for category, statement in records:
+            f.write(json.dumps({"category": category, "statement": statement}) + "\n")
+
+
+def _build(workdir, embedding_url, *flags):
+    env = {
+        **os.environ,
+        "KNOWLEDGE_FILE": str(workdir / "kb.jsonl"),
+        "EMBEDDING_BASE_URL": embedding_url,
+        "EMBED_REQUESTS_PER_SECOND": "1000",
+        "GEMINI_API_KEY": "test-key",
+    }
+    result = subprocess.run([sys.executable, BUILDER, *flags], cwd=workdir, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return result.stdout
+
+
+def _rows(workdir):
+    store = load_store(str(workdir / "vector_store"), verify=True)
+    for row, (category, statement) in enumerate(zip(store.categories, store.statements)):
+        expected = np.asarray(fake_embedding(f"{category}: {statement}", 8))
+        assert np.allclose(store.embeddings[row], expected, atol=1e-6)
+    return list(zip(store.categories, store.statements))
+
+
+def test_delta_builds_append_and_compact_on_removal(tmp_path, embedding_url):
+    records = [("stress", f"statement {i}") for i in range(30)]
+    _write_kb(tmp_path / "kb.jsonl", records)
+    assert "compacted" in _build(tmp_path, embedding_url)
+    served = os.path.realpath(tmp_path / "vector_store")
+
+    records.append(("bipolar", "new statement"))
+    _write_kb(tmp_path / "kb.jsonl", records)
+    output = _build(tmp_path, embedding_url, "--delta")
+    assert "appended" in output and "ivf index extended" in output
+    assert _rows(tmp_path) == records
+    appended = os.path.realpath(tmp_path / "vector_store")
+    assert os.path.samefile(os.path.join(served, "embeddings.f32"), os.path.join(appended, "embeddings.f32"))
+
+    del records[3]
+    _write_kb(tmp_path / "kb.jsonl", records)
+    assert "compacted" in _build(tmp_path, embedding_url, "--delta")
+    assert _rows(tmp_path) == records
+
+
+def test_delta_build_over_an_empty_store(tmp_path, embedding_url):
+    _write_kb(tmp_path / "kb.jsonl", [])
+    _build(tmp_path, embedding_url)
+    _write_kb(tmp_path / "kb.jsonl", [("stress", "first statement")])
+    _build(tmp_path, embedding_url, "--delta")
+    assert _rows(tmp_path) == [("stress", "first statement")]